@@ -0,0 +1,95 @@
+"""Compare the file size and read/write speed of processed mzML written with
+different binary array codecs.
+
+The spectra of the test data files are deconvoluted once, then written and read
+back with each codec configuration. Configurations whose codecs are not available,
+like MS-Numpress without :mod:`pynumpress`, are skipped.
+
+Run with::
+
+    python benchmarks/mzml_compression.py [n_repeats]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import ms_deisotope
+from ms_deisotope.data_source.binary_codecs import pynumpress
+from ms_deisotope.output.mzml import (
+    MzMLScanSerializer, ProcessedMzMLDeserializer, NUMPRESS_COMPRESSION)
+from ms_deisotope.test.common import datafile
+
+
+configurations = [
+    ("none", "none", False),
+    ("zlib", "zlib", False),
+    ("numpress", {
+        "m/z array": "numpress-linear",
+        "intensity array": "numpress-slof",
+        "charge array": "none",
+        "deconvolution score array": "numpress-slof",
+    }, True),
+    ("numpress+zlib", NUMPRESS_COMPRESSION, True),
+]
+
+
+def deconvolute(path):
+    processor = ms_deisotope.ScanProcessor(
+        path, ms1_deconvolution_args={
+            "averagine": ms_deisotope.peptide,
+            "scorer": ms_deisotope.PenalizedMSDeconVFitter(20., 2.)},
+        msn_deconvolution_args={
+            "averagine": ms_deisotope.peptide,
+            "scorer": ms_deisotope.MSDeconVFitter(10.)})
+    return list(processor)
+
+
+def write(bunches, path, compression):
+    with open(path, 'wb') as handle:
+        writer = MzMLScanSerializer(
+            handle, n_spectra=sum(len(b.products) + 1 for b in bunches),
+            compression=compression, build_extra_index=False)
+        for bunch in bunches:
+            writer.save_scan_bunch(bunch)
+        writer.complete()
+
+
+def read(path):
+    reader = ProcessedMzMLDeserializer(path)
+    n = 0
+    for bunch in reader:
+        n += len(bunch.precursor.deconvoluted_peak_set)
+        for product in bunch.products:
+            n += len(product.deconvoluted_peak_set)
+    reader.close()
+    return n
+
+
+def timed(n, func, *args):
+    start = time.time()
+    for _ in range(n):
+        func(*args)
+    return (time.time() - start) / n
+
+
+def main(n=10):
+    bunches = deconvolute(datafile("three_test_scans.mzML"))
+    tempdir = tempfile.mkdtemp()
+    try:
+        print("%-14s %10s %10s %10s" % ("codec", "size (B)", "write (s)", "read (s)"))
+        for name, compression, needs_numpress in configurations:
+            if needs_numpress and pynumpress is None:
+                print("%-14s %32s" % (name, "skipped, pynumpress not installed"))
+                continue
+            path = os.path.join(tempdir, name + ".mzML")
+            write_time = timed(n, write, bunches, path, compression)
+            read_time = timed(n, read, path)
+            print("%-14s %10d %10.4f %10.4f" % (name, os.path.getsize(path), write_time, read_time))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
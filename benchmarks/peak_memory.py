@@ -0,0 +1,68 @@
+"""Measure the memory footprint of the pure-Python peak and precursor types.
+
+Each type is compared against a ``__dict__``-backed equivalent, which has the same
+per-instance layout these classes had before they were fully slotted.
+
+Run with::
+
+    python benchmarks/peak_memory.py [n_peaks]
+"""
+import sys
+import tracemalloc
+
+from ms_deisotope import peak_set
+from ms_deisotope.data_source.common import PrecursorInformation
+
+# Always measure the pure-Python implementations, even if the C extensions are built
+DeconvolutedPeak = peak_set._DeconvolutedPeak
+Envelope = peak_set._Envelope
+_Index = getattr(peak_set, "__Index")
+
+
+class DictDeconvolutedPeak(DeconvolutedPeak):
+    pass
+
+
+class DictPrecursorInformation(object):
+    def __init__(self, *args, **kwargs):
+        self.__dict__.update(zip(PrecursorInformation.__slots__, args))
+        self.__dict__.update(kwargs)
+
+
+def make_peak(cls, i):
+    mass = 1000. + i * 0.01
+    envelope = Envelope([(mass / 2. + k * 0.5, 100. / (k + 1)) for k in range(3)])
+    return cls(mass, 100., 2, 10., _Index(i, i), 0.01, 0.5, mass, mass, 50., envelope, 0)
+
+
+def make_precursor(cls, i):
+    return cls(500. + i, 100., 2, "scan=%d" % i, None, 998. + i, 2, 100., None, None, False, False,
+               "scan=%d" % (i + 1))
+
+
+def bytes_per_instance(factory, cls, n):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    instances = [factory(cls, i) for i in range(n)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    # exclude the list holding the instances
+    total -= sys.getsizeof(instances)
+    return total / float(n)
+
+
+def main(n=100000):
+    rows = [
+        ("DeconvolutedPeak", make_peak, DictDeconvolutedPeak, DeconvolutedPeak),
+        ("PrecursorInformation", make_precursor, DictPrecursorInformation, PrecursorInformation),
+    ]
+    print("%-22s %14s %14s" % ("type", "__dict__ B/obj", "slotted B/obj"))
+    for name, factory, before_cls, after_cls in rows:
+        before = bytes_per_instance(factory, before_cls, n)
+        after = bytes_per_instance(factory, after_cls, n)
+        print("%-22s %14.1f %14.1f" % (name, before, after))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -51,6 +51,9 @@ cdef class AveragineCache(object):
         public Averagine averagine
         public double cache_truncation
         public bint enabled
+        public size_t hits
+        public size_t misses
+        public double generation_time
     
     cdef TheoreticalIsotopicPattern has_mz_charge_pair(self, double mz, int charge=*, double charge_carrier=*, double truncate_after=*, double ignore_below=*)
     cpdef TheoreticalIsotopicPattern isotopic_cluster(self, double mz, int charge=*, double charge_carrier=*, double truncate_after=*, double ignore_below=*)
@@ -16,6 +16,8 @@ from brainpy._speedup cimport calculate_mass
 
 from ms_peak_picker._c.peak_set cimport FittedPeak
 
+from ms_deisotope.profiling import timer
+
 
 cdef double PROTON
 PROTON = _PROTON
@@ -437,6 +439,9 @@ cdef class AveragineCache(object):
             self.averagine = Averagine(averagine)
         self.cache_truncation = cache_truncation
         self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.generation_time = 0.0
 
     def __reduce__(self):
         return self.__class__, self.__getstate__()
@@ -458,6 +463,7 @@ cdef class AveragineCache(object):
             tuple cache_key
             PyObject* pvalue
             TheoreticalIsotopicPattern tid
+            double start
         if self.enabled:
             if self.cache_truncation == 0.0:
                 key_mz = mz
@@ -471,10 +477,14 @@ cdef class AveragineCache(object):
             cache_key = (key_mz, charge, charge_carrier, truncate_after)
             pvalue = PyDict_GetItem(self.backend, cache_key)
             if pvalue == NULL:
+                self.misses += 1
+                start = timer()
                 tid = self.averagine._isotopic_cluster(mz, charge, charge_carrier, truncate_after)
+                self.generation_time += timer() - start
                 PyDict_SetItem(self.backend, cache_key, tid.clone())
                 return tid
             else:
+                self.hits += 1
                 tid = <TheoreticalIsotopicPattern>pvalue
                 tid = tid.clone()
                 tid.shift(mz, True)
@@ -13,6 +13,7 @@ cdef class DeconvoluterBase(object):
         public bint use_subtraction
         public str scale_method
         public bint merge_isobaric_peaks
+        public double isobaric_merge_tolerance
         public double minimum_intensity
 
         public PeakIndex peaklist
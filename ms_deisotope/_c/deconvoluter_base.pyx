@@ -8,6 +8,7 @@ from ms_peak_picker._c.peak_set cimport PeakSet, FittedPeak
 from brainpy._c.isotopic_distribution cimport TheoreticalPeak
 
 from ms_deisotope.constants import ERROR_TOLERANCE as _ERROR_TOLERANCE
+from ms_deisotope.peak_set import merge_isobaric_peaks
 from ms_deisotope._c.scoring cimport IsotopicFitterBase, IsotopicFitRecord
 from ms_deisotope._c.averagine cimport (AveragineCache, isotopic_shift, PROTON,
                                         TheoreticalIsotopicPattern)
@@ -19,8 +20,6 @@ from cpython.long cimport PyLong_Check
 from cpython.dict cimport PyDict_GetItem, PyDict_SetItem
 from cpython.object cimport PyObject
 
-import operator
-
 
 cdef double ERROR_TOLERANCE = _ERROR_TOLERANCE
 
@@ -64,6 +63,7 @@ cdef class DeconvoluterBase(object):
         self.use_subtraction = use_subtraction
         self.scale_method = scale_method
         self.merge_isobaric_peaks = merge_isobaric_peaks
+        self.isobaric_merge_tolerance = 0.
         self.minimum_intensity = minimum_intensity
         self._slice_cache = {}
 
@@ -130,19 +130,7 @@ cdef class DeconvoluterBase(object):
                     match.intensity = 1.
 
     def _merge_peaks(self, peak_list):
-        peak_list = sorted(peak_list, key=operator.attrgetter("neutral_mass"))
-        if not peak_list:
-            return []
-        current_peak = peak_list[0]
-        merged_peaks = []
-        for peak in peak_list[1:]:
-            if current_peak.neutral_mass == peak.neutral_mass and current_peak.charge == peak.charge:
-                current_peak.intensity += peak.intensity
-            else:
-                merged_peaks.append(current_peak)
-                current_peak = peak
-        merged_peaks.append(current_peak)
-        return merged_peaks
+        return merge_isobaric_peaks(peak_list, self.isobaric_merge_tolerance)
 
     cpdef list _find_next_putative_peak(self, double mz, int charge, int step=1, double tolerance=2e-5):
         """
@@ -6,4 +6,5 @@ from ms_deisotope._c.peak_set cimport DeconvolutedPeakSetIndexed
 
 
 cpdef list decode_envelopes(np.ndarray[np.float32_t, ndim=1] array)
+cpdef list decode_compact_envelopes(np.ndarray array, np.ndarray mz_array)
 cpdef DeconvolutedPeakSetIndexed deserialize_deconvoluted_peak_set(dict scan_dict)
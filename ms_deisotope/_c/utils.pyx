@@ -2,6 +2,8 @@
 
 cimport cython
 from cpython.list cimport PyList_Append, PyList_GET_ITEM
+from cpython.tuple cimport PyTuple_New, PyTuple_SET_ITEM
+from cpython.ref cimport Py_INCREF
 
 from libc.math cimport sqrt, exp, pi
 
@@ -47,6 +49,44 @@ cpdef list decode_envelopes(np.ndarray[np.float32_t, ndim=1] array):
     return envelope_list
 
 
+@cython.boundscheck(False)
+cpdef list decode_compact_envelopes(np.ndarray array, np.ndarray mz_array):
+    cdef:
+        list envelope_list
+        tuple current_envelope_tuple
+        EnvelopePair pair
+        size_t i, j, n, start, total, member_offset
+        np.ndarray[np.float64_t, ndim=1] values, peak_mzs
+        np.ndarray[np.intp_t, ndim=1] counts
+        double scale, peak_mz
+        size_t count
+
+    envelope_list = []
+    if array.shape[0] == 0:
+        return envelope_list
+    values = array.astype(np.float64)
+    peak_mzs = mz_array.astype(np.float64)
+    n = <size_t>values[0]
+    counts = values[1:n + 1].astype(np.intp)
+    total = counts.sum()
+    start = 2 * n + 1
+    member_offset = 0
+    for i in range(n):
+        count = counts[i]
+        scale = values[n + 1 + i] / 65535.
+        peak_mz = peak_mzs[i]
+        current_envelope_tuple = PyTuple_New(count)
+        for j in range(count):
+            pair = EnvelopePair._create(
+                peak_mz + values[start + member_offset + j],
+                values[start + total + member_offset + j] * scale)
+            Py_INCREF(pair)
+            PyTuple_SET_ITEM(current_envelope_tuple, j, pair)
+        member_offset += count
+        PyList_Append(envelope_list, Envelope._create(current_envelope_tuple))
+    return envelope_list
+
+
 @cython.boundscheck(False)
 cpdef DeconvolutedPeakSetIndexed deserialize_deconvoluted_peak_set(dict scan_dict):
     cdef:
@@ -62,8 +102,12 @@ cpdef DeconvolutedPeakSetIndexed deserialize_deconvoluted_peak_set(dict scan_dic
         DeconvolutedPeakSetIndexed peak_set
 
     peaks = []
-    envelopes = decode_envelopes(scan_dict["isotopic envelopes array"])
     mz_array = scan_dict['m/z array'].astype(np.float32)
+    if "compact isotopic envelopes array" in scan_dict:
+        envelopes = decode_compact_envelopes(
+            scan_dict["compact isotopic envelopes array"], scan_dict['m/z array'])
+    else:
+        envelopes = decode_envelopes(scan_dict["isotopic envelopes array"])
     intensity_array = scan_dict['intensity array'].astype(np.float32)
     charge_array = scan_dict['charge array'].astype(np.int8)
     score_array = scan_dict['deconvolution score array'].astype(np.float32)
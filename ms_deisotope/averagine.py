@@ -8,6 +8,7 @@ from brainpy.composition import (
     SimpleComposition)
 
 from .utils import dict_proxy
+from .profiling import timer
 
 
 def shift_isotopic_pattern(mz, cluster):
@@ -235,6 +236,9 @@ class AveragineCache(object):
         self.backend = backend
         self.averagine = Averagine(averagine)
         self.cache_truncation = cache_truncation
+        self.hits = 0
+        self.misses = 0
+        self.generation_time = 0.0
 
     def has_mz_charge_pair(self, mz, charge=1, charge_carrier=PROTON, truncate_after=0.95, ignore_below=0.0):
         if self.cache_truncation == 0.0:
@@ -242,12 +246,16 @@ class AveragineCache(object):
         else:
             key_mz = round(mz / self.cache_truncation) * self.cache_truncation
         if (key_mz, charge, charge_carrier) in self.backend:
+            self.hits += 1
             # return shift_isotopic_pattern(
             #     mz, [p.clone() for p in self.backend[key_mz, charge, charge_carrier]])
             return self.backend[key_mz, charge, charge_carrier].clone().shift(mz)
         else:
+            self.misses += 1
+            start = timer()
             tid = self.averagine.isotopic_cluster(
                 mz, charge, charge_carrier, truncate_after, ignore_below)
+            self.generation_time += timer() - start
             self.backend[key_mz, charge, charge_carrier] = tid.clone()
             return tid
 
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from .data_source.common import AveragedScan
+from .signal_averaging import GridAverager, gaussian_time_weights
+
+
+class ScanAveragingWindow(object):
+    """A sliding window over the MS1 scans of a random access data source which
+    produces the same :class:`~.AveragedScan` as :meth:`Scan.average` with
+    ``index_interval``, while keeping the grid-aligned signal of the scans in the
+    window in a ring buffer.
+
+    When the window is advanced to the next MS1 scan, only the scan entering the
+    window has to be read, reprofiled and interpolated onto the :class:`~.GridAverager`
+    grid. The buffer holds at most ``2 * index_interval + 1`` scans, and entries which
+    have left the window are evicted.
+
+    Attributes
+    ----------
+    source : RandomAccessScanSource
+        The data source to read neighboring scans from
+    index_interval : int
+        The number of MS1 scans on either side of the reference scan to average
+    dx : float
+        The m/z spacing used to reprofile centroided scans and build the averaged
+        m/z axis
+    weight_sigma : float, optional
+        The standard deviation of the Gaussian scan time weights, as used by
+        :meth:`Scan.average`. If :const:`None`, scans are weighted equally.
+    averager : GridAverager
+        The averaging engine whose grid the buffered scans are aligned to
+    loaded_scans : int
+        The number of scans which have been read and reprofiled into the buffer
+    """
+
+    def __init__(self, source, index_interval, dx=0.01, weight_sigma=None):
+        self.source = source
+        self.index_interval = index_interval
+        self.dx = dx
+        self.weight_sigma = weight_sigma
+        self.averager = GridAverager(dx)
+        self.loaded_scans = 0
+        self._buffer = OrderedDict()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def __repr__(self):
+        return "%s(%r, %d, %d buffered)" % (
+            self.__class__.__name__, self.source, self.index_interval, len(self))
+
+    def clear(self):
+        self._buffer.clear()
+
+    def neighbor_indices(self, scan):
+        """Get the indices of the MS1 scans before and after `scan` in its window
+
+        Parameters
+        ----------
+        scan : Scan
+
+        Returns
+        -------
+        before : list of int
+        after : list of int
+        """
+        ms1_indices = self.source.ms_level_time_index.ms1_indices
+        i = np.searchsorted(ms1_indices, scan.index, 'left')
+        j = i + 1 if i < len(ms1_indices) and ms1_indices[i] == scan.index else i
+        before = ms1_indices[max(i - self.index_interval, 0):i]
+        after = ms1_indices[j:j + self.index_interval]
+        return [int(k) for k in before], [int(k) for k in after]
+
+    def _load(self, index, scan=None):
+        try:
+            return self._buffer[index]
+        except KeyError:
+            if scan is None:
+                scan = self.source.get_scan_by_index(index)
+            if scan.is_profile:
+                arrays = scan.arrays
+            else:
+                arrays = scan.reprofile(dx=self.dx).arrays
+            entry = self._buffer[index] = (scan.scan_time, self.averager.interpolate(*arrays))
+            self.loaded_scans += 1
+            return entry
+
+    def average(self, scan):
+        """Average `scan` with the MS1 scans around it
+
+        Parameters
+        ----------
+        scan : Scan
+            The MS1 scan at the center of the window
+
+        Returns
+        -------
+        AveragedScan
+        """
+        before, after = self.neighbor_indices(scan)
+        indices = before + [scan.index] + after
+        entries = []
+        for index in indices:
+            if index == scan.index:
+                entries.append(self._load(index, scan))
+            else:
+                entries.append(self._load(index))
+        window = set(indices)
+        for index in list(self._buffer):
+            if index not in window:
+                self._buffer.pop(index)
+        if self.weight_sigma:
+            weight_sigma = self.weight_sigma
+            if weight_sigma == 1:
+                weight_sigma = 0.025
+            weights = gaussian_time_weights(
+                [time for time, _ in entries], scan.scan_time, weight_sigma)
+        else:
+            weights = None
+        new_arrays = self.averager.average_signals(
+            [signal for _, signal in entries], weights)
+        return AveragedScan(
+            scan._data, scan.source, new_arrays,
+            indices, list(scan.product_scans), is_profile=True)
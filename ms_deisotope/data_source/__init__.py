@@ -2,21 +2,28 @@ from .infer_type import MSFileLoader
 from .mzml import MzMLLoader
 from .mzxml import MzXMLLoader
 from .mgf import MGFLoader
+from .spectrum_store import SpectrumStoreLoader, convert_to_spectrum_store
+from .prefetch import ScanPrefetcher
+from .scan_cache import ScanCache, WeakScanCache, LRUScanCache, make_scan_cache
+from .scan_metadata import ScanMetadataTableBuilder, scan_metadata_dtype
 from .common import (
     Scan, ActivationInformation,
     PrecursorInformation, ProcessedScan,
     IsolationWindow, dissociation_methods,
     ScanAcquisitionInformation, ScanEventInformation,
     ScanDataSource, ScanIterator, ScanBunch,
-    ScanWindow, RandomAccessScanSource)
+    ScanWindow, RandomAccessScanSource, MSLevelTimeIndex)
 
 __all__ = [
     "MSFileLoader", "MzMLLoader",
-    "MzXMLLoader", "MGFLoader",
+    "MzXMLLoader", "MGFLoader", "ScanPrefetcher",
+    "SpectrumStoreLoader", "convert_to_spectrum_store",
+    "ScanCache", "WeakScanCache", "LRUScanCache", "make_scan_cache",
+    "ScanMetadataTableBuilder", "scan_metadata_dtype",
     "Scan", "ActivationInformation",
     "PrecursorInformation", "ProcessedScan",
     "IsolationWindow", "dissociation_methods",
     "ScanAcquisitionInformation", "ScanEventInformation",
     "ScanDataSource", "ScanIterator", "ScanBunch",
-    "ScanWindow", "RandomAccessScanSource"
+    "ScanWindow", "RandomAccessScanSource", "MSLevelTimeIndex"
 ]
@@ -0,0 +1,209 @@
+"""Encoding and decoding of mzML binary data arrays with any of the compression
+schemes the PSI-MS controlled vocabulary defines for them.
+
+Each codec is named by its controlled vocabulary term, like ``"zlib compression"``,
+and may also be referred to by a short alias, like ``"zlib"`` or
+``"numpress-linear"``. The MS-Numpress codecs require :mod:`pynumpress`.
+"""
+import base64
+import zlib
+
+import numpy as np
+
+from ..utils import basestring
+
+try:
+    import pynumpress
+except ImportError:
+    pynumpress = None
+
+
+NO_COMPRESSION = "no compression"
+ZLIB_COMPRESSION = "zlib compression"
+NUMPRESS_LINEAR = "MS-Numpress linear prediction compression"
+NUMPRESS_PIC = "MS-Numpress positive integer compression"
+NUMPRESS_SLOF = "MS-Numpress short logged float compression"
+NUMPRESS_LINEAR_ZLIB = "MS-Numpress linear prediction compression followed by zlib compression"
+NUMPRESS_PIC_ZLIB = "MS-Numpress positive integer compression followed by zlib compression"
+NUMPRESS_SLOF_ZLIB = "MS-Numpress short logged float compression followed by zlib compression"
+
+
+#: Maps each codec to the MS-Numpress scheme it applies, if any, and whether
+#: it applies zlib compression
+_codecs = {
+    NO_COMPRESSION: (None, False),
+    ZLIB_COMPRESSION: (None, True),
+    NUMPRESS_LINEAR: ("linear", False),
+    NUMPRESS_PIC: ("pic", False),
+    NUMPRESS_SLOF: ("slof", False),
+    NUMPRESS_LINEAR_ZLIB: ("linear", True),
+    NUMPRESS_PIC_ZLIB: ("pic", True),
+    NUMPRESS_SLOF_ZLIB: ("slof", True),
+}
+
+
+_aliases = {
+    None: NO_COMPRESSION,
+    False: NO_COMPRESSION,
+    True: ZLIB_COMPRESSION,
+    "none": NO_COMPRESSION,
+    "zlib": ZLIB_COMPRESSION,
+    "numpress-linear": NUMPRESS_LINEAR,
+    "numpress-pic": NUMPRESS_PIC,
+    "numpress-slof": NUMPRESS_SLOF,
+    "numpress-linear+zlib": NUMPRESS_LINEAR_ZLIB,
+    "numpress-pic+zlib": NUMPRESS_PIC_ZLIB,
+    "numpress-slof+zlib": NUMPRESS_SLOF_ZLIB,
+}
+
+
+def resolve_codec(compression):
+    """Find the controlled vocabulary name of the codec `compression` refers to
+
+    Parameters
+    ----------
+    compression : str, bool or None
+        A codec name or alias
+
+    Returns
+    -------
+    str
+
+    Raises
+    ------
+    ValueError
+        If `compression` does not name a known codec
+    """
+    if compression in _codecs:
+        return compression
+    try:
+        return _aliases[compression]
+    except (KeyError, TypeError):
+        raise ValueError("Unknown compression: %r" % (compression,))
+
+
+def is_numpress(compression):
+    return _codecs[resolve_codec(compression)][0] is not None
+
+
+def codec_dtype(compression, dtype):
+    """The type an array is stored as when encoded with `compression`.
+    MS-Numpress always encodes and decodes 64-bit floats.
+
+    Parameters
+    ----------
+    compression : str
+    dtype : type
+
+    Returns
+    -------
+    type
+    """
+    if is_numpress(compression):
+        return np.float64
+    return dtype
+
+
+def _require_numpress(compression):
+    if pynumpress is None:
+        raise ImportError("pynumpress is required for %s" % (compression,))
+
+
+def encode_array(array, compression=ZLIB_COMPRESSION, dtype=np.float32):
+    """Encode `array` with `compression` and base64 encode the result
+
+    Parameters
+    ----------
+    array : np.ndarray
+    compression : str
+        A codec name or alias
+    dtype : type
+        The type to store the values as, ignored for MS-Numpress codecs
+
+    Returns
+    -------
+    bytes
+    """
+    compression = resolve_codec(compression)
+    numpress, use_zlib = _codecs[compression]
+    if numpress is None:
+        bytestring = np.asarray(array, dtype=dtype).tobytes()
+    else:
+        _require_numpress(compression)
+        array = np.asarray(array, dtype=np.float64)
+        if numpress == "linear":
+            encoded = pynumpress.encode_linear(array, pynumpress.optimal_linear_fixed_point(array))
+        elif numpress == "slof":
+            encoded = pynumpress.encode_slof(array, pynumpress.optimal_slof_fixed_point(array))
+        else:
+            encoded = pynumpress.encode_pic(array)
+        bytestring = np.asarray(encoded, dtype=np.uint8).tobytes()
+    if use_zlib:
+        bytestring = zlib.compress(bytestring)
+    return base64.standard_b64encode(bytestring)
+
+
+def decode_array(encoded, compression=ZLIB_COMPRESSION, dtype=np.float32):
+    """Decode an array encoded by :func:`encode_array`, or read from the
+    ``<binary>`` element of an mzML file
+
+    Parameters
+    ----------
+    encoded : str or bytes
+        The base64 encoded data
+    compression : str
+        A codec name or alias
+    dtype : type
+        The type the values are stored as, ignored for MS-Numpress codecs
+
+    Returns
+    -------
+    np.ndarray
+    """
+    compression = resolve_codec(compression)
+    numpress, use_zlib = _codecs[compression]
+    if not isinstance(encoded, bytes):
+        encoded = encoded.encode('ascii')
+    bytestring = base64.standard_b64decode(encoded)
+    if use_zlib:
+        bytestring = zlib.decompress(bytestring)
+    if numpress is None:
+        return np.frombuffer(bytestring, dtype=dtype).copy()
+    _require_numpress(compression)
+    data = np.frombuffer(bytestring, dtype=np.uint8)
+    if numpress == "linear":
+        return np.asarray(pynumpress.decode_linear(data), dtype=np.float64)
+    elif numpress == "slof":
+        return np.asarray(pynumpress.decode_slof(data), dtype=np.float64)
+    return np.asarray(pynumpress.decode_pic(data), dtype=np.float64)
+
+
+def pop_codec(info):
+    """Remove the compression term from the flattened parameters of a
+    ``<binaryDataArray>`` and return the codec it names.
+
+    Parameters
+    ----------
+    info : dict
+        The parameters of the data array, as flattened by the XML parser. Terms
+        without values are stored either as keys or in a list under ``"name"``.
+
+    Returns
+    -------
+    str
+    """
+    names = info.get('name')
+    if isinstance(names, basestring):
+        names = [names]
+        info['name'] = names
+    for codec in _codecs:
+        if codec in info:
+            del info[codec]
+            return codec
+        if names and codec in names:
+            names.remove(codec)
+            if not names:
+                del info['name']
+            return codec
+    return NO_COMPRESSION
+
@@ -1,17 +1,22 @@
 import abc
+import os
 import warnings
 from collections import namedtuple
 
 import numpy as np
 
 from ms_peak_picker import (
-    pick_peaks, reprofile, average_signal, scan_filter)
+    pick_peaks, reprofile, scan_filter)
 from ms_peak_picker import PeakIndex
 from ..averagine import neutral_mass, mass_charge_ratio
-from ..utils import Constant, add_metaclass
+from ..signal_averaging import average_signal, gaussian_time_weights
+from ..utils import Constant, add_metaclass, basestring
 from ..deconvolution import deconvolute_peaks
 
 from .instrument_components import Component, component, all_components
+from .scan_cache import make_scan_cache
+from .scan_metadata import (
+    ScanMetadataTableBuilder, load_scan_metadata_table, save_scan_metadata_table)
 
 try:
     from ..utils import draw_raw, draw_peaklist, annotate_scan as _annotate_precursors
@@ -24,9 +29,9 @@ class ScanBunch(namedtuple("ScanBunch", ["precursor", "products"])):
 
     def __new__(cls, *args, **kwargs):
         inst = super(ScanBunch, cls).__new__(cls, *args, **kwargs)
-        inst._id_map = {
-            inst.precursor.id: inst.precursor
-        }
+        inst._id_map = {}
+        if inst.precursor is not None:
+            inst._id_map[inst.precursor.id] = inst.precursor
         for scan in inst.products:
             inst._id_map[scan.id] = scan
         return inst
@@ -292,6 +297,15 @@ class ScanIterator(ScanDataSource):
     def _make_scan(self, data):
         return Scan(data, self)
 
+    def _initialize_scan_cache(self, policy=None):
+        self._scan_cache = make_scan_cache(policy)
+
+    @property
+    def scan_cache(self):
+        """The cache holding recently read scans, see :func:`~.make_scan_cache`
+        """
+        return self._scan_cache
+
     def __next__(self):
         return self.next()
 
@@ -349,23 +363,128 @@ class ScanIterator(ScanDataSource):
                     current_level = packed.ms_level.ms_level
                 product_scans.append(packed)
             elif packed.ms_level == 1:
-                if current_level > 1:
+                if precursor_scan is not None:
                     precursor_scan.product_scans = list(product_scans)
                     yield ScanBunch(precursor_scan, product_scans)
-                else:
-                    if precursor_scan is not None:
-                        precursor_scan.product_scans = list(product_scans)
-                        yield ScanBunch(precursor_scan, product_scans)
+                elif product_scans:
+                    # MSn scans read before the first MS1 scan
+                    yield ScanBunch(None, product_scans)
                 precursor_scan = packed
                 product_scans = []
             else:
                 raise ValueError("Could not interpret MS Level %r" % (packed.ms_level,))
         if precursor_scan is not None:
             yield ScanBunch(precursor_scan, product_scans)
+        elif product_scans:
+            yield ScanBunch(None, product_scans)
+
+
+class MSLevelTimeIndex(object):
+    """Parallel arrays holding the MS level and scan time of every scan in a
+    data source, in scan index order, used to locate MS1 scans and time points
+    without parsing the scans in between.
+
+    Entries which are not scans, such as chromatograms in an mzML file's offset
+    index, have an MS level of 0.
+
+    Attributes
+    ----------
+    ms_levels : np.ndarray
+        The MS level of each scan
+    scan_times : np.ndarray
+        The scan time of each scan in minutes
+    ms1_indices : np.ndarray
+        The indices of each MS1 scan, in ascending order
+    scan_indices : np.ndarray
+        The indices of every entry which is a scan, in ascending order
+    """
+
+    def __init__(self, ms_levels, scan_times):
+        self.ms_levels = np.asarray(ms_levels, dtype=np.int16)
+        self.scan_times = np.asarray(scan_times, dtype=np.float64)
+        self.ms1_indices = np.flatnonzero(self.ms_levels == 1)
+        self.scan_indices = np.flatnonzero(self.ms_levels > 0)
+
+    def __len__(self):
+        return len(self.ms_levels)
+
+    def __repr__(self):
+        return "%s(%d scans, %d MS1 scans)" % (
+            self.__class__.__name__, len(self.scan_indices), len(self.ms1_indices))
+
+    def find_previous_ms1(self, index):
+        """Find the index of the closest MS1 scan before `index`
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        int or None
+        """
+        i = np.searchsorted(self.ms1_indices, index, 'left') - 1
+        if i < 0:
+            return None
+        return int(self.ms1_indices[i])
+
+    def find_next_ms1(self, index):
+        """Find the index of the closest MS1 scan after `index`
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        int or None
+        """
+        i = np.searchsorted(self.ms1_indices, index, 'right')
+        if i >= len(self.ms1_indices):
+            return None
+        return int(self.ms1_indices[i])
+
+    def find_time(self, time):
+        """Find the index of the scan whose time is closest to `time`
+
+        Parameters
+        ----------
+        time : float
+
+        Returns
+        -------
+        int
+        """
+        times = self.scan_times[self.scan_indices]
+        n = len(times)
+        i = np.searchsorted(times, time)
+        if i >= n:
+            i = n - 1
+        elif i > 0 and abs(times[i - 1] - time) < abs(times[i] - time):
+            i -= 1
+        return int(self.scan_indices[i])
+
+    def ms1_between_times(self, start, end):
+        """Get the indices of the MS1 scans acquired between `start` and `end`,
+        inclusive
+
+        Parameters
+        ----------
+        start : float
+        end : float
+
+        Returns
+        -------
+        np.ndarray
+        """
+        times = self.scan_times[self.ms1_indices]
+        return self.ms1_indices[(times >= start) & (times <= end)]
 
 
 @add_metaclass(abc.ABCMeta)
 class RandomAccessScanSource(ScanDataSource):
+    _ms_level_time_index = None
+    _scan_metadata_table = None
 
     @abc.abstractmethod
     def get_scan_by_id(self, scan_id):
@@ -383,44 +502,133 @@ class RandomAccessScanSource(ScanDataSource):
     def start_from_scan(self, scan_id=None, rt=None, index=None, require_ms1=True, grouped=True):
         raise NotImplementedError()
 
+    @property
+    def ms_level_time_index(self):
+        """The :class:`MSLevelTimeIndex` of this data source, built on first use
+        by :meth:`_build_ms_level_time_index`.
+
+        Returns
+        -------
+        MSLevelTimeIndex
+        """
+        if self._ms_level_time_index is None:
+            if self._scan_metadata_table is not None:
+                table = self._scan_metadata_table
+                self._ms_level_time_index = MSLevelTimeIndex(table['ms_level'], table['scan_time'])
+            else:
+                self._ms_level_time_index = self._build_ms_level_time_index()
+        return self._ms_level_time_index
+
+    def scan_metadata_table(self, cache=True):
+        """Build a columnar table of the metadata of every scan in :attr:`index`,
+        including its scan time, MS level, polarity, total ion current, base peak,
+        precursor m/z and charge, isolation window and activation energy.
+
+        The table is a NumPy structured array whose columns are described by
+        :func:`~.scan_metadata_dtype`. It is built on first use by
+        :meth:`_build_scan_metadata_table`, which data sources override to read
+        these values without constructing every scan where they can. When `cache`
+        is :const:`True`, the table is saved alongside the source file and reused
+        until the source file changes.
+
+        Parameters
+        ----------
+        cache : bool
+            Whether to read and write the table saved alongside the source file
+
+        Returns
+        -------
+        np.ndarray
+        """
+        if self._scan_metadata_table is not None:
+            return self._scan_metadata_table
+        source_file = getattr(self, "source_file", None)
+        can_cache = cache and isinstance(source_file, basestring) and os.path.exists(source_file)
+        table = None
+        if can_cache:
+            table = load_scan_metadata_table(source_file)
+        if table is None:
+            table = self._build_scan_metadata_table()
+            if can_cache:
+                try:
+                    save_scan_metadata_table(table, source_file)
+                except (IOError, OSError):
+                    pass
+        self._scan_metadata_table = table
+        return table
+
+    def _build_scan_metadata_table(self):
+        """Collect the metadata of every scan in :attr:`index` for
+        :meth:`scan_metadata_table`.
+
+        This default implementation loads each scan and its signal arrays once.
+        There is one row per entry of :attr:`index`, in order, so that
+        :attr:`ms_level_time_index` can be built from the table.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        builder = ScanMetadataTableBuilder()
+        for i, scan_id in enumerate(self.index):
+            try:
+                builder.add_scan(self.get_scan_by_index(i))
+            except (IndexError, KeyError):
+                if isinstance(scan_id, bytes):
+                    scan_id = scan_id.decode('utf-8')
+                builder.add_missing(scan_id, i)
+        return builder.build()
+
+    def _build_ms_level_time_index(self):
+        """Collect the MS level and scan time of every scan in :attr:`index`.
+
+        This default implementation loads each scan once. Data sources which
+        can read these values without constructing the whole scan should
+        override it.
+
+        Returns
+        -------
+        MSLevelTimeIndex
+        """
+        ms_levels = []
+        scan_times = []
+        for i in range(len(self.index)):
+            try:
+                scan = self.get_scan_by_index(i)
+                ms_levels.append(scan.ms_level)
+                scan_times.append(scan.scan_time)
+            except (IndexError, KeyError):
+                ms_levels.append(0)
+                scan_times.append(np.nan)
+        return MSLevelTimeIndex(ms_levels, scan_times)
+
     def _locate_ms1_scan(self, scan):
-        while scan.ms_level != 1:
-            if scan.index <= 0:
-                break
-            scan = self.get_scan_by_index(scan.index - 1)
         if scan.ms_level == 1:
             return scan
-        while scan.ms_level != 1:
-            try:
-                scan = self.get_scan_by_index(scan.index + 1)
-            except IndexError:
-                raise IndexError("Cannot locate MS1 Scan")
-        return scan
+        index = self.ms_level_time_index.find_previous_ms1(scan.index)
+        if index is None:
+            index = self.ms_level_time_index.find_next_ms1(scan.index)
+        if index is None:
+            raise IndexError("Cannot locate MS1 Scan")
+        return self.get_scan_by_index(index)
 
     def find_previous_ms1(self, start_index):
-        index = start_index - 1
-        while index >= 0:
-            try:
-                scan = self.get_scan_by_index(index)
-                if scan.ms_level == 1:
-                    return scan
-                index -= 1
-            except (IndexError, KeyError):
-                return None
-        return None
+        index = self.ms_level_time_index.find_previous_ms1(start_index)
+        if index is None:
+            return None
+        try:
+            return self.get_scan_by_index(index)
+        except (IndexError, KeyError):
+            return None
 
     def find_next_ms1(self, start_index):
-        index = start_index + 1
-        n = len(self.index)
-        while index < n:
-            try:
-                scan = self.get_scan_by_index(index)
-                if scan.ms_level == 1:
-                    return scan
-                index += 1
-            except (IndexError, KeyError):
-                return None
-        return None
+        index = self.ms_level_time_index.find_next_ms1(start_index)
+        if index is None:
+            return None
+        try:
+            return self.get_scan_by_index(index)
+        except (IndexError, KeyError):
+            return None
 
 
 class DetachedAccessError(Exception):
@@ -854,10 +1062,7 @@ class Scan(object):
         return before, after
 
     def _compute_smoothing_weights(self, scans, mean, sigma=0.025):
-        sigma_sqrd_2 = (2 * sigma ** 2)
-        time_array = np.array([s.scan_time for s in scans])
-        weights = np.exp((-(time_array - mean) ** 2) / sigma_sqrd_2)
-        return weights
+        return gaussian_time_weights([s.scan_time for s in scans], mean, sigma)
 
     def average(self, index_interval=None, rt_interval=None, dx=0.01, weight_sigma=None):
         before, after = self._get_adjacent_scans(index_interval, rt_interval)
@@ -978,6 +1183,10 @@ class PrecursorInformation(object):
         Any object implementing the `ScanIteratorBase` interface to be used to look up
         the precursor scan with `precursor_scan_id`
     """
+    __slots__ = ["mz", "intensity", "charge", "precursor_scan_id", "source",
+                 "extracted_neutral_mass", "extracted_charge", "extracted_intensity",
+                 "peak", "extracted_peak", "defaulted", "orphan", "product_scan_id"]
+
     def __init__(self, mz, intensity, charge, precursor_scan_id=None, source=None,
                  extracted_neutral_mass=0, extracted_charge=0, extracted_intensity=0,
                  peak=None, extracted_peak=None, defaulted=False, orphan=False,
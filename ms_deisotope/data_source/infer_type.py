@@ -2,9 +2,10 @@ import os
 from .mzml import MzMLLoader
 from .mzxml import MzXMLLoader
 from .mgf import MGFLoader
+from .spectrum_store import SpectrumStoreLoader, is_spectrum_store
 
 guessers = []
-reader_types = [MzMLLoader, MzXMLLoader]
+reader_types = [MzMLLoader, MzXMLLoader, SpectrumStoreLoader]
 
 
 def register_type_guesser(reader_guesser):
@@ -49,6 +50,8 @@ def guess_type_from_path(file_path):
         return MzXMLLoader
     elif ext == '.mgf':
         return MGFLoader
+    elif ext == '.msds':
+        return SpectrumStoreLoader
     else:
         raise ValueError("Cannot determine ScanLoader type from file path")
 
@@ -63,6 +66,8 @@ def guess_type_from_file_sniffing(file_path):
             return MzXMLLoader
         elif b"BEGIN IONS" in header:
             return MGFLoader
+        elif is_spectrum_store(file_path):
+            return SpectrumStoreLoader
         else:
             raise ValueError("Cannot determine ScanLoader type from header")
 
@@ -1,14 +1,16 @@
+import os
 import re
-from weakref import WeakValueDictionary
-from collections import OrderedDict
+import json
 import codecs
+import multiprocessing
+from collections import OrderedDict
 
-from pyteomics import mgf
 import numpy as np
 
 from .common import (
     Scan, RandomAccessScanSource, PrecursorInformation,
-    ScanDataSource, ScanIterator, ChargeNotProvided)
+    ScanDataSource, ScanIterator, ChargeNotProvided,
+    ScanBunch, MSLevelTimeIndex)
 
 
 class MGFInterface(ScanDataSource):
@@ -177,30 +179,284 @@ def index_mgf(path, encoding='latin-1', read_size=1000000):
         match = pattern.search(chunk)
         if match:
             title = match.group(1)
-            index[title.decode(encoding)] = i
+            index[title.decode(encoding).strip()] = i
         i += len(chunk)
     return index
 
 
-class MGFLoader(MGFInterface, ScanIterator):
+def save_mgf_index(index, fp):
+    """Write the title to byte offset index of an MGF file to `fp`
+    as JSON.
+
+    Parameters
+    ----------
+    index : OrderedDict
+        The byte offset index to be saved
+    fp : file
+        The file to write the index to
+
+    Returns
+    -------
+    file
+    """
+    json.dump(list(index.items()), fp)
+    return fp
+
+
+def load_mgf_index(fp):
+    """Read a title to byte offset index written by :func:`save_mgf_index`
+
+    Parameters
+    ----------
+    fp : file
+        The file to read the index from
+
+    Returns
+    -------
+    OrderedDict
+    """
+    data = json.load(fp)
+    index = OrderedDict()
+    for key, value in sorted(data, key=lambda x: x[1]):
+        index[key] = value
+    return index
+
+
+def _decode_mgf_bytes(buff, encoding):
+    return _remove_bom(buff).decode(encoding)
 
-    def __init__(self, source_file, encoding='latin-1'):
+
+_mgf_param_pattern = re.compile(r"^[ \t]*([A-Za-z][^=\r\n]*)=([^\r\n]*)", re.MULTILINE)
+_mgf_peak_start_pattern = re.compile(r"(?:^|\n)[ \t]*[-+.0-9]")
+_mgf_comment_characters = "#;!/"
+_mgf_charge_pattern = re.compile(r"(\d+)\s*([+-]?)")
+
+
+def _parse_charge_list(text):
+    charges = []
+    for magnitude, sign in _mgf_charge_pattern.findall(text):
+        charge = int(magnitude)
+        if sign == '-':
+            charge = -charge
+        charges.append(charge)
+    return charges
+
+
+def parse_mgf_params(text):
+    """Parse the ``KEY=value`` lines in a block of MGF text into a :class:`dict`
+    with lowercase keys, converting the ``pepmass`` and ``charge`` parameters.
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    dict
+    """
+    params = {}
+    for key, value in _mgf_param_pattern.findall(text):
+        params[key.strip().lower()] = value.strip()
+    if 'pepmass' in params:
+        try:
+            pepmass = tuple(map(float, params['pepmass'].split()))
+        except ValueError:
+            raise ValueError("Could not parse PEPMASS = %s" % (params['pepmass'],))
+        params['pepmass'] = (pepmass + (None, None))[:2]
+    if 'charge' in params:
+        params['charge'] = _parse_charge_list(params['charge'])
+    return params
+
+
+def _parse_peak_list(text):
+    text = text.strip()
+    if not text:
+        return np.array([]), np.array([])
+    n_peaks = text.count('\n') + 1
+    first_line = text[:text.find('\n')] if n_peaks > 1 else text
+    values = None
+    if len(first_line.split()) == 2:
+        try:
+            values = np.fromstring(text, sep=' ')
+        except ValueError:
+            values = None
+    if values is None or values.size != n_peaks * 2:
+        # Lines with more than two columns, like fragment charges, blank lines and
+        # comments are handled one line at a time, keeping the first two columns
+        rows = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line[0] in _mgf_comment_characters:
+                continue
+            rows.append(line.split()[:2])
+        values = np.array(rows, dtype=float).reshape((-1, 2))
+    else:
+        values = values.reshape((n_peaks, 2))
+    return values[:, 0].copy(), values[:, 1].copy()
+
+
+def _split_mgf_block(block):
+    # Parameters normally precede the peak list, which starts at the first line
+    # beginning with a number
+    match = _mgf_peak_start_pattern.search(block)
+    if match is None:
+        return block, ''
+    params, peaks = block[:match.start()], block[match.start():]
+    if '=' in peaks:
+        # Parameters interleaved with peaks
+        params = params + '\n' + '\n'.join(
+            key + '=' + value for key, value in _mgf_param_pattern.findall(peaks))
+        peaks = _mgf_param_pattern.sub('', peaks)
+    return params, peaks
+
+
+def parse_mgf_spectra(text, header=None):
+    """Parse the spectra in a block of MGF text.
+
+    Each spectrum's parameters are extracted with precompiled regular expressions,
+    and its peak list is converted to arrays in bulk with :func:`numpy.fromstring`,
+    rather than one value at a time. The spectra have the same layout as those produced
+    by :func:`pyteomics.mgf.read` with ``read_charges=False``.
+
+    Parameters
+    ----------
+    text : str
+        The text of one or more ``BEGIN IONS``/``END IONS`` blocks
+    header : dict, optional
+        The file-level parameters, which are overridden by each spectrum's own
+
+    Returns
+    -------
+    list of dict
+    """
+    spectra = []
+    position = 0
+    while True:
+        start = text.find("BEGIN IONS", position)
+        if start == -1:
+            break
+        start += 10
+        end = text.find("END IONS", start)
+        if end == -1:
+            break
+        position = end + 8
+        block = text[start:end]
+        params = dict(header) if header else {}
+        param_text, peak_text = _split_mgf_block(block)
+        params.update(parse_mgf_params(param_text))
+        mz_array, intensity_array = _parse_peak_list(peak_text)
+        spectra.append({
+            "params": params,
+            "m/z array": mz_array,
+            "intensity array": intensity_array
+        })
+    return spectra
+
+
+def parse_mgf_header(text):
+    """Parse the file-level parameters preceding the first spectrum of an MGF file
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    dict
+    """
+    end = text.find("BEGIN IONS")
+    if end != -1:
+        text = text[:end]
+    return parse_mgf_params(text)
+
+
+def _parse_mgf_range(payload):
+    path, encoding, header, start, end = payload
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        buff = fh.read(end - start) if end is not None else fh.read()
+    return parse_mgf_spectra(_decode_mgf_bytes(buff, encoding), header)
+
+
+class MGFLoader(MGFInterface, ScanIterator, RandomAccessScanSource):
+    """Reads scans from Mascot Generic Format files. Provides both iterative and
+    random access, using the byte offset of each spectrum built by :func:`index_mgf`.
+
+    Attributes
+    ----------
+    source_file: str
+        Path to file to read from.
+    source: str
+        Path to file to read from.
+    encoding: str
+        The text encoding of the file
+    header: dict
+        The file-level parameters shared by every spectrum
+    scan_cache: ScanCache
+        The cache policy for scans read from this file, as interpreted by
+        :func:`~.make_scan_cache`. Defaults to weak references only.
+    """
+
+    def __init__(self, source_file, encoding='latin-1', scan_cache=None, use_index=True):
         self.source_file = source_file
-        self._index = index_mgf(source_file, encoding=encoding)
-        self._source = mgf.read(source_file, read_charges=False, convert_arrays=1, encoding=encoding)
-        self._scan_cache = WeakValueDictionary()
+        self.encoding = encoding
+        self._use_index = use_index
+        self._index = self._load_index()
+        self._offsets = np.array(list(self._index.values()), dtype=np.int64)
+        self._titles = list(self._index)
+        self._title_to_index = {title: i for i, title in enumerate(self._titles)}
+        self.header = self._read_header()
+        self._handle = None
+        self._initialize_scan_cache(scan_cache)
         self.make_iterator()
 
+    @property
+    def _index_file_name(self):
+        return os.path.splitext(self.source_file)[0] + '-byte-offsets.json'
+
+    def _load_index(self):
+        if self._use_index and os.path.exists(self._index_file_name):
+            try:
+                with open(self._index_file_name, 'r') as fh:
+                    return load_mgf_index(fh)
+            except (IOError, ValueError):
+                pass
+        return index_mgf(self.source_file, encoding=self.encoding)
+
+    def write_index_file(self):
+        """Save the byte offset index alongside the source file so later readers
+        of the same file can skip scanning it
+        """
+        with open(self._index_file_name, 'w') as fh:
+            save_mgf_index(self._index, fh)
+
+    @classmethod
+    def prebuild_byte_offset_file(cls, path, encoding='latin-1'):
+        cls(path, encoding=encoding, use_index=False).write_index_file()
+
+    def _read_header(self):
+        text = _decode_mgf_bytes(next(chunk_mgf(self.source_file, self.encoding)), self.encoding)
+        return parse_mgf_header(text)
+
     @property
     def source(self):
-        return self._source
+        return self.source_file
 
     @property
     def index(self):
         return self._index
 
+    def __reduce__(self):
+        return self.__class__, (self.source_file, self.encoding)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.source_file)
+
     def close(self):
-        self._source.close()
+        self._close_producer()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
 
     def reset(self):
         """Reset the object, clearing out any existing
@@ -210,23 +466,218 @@ class MGFLoader(MGFInterface, ScanIterator):
         calls :meth:`make_iterator`, and clears the scan
         cache.
         """
-        self._source.reset()
-        try:
-            self.source.seek(0)
-        except (IOError, AttributeError):
-            pass
         self.make_iterator(None)
-        self._scan_cache = WeakValueDictionary()
+        self._scan_cache.clear()
+
+    def _iter_spectra(self):
+        for chunk in chunk_mgf(self.source_file, self.encoding):
+            for spectrum in parse_mgf_spectra(_decode_mgf_bytes(chunk, self.encoding), self.header):
+                yield spectrum
 
     def _make_default_iterator(self):
-        return iter(self._source)
+        return self._iter_spectra()
 
-    def make_iterator(self, iterator=None, grouped=True):
-        self.iteration_mode = 'single'
-        self._producer = self._single_scan_iterator(iterator)
+    def _close_producer(self):
+        producer = getattr(self, "_producer", None)
+        if producer is not None:
+            producer.close()
+
+    def make_iterator(self, iterator=None, grouped=False):
+        """Configure the iterator's behavior.
+
+        MGF files contain no MS1 scans, so when `grouped` is :const:`True`, each scan
+        is yielded as a :class:`~.ScanBunch` with no precursor and the scan as its
+        only product.
+
+        Parameters
+        ----------
+        iterator : Iterator, optional
+            The iterator to manipulate. If missing, the default iterator will be used.
+        grouped : bool, optional
+            Whether the iterator should be grouped and produce :class:`.ScanBunch` objects
+            or single :class:`.Scan`. Defaults to :const:`False`
+        """
+        self._close_producer()
+        if grouped:
+            self.iteration_mode = 'group'
+            self._producer = self._bunch_iterator(iterator)
+        else:
+            self.iteration_mode = 'single'
+            self._producer = self._single_scan_iterator(iterator)
+
+    def _bunch_iterator(self, iterator=None):
+        for scan in self._single_scan_iterator(iterator):
+            yield ScanBunch(None, [scan])
 
     def next(self):
         return next(self._producer)
 
     def _validate(self, scan):
         return True
+
+    def _scan_index(self, scan):
+        try:
+            return self._title_to_index[self._scan_title(scan)]
+        except KeyError:
+            return -1
+
+    def _read_block(self, index):
+        if self._handle is None or self._handle.closed:
+            self._handle = open(self.source_file, 'rb')
+        start = self._offsets[index]
+        self._handle.seek(start)
+        if index + 1 < len(self._offsets):
+            buff = self._handle.read(self._offsets[index + 1] - start)
+        else:
+            buff = self._handle.read()
+        return _decode_mgf_bytes(buff, self.encoding)
+
+    def _get_scan_data_by_index(self, index):
+        spectra = parse_mgf_spectra(self._read_block(index), self.header)
+        if not spectra:
+            raise KeyError(index)
+        return spectra[0]
+
+    def get_scan_by_id(self, scan_id):
+        """Retrieve the scan object for the specified scan id.
+
+        If the scan object is still bound and in memory somewhere,
+        a reference to that same object will be returned. Otherwise,
+        a new object will be created.
+
+        Parameters
+        ----------
+        scan_id : str
+            The unique scan id value to be retrieved
+
+        Returns
+        -------
+        Scan
+        """
+        try:
+            return self._scan_cache[scan_id]
+        except KeyError:
+            packed = self._make_scan(self._get_scan_data_by_index(self._title_to_index[scan_id]))
+            self._scan_cache[packed.id] = packed
+            return packed
+
+    def get_scan_by_index(self, index):
+        """Retrieve the scan object for the specified scan index.
+
+        This internally calls :meth:`get_scan_by_id` which will
+        use its cache.
+
+        Parameters
+        ----------
+        index: int
+            The index to get the scan for
+
+        Returns
+        -------
+        Scan
+        """
+        if index < 0:
+            index += len(self._offsets)
+        if not 0 <= index < len(self._offsets):
+            raise IndexError(index)
+        return self.get_scan_by_id(self._titles[index])
+
+    def _build_ms_level_time_index(self):
+        scan_times = np.zeros(len(self._offsets))
+        ms_levels = np.full(len(self._offsets), 2, dtype=np.int16)
+        pattern = re.compile(r"^RTINSECONDS=(\S+)", re.MULTILINE | re.IGNORECASE)
+        for i in range(len(self._offsets)):
+            match = pattern.search(self._read_block(i))
+            if match is None:
+                scan_times[i] = np.nan
+                ms_levels[i] = 0
+            else:
+                scan_times[i] = float(match.group(1)) / 60.0
+        return MSLevelTimeIndex(ms_levels, scan_times)
+
+    def get_scan_by_time(self, time):
+        """Retrieve the scan whose scan time is nearest to `time`
+
+        Parameters
+        ----------
+        time : float
+            The time to get the nearest scan from
+
+        Returns
+        -------
+        Scan
+        """
+        index = self.ms_level_time_index.find_time(time)
+        if index is None:
+            return None
+        return self.get_scan_by_index(index)
+
+    def _yield_from_index(self, start):
+        for i in range(start, len(self._offsets)):
+            yield self._get_scan_data_by_index(i)
+
+    def start_from_scan(self, scan_id=None, rt=None, index=None, require_ms1=True, grouped=False):
+        """Reconstruct an iterator which will start from the scan matching one of `scan_id`,
+        `rt`, or `index`. Only one may be provided.
+
+        As MGF files contain only MSn scans, `require_ms1` is ignored.
+
+        Parameters
+        ----------
+        scan_id : str, optional
+            Start from the scan with the specified id.
+        rt : float, optional
+            Start from the scan nearest to specified time (in minutes) in the run.
+        index : int, optional
+            Start from the scan with the specified index.
+        require_ms1 : bool, optional
+            Ignored
+        grouped : bool, optional
+            Whether the iterator should be grouped and produce :class:`.ScanBunch` objects
+            or single :class:`.Scan`. Defaults to :const:`False`
+
+        Returns
+        -------
+        MGFLoader
+        """
+        if scan_id is not None:
+            index = self._title_to_index[scan_id]
+        elif rt is not None:
+            index = self.get_scan_by_time(rt).index
+        elif index is None:
+            raise ValueError("Must provide a scan locator, one of (scan_id, rt, index)")
+        index = max(min(index, len(self._offsets)), 0)
+        self.make_iterator(self._yield_from_index(index), grouped=grouped)
+        return self
+
+    def iter_parallel(self, n_processes=4, batch_size=1000):
+        """Parse the file in parallel, splitting it into batches of `batch_size`
+        spectra by byte offset and handing each batch to a pool of `n_processes`
+        worker processes. Scans are yielded in file order.
+
+        Parameters
+        ----------
+        n_processes : int, optional
+            The number of worker processes to use
+        batch_size : int, optional
+            The number of spectra in each batch
+
+        Yields
+        ------
+        Scan
+        """
+        offsets = [int(o) for o in self._offsets]
+        payloads = []
+        for i in range(0, len(offsets), batch_size):
+            end = offsets[i + batch_size] if i + batch_size < len(offsets) else None
+            payloads.append((self.source_file, self.encoding, self.header, offsets[i], end))
+        pool = multiprocessing.Pool(n_processes)
+        try:
+            for spectra in pool.imap(_parse_mgf_range, payloads):
+                for data in spectra:
+                    packed = self._make_scan(data)
+                    self._scan_cache[packed.id] = packed
+                    yield packed
+        finally:
+            pool.close()
+            pool.join()
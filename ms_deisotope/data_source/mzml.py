@@ -1,3 +1,5 @@
+import re
+
 import numpy as np
 from pyteomics import mzml
 from .common import (
@@ -6,14 +8,213 @@ from .common import (
     ScanAcquisitionInformation, ScanEventInformation,
     ScanWindow, IsolationWindow,
     InstrumentInformation, ComponentGroup, component)
-from weakref import WeakValueDictionary
+from ..utils import basestring
+from .binary_codecs import resolve_codec, decode_array, pop_codec
 from .xml_reader import (
     XMLReaderBase, IndexSavingXML, iterparse_until,
     get_tag_attributes, _find_section, in_minutes)
 
 
+class LazyBinaryArray(object):
+    """Holds the encoded payload of a ``<binary>`` element of an mzML
+    spectrum until it is needed, deferring the base64 decoding and
+    decompression to :meth:`decode`.
+
+    Attributes
+    ----------
+    name : str
+        The name of the data array, e.g. ``"m/z array"``
+    encoded : str
+        The base64-encoded text of the ``<binary>`` element
+    dtype : str
+        The type code of the encoded values
+    compression : str
+        The name of the codec the values were encoded with, one of those
+        known to :mod:`~.binary_codecs`
+    target_dtype : np.dtype
+        The type to convert the decoded array to, if any
+    """
+    __slots__ = ("name", "encoded", "dtype", "compression", "target_dtype")
+
+    def __init__(self, name, encoded, dtype, compression, target_dtype=None):
+        self.name = name
+        self.encoded = encoded
+        self.dtype = dtype
+        self.compression = resolve_codec(compression)
+        self.target_dtype = target_dtype
+
+    def decode(self):
+        """Decode the payload into an array
+
+        Returns
+        -------
+        np.ndarray
+        """
+        if self.encoded:
+            array = decode_array(self.encoded, self.compression, self.dtype)
+        else:
+            array = np.array([], dtype=self.dtype)
+        if self.target_dtype is not None:
+            array = array.astype(self.target_dtype)
+        return array
+
+    @property
+    def nbytes(self):
+        """The size of the encoded payload. The number of elements is not known
+        until the payload is decoded.
+        """
+        return len(self.encoded or '')
+
+    def __repr__(self):
+        return "%s(%r, %d encoded bytes)" % (self.__class__.__name__, self.name, self.nbytes)
+
+    def __reduce__(self):
+        return self.__class__, (self.name, self.encoded, self.dtype, self.compression, self.target_dtype)
+
+
+def decode_binary_arrays(scan):
+    """Decode any :class:`LazyBinaryArray` values in the scan dictionary `scan`,
+    replacing them in-place with their arrays.
+
+    Parameters
+    ----------
+    scan : dict
+        The spectrum dictionary produced by the parser
+
+    Returns
+    -------
+    dict
+    """
+    for key, value in list(scan.items()):
+        if isinstance(value, LazyBinaryArray):
+            scan[key] = value.decode()
+    return scan
+
+
 class _MzMLParser(mzml.MzML, IndexSavingXML):
-    pass
+    """Extends :class:`pyteomics.mzml.MzML` to decode binary data arrays encoded with any of
+    the codecs in :mod:`~.binary_codecs`, including MS-Numpress, and to optionally keep them
+    encoded as :class:`LazyBinaryArray` instances when `decode_binary` is :const:`False`.
+    """
+
+    _array_dtypes = {
+        '32-bit float': 'f', '64-bit float': 'd',
+        '32-bit integer': 'i4', '64-bit integer': 'i8',
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.decode_binary = kwargs.pop("decode_binary", True)
+        super(_MzMLParser, self).__init__(*args, **kwargs)
+
+    def _handle_binary(self, info, **kwargs):
+        dtype = self._determine_array_dtype(info)
+        compression = self._determine_compression(info)
+        encoded = info.pop('binary')
+        name = self._detect_array_name(info)
+        array = LazyBinaryArray(name, encoded, dtype, compression, self._dtype_dict.get(name))
+        if self.decode_binary:
+            array = array.decode()
+        if name == 'binary':
+            info[name] = array
+        else:
+            info = {name: array}
+        return info
+
+    def _determine_compression(self, info):
+        return pop_codec(info)
+
+    def _determine_array_dtype(self, info):
+        names = info.get('name')
+        if isinstance(names, basestring):
+            names = [names]
+            info['name'] = names
+        for term, code in self._array_dtypes.items():
+            if term in info:
+                del info[term]
+                return code
+            if names and term in names:
+                names.remove(term)
+                if not names:
+                    del info['name']
+                return code
+        return None
+
+
+_ms_level_time_cv_pattern = re.compile(
+    br'<cvParam\s[^>]*?accession="(MS:1000511|MS:1000016)"[^>]*>')
+_value_attribute_pattern = re.compile(br'\svalue="([^"]*)"')
+_unit_name_attribute_pattern = re.compile(br'\sunitName="([^"]*)"')
+
+
+def _parse_spectrum_header(header):
+    if not header.lstrip().startswith(b"<spectrum"):
+        return 0, np.nan
+    ms_level = None
+    scan_time = 0.0
+    for match in _ms_level_time_cv_pattern.finditer(header):
+        tag = match.group(0)
+        value = _value_attribute_pattern.search(tag)
+        if value is None:
+            continue
+        if match.group(1) == b"MS:1000511":
+            ms_level = int(value.group(1))
+        else:
+            scan_time = float(value.group(1))
+            unit = _unit_name_attribute_pattern.search(tag)
+            if unit is not None and unit.group(1) == b"second":
+                scan_time /= 60.
+    return ms_level, scan_time
+
+
+_metadata_cv_pattern = re.compile(
+    br'<cvParam\s[^>]*?accession="(MS:10005(?:11|04|05)|MS:10000(?:16|41|45)|MS:1000285|'
+    br'MS:100013[09]|MS:1000744|MS:100082[789])"[^>]*>')
+
+
+def _parse_spectrum_metadata(header):
+    if not header.lstrip().startswith(b"<spectrum"):
+        return None
+    values = {}
+    polarity = 0
+    for match in _metadata_cv_pattern.finditer(header):
+        accession = match.group(1)
+        tag = match.group(0)
+        if accession == b"MS:1000130":
+            polarity = 1
+            continue
+        elif accession == b"MS:1000129":
+            polarity = -1
+            continue
+        value = _value_attribute_pattern.search(tag)
+        if value is None:
+            continue
+        value = float(value.group(1))
+        if accession == b"MS:1000016":
+            unit = _unit_name_attribute_pattern.search(tag)
+            if unit is not None and unit.group(1) == b"second":
+                value /= 60.
+        # Only the first precursor's values are used
+        values.setdefault(accession, value)
+    ms_level = values.get(b"MS:1000511")
+    precursor_mz = values.get(b"MS:1000744")
+    isolation_window = None
+    if b"MS:1000827" in values or b"MS:1000828" in values or b"MS:1000829" in values:
+        isolation_window = (
+            values.get(b"MS:1000828", 0.0),
+            values.get(b"MS:1000827", precursor_mz),
+            values.get(b"MS:1000829", 0.0))
+    return {
+        "scan_time": values.get(b"MS:1000016", 0.0),
+        "ms_level": int(ms_level) if ms_level is not None else None,
+        "polarity": polarity,
+        "tic": values.get(b"MS:1000285"),
+        "base_peak_mz": values.get(b"MS:1000504"),
+        "base_peak_intensity": values.get(b"MS:1000505"),
+        "precursor_mz": precursor_mz,
+        "precursor_charge": values.get(b"MS:1000041"),
+        "isolation_window": isolation_window,
+        "activation_energy": values.get(b"MS:1000045"),
+    }
 
 
 class MzMLDataInterface(ScanDataSource):
@@ -41,9 +242,15 @@ class MzMLDataInterface(ScanDataSource):
             An array of intensity values for this scan
         """
         try:
-            return scan['m/z array'], scan["intensity array"]
+            mz_array = scan['m/z array']
+            intensity_array = scan["intensity array"]
         except KeyError:
             return np.array([]), np.array([])
+        if isinstance(mz_array, LazyBinaryArray):
+            mz_array = scan['m/z array'] = mz_array.decode()
+        if isinstance(intensity_array, LazyBinaryArray):
+            intensity_array = scan['intensity array'] = intensity_array.decode()
+        return mz_array, intensity_array
 
     def _get_selected_ion(self, scan):
         pinfo_dict = scan["precursorList"]['precursor'][0]["selectedIonList"]['selectedIon'][0]
@@ -399,31 +606,52 @@ class MzMLLoader(MzMLDataInterface, XMLReaderBase, _MzMLMetadataLoader):
         Path to file to read from.
     source: pyteomics.mzml.MzML
         Underlying scan data source
+    decode_binary: bool
+        Whether to decode the binary data arrays of each spectrum as soon as it
+        is parsed. If :const:`False`, the default, the encoded payload is kept as a
+        :class:`LazyBinaryArray` and only decoded when :attr:`Scan.arrays` is first
+        accessed, so scans whose signal is never used are cheap to read.
+    scan_cache: ScanCache
+        The cache policy for scans read from this file, as interpreted by
+        :func:`~.make_scan_cache`. Defaults to weak references only.
     """
 
     @staticmethod
     def prebuild_byte_offset_file(path):
         return _MzMLParser.prebuild_byte_offset_file(path)
 
-    def __init__(self, source_file, use_index=True):
+    def __init__(self, source_file, use_index=True, decode_binary=False, scan_cache=None):
         self.source_file = source_file
-        self._source = _MzMLParser(source_file, read_schema=True, iterative=True, use_index=use_index)
+        self.decode_binary = decode_binary
+        self._source = _MzMLParser(
+            source_file, read_schema=True, iterative=True, use_index=use_index,
+            decode_binary=decode_binary)
         self.make_iterator()
-        self._scan_cache = WeakValueDictionary()
+        self._initialize_scan_cache(scan_cache)
         self._use_index = use_index
         self._run_information = self._get_run_attributes()
         self._instrument_config = {
             k.id: k for k in self.instrument_configuration()
         }
 
+    _scan_header_terminator = b"<binaryDataArrayList"
+
     def _validate(self, scan):
         return "m/z array" in scan._data
 
+    def _parse_scan_header(self, header):
+        return _parse_spectrum_header(header)
+
+    def _parse_scan_metadata(self, header):
+        return _parse_spectrum_metadata(header)
+
     def _yield_from_index(self, scan_source, start):
         offset_provider = scan_source._offset_index.offsets
-        keys = offset_provider.keys()
+        keys = list(offset_provider.keys())
         if start is not None:
             if isinstance(start, basestring):
+                if not isinstance(start, bytes):
+                    start = start.encode('utf-8')
                 start = keys.index(start)
             elif isinstance(start, int):
                 start = start
@@ -432,4 +660,4 @@ class MzMLLoader(MzMLDataInterface, XMLReaderBase, _MzMLMetadataLoader):
         else:
             start = 0
         for key in keys[start:]:
-            yield scan_source.get_by_id(key)
+            yield scan_source.get_by_id(key.decode('utf-8'))
@@ -1,3 +1,5 @@
+import re
+
 import numpy as np
 from pyteomics import mzxml
 from .common import (
@@ -6,13 +8,86 @@ from .common import (
     ComponentGroup, component, InstrumentInformation)
 from .xml_reader import (
     XMLReaderBase, IndexSavingXML, iterparse_until)
-from weakref import WeakValueDictionary
+from ..utils import basestring
 
 
 class _MzXMLParser(mzxml.MzXML, IndexSavingXML):
     pass
 
 
+_ms_level_attribute_pattern = re.compile(br'\smsLevel="(\d+)"')
+_retention_time_attribute_pattern = re.compile(
+    br'\sretentionTime="-?P(?:T)?(?:([\d.]+)H)?(?:([\d.]+)M)?(?:([\d.]+)S)?"')
+
+
+def _parse_scan_header(header):
+    # Only the scan's own start tag is considered, as child scans may be nested
+    # inside it.
+    end = header.find(b">")
+    if end != -1:
+        header = header[:end]
+    match = _ms_level_attribute_pattern.search(header)
+    if match is None:
+        return None, 0.0
+    ms_level = int(match.group(1))
+    scan_time = 0.0
+    match = _retention_time_attribute_pattern.search(header)
+    if match is not None:
+        hours, minutes, seconds = match.groups()
+        scan_time = float(hours or 0) * 60. + float(minutes or 0) + float(seconds or 0) / 60.
+    return ms_level, scan_time
+
+
+_scan_float_attribute_patterns = [
+    (name, re.compile(br'\s' + attribute + br'="([^"]*)"')) for name, attribute in [
+        ("tic", b"totIonCurrent"),
+        ("base_peak_mz", b"basePeakMz"),
+        ("base_peak_intensity", b"basePeakIntensity"),
+        ("activation_energy", b"collisionEnergy"),
+    ]
+]
+_polarity_attribute_pattern = re.compile(br'\spolarity="([+-])"')
+_precursor_element_pattern = re.compile(br'<precursorMz([^>]*)>\s*([^<\s]+)\s*</precursorMz>')
+_precursor_charge_attribute_pattern = re.compile(br'\sprecursorCharge="(\d+)"')
+_window_wideness_attribute_pattern = re.compile(br'\swindowWideness="([^"]*)"')
+
+
+def _parse_scan_metadata(header):
+    header = header.lstrip()
+    start_tag_end = header.find(b">")
+    start_tag = header[:start_tag_end] if start_tag_end != -1 else header
+    ms_level, scan_time = _parse_scan_header(header)
+    if ms_level == 0:
+        return None
+    metadata = {
+        "ms_level": ms_level,
+        "scan_time": scan_time,
+        "polarity": 0,
+    }
+    for name, pattern in _scan_float_attribute_patterns:
+        match = pattern.search(start_tag)
+        metadata[name] = float(match.group(1)) if match is not None else None
+    match = _polarity_attribute_pattern.search(start_tag)
+    if match is not None:
+        metadata['polarity'] = 1 if match.group(1) == b"+" else -1
+    # Only the scan's own precursor is considered, not those of nested child scans.
+    precursor = _precursor_element_pattern.search(header)
+    if precursor is not None and header.find(b"<scan ", 1, precursor.start()) == -1:
+        attributes = precursor.group(1)
+        precursor_mz = float(precursor.group(2))
+        metadata['precursor_mz'] = precursor_mz
+        match = _precursor_charge_attribute_pattern.search(attributes)
+        if match is not None:
+            metadata['precursor_charge'] = int(match.group(1))
+        match = _window_wideness_attribute_pattern.search(attributes)
+        if match is not None:
+            width = float(match.group(1)) / 2
+            metadata['isolation_window'] = (width, precursor_mz, width)
+    else:
+        metadata['activation_energy'] = None
+    return metadata
+
+
 class _MzXMLMetadataLoader(object):
     def file_description(self):
         file_info = map(self.source._get_info_smart, iterparse_until(self.source, "parentFile", "scan"))
@@ -305,16 +380,19 @@ class MzXMLLoader(MzXMLDataInterface, XMLReaderBase, _MzXMLMetadataLoader):
         Path to file to read from.
     source: pyteomics.mzxml.MzXML
         Underlying scan data source
+    scan_cache: ScanCache
+        The cache policy for scans read from this file, as interpreted by
+        :func:`~.make_scan_cache`. Defaults to weak references only.
     """
 
     @staticmethod
     def prebuild_byte_offset_file(path):
         return _MzXMLParser.prebuild_byte_offset_file(path)
 
-    def __init__(self, source_file, use_index=True):
+    def __init__(self, source_file, use_index=True, scan_cache=None):
         self.source_file = source_file
         self._source = _MzXMLParser(source_file, read_schema=True, iterative=True, use_index=use_index)
-        self._scan_cache = WeakValueDictionary()
+        self._initialize_scan_cache(scan_cache)
         self._use_index = use_index
         self._scan_index_lookup = None
         if self._use_index:
@@ -338,14 +416,24 @@ class MzXMLLoader(MzXMLDataInterface, XMLReaderBase, _MzXMLMetadataLoader):
             i += 1
         self._scan_index_lookup = index
 
+    _scan_header_terminator = b"<peaks"
+
     def _validate(self, scan):
         return "m/z array" in scan._data
 
+    def _parse_scan_header(self, header):
+        return _parse_scan_header(header)
+
+    def _parse_scan_metadata(self, header):
+        return _parse_scan_metadata(header)
+
     def _yield_from_index(self, scan_source, start=None):
         offset_provider = scan_source._offset_index.offsets
-        keys = offset_provider.keys()
+        keys = list(offset_provider.keys())
         if start is not None:
             if isinstance(start, basestring):
+                if not isinstance(start, bytes):
+                    start = start.encode('utf-8')
                 start = keys.index(start)
             elif isinstance(start, int):
                 start = start
@@ -354,5 +442,5 @@ class MzXMLLoader(MzXMLDataInterface, XMLReaderBase, _MzXMLMetadataLoader):
         else:
             start = 0
         for key in keys[start:]:
-            scan = scan_source.get_by_id(key, "num")
+            scan = scan_source.get_by_id(key.decode('utf-8'), "num")
             yield scan
@@ -0,0 +1,255 @@
+import sys
+import threading
+
+try:
+    from queue import Queue, Empty, Full
+except ImportError:  # pragma: no cover
+    from Queue import Queue, Empty, Full
+
+from .common import DataAccessProxy, ScanBunch
+from .mzml import decode_binary_arrays
+
+
+class _PrefetchDone(object):
+    def __repr__(self):
+        return "PREFETCH_DONE"
+
+
+PREFETCH_DONE = _PrefetchDone()
+
+
+class _PrefetchError(object):
+    __slots__ = ("error", "traceback")
+
+    def __init__(self, error, traceback):
+        self.error = error
+        self.traceback = traceback
+
+
+class ScanPrefetcher(DataAccessProxy):
+    """Reads ahead from a :class:`~.ScanIterator` on a background thread, so
+    that parsing and decoding the next scans overlaps with processing the
+    current ones. Binary data arrays which the wrapped reader left encoded
+    are decoded on the reading thread too.
+
+    Up to :attr:`buffer_size` items produced by the wrapped iterator, usually
+    :class:`~.ScanBunch` instances, are held in a bounded queue. When the queue
+    is full the reading thread blocks until the consumer catches up. Errors
+    raised while reading are re-raised to the consumer by :meth:`next`.
+
+    Random access methods are forwarded to the wrapped source under the same
+    lock the reading thread holds while it advances the iterator, so the two
+    never use the underlying file at the same time. Scans read through the
+    prefetcher, and their precursor information, are bound to it rather than
+    to the wrapped source, so random access made from a scan takes the lock
+    too. Methods which reposition the iterator, like :meth:`start_from_scan`
+    and :meth:`reset`, stop the reading thread and discard whatever it had
+    read ahead first.
+
+    A thread is used rather than a process because :class:`~.Scan` objects
+    keep a reference to the source they were read from.
+
+    Attributes
+    ----------
+    source : ScanIterator
+        The wrapped scan source
+    buffer_size : int
+        The maximum number of items read ahead
+    """
+
+    def __init__(self, source, buffer_size=4, poll_interval=0.1):
+        DataAccessProxy.__init__(self, source)
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._queue = Queue(maxsize=buffer_size)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._exhausted = False
+
+    def __repr__(self):
+        return "%s(%r, %d)" % (self.__class__.__name__, self.source, self.buffer_size)
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=self.poll_interval)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _bind_scan(self, scan):
+        if scan is None or getattr(scan, "source", None) is not self.source:
+            return scan
+        # Build the precursor information while the wrapped source is still bound,
+        # since doing so may read other scans from the file
+        if scan.ms_level > 1:
+            precursor_information = scan.precursor_information
+            if precursor_information is not None and precursor_information.source is self.source:
+                precursor_information.source = self
+        scan.source = self
+        return scan
+
+    def _prepare_scan(self, scan):
+        # Readers like :class:`~.MzMLLoader` leave binary arrays encoded until they
+        # are first used, so decode them here on the reading thread
+        data = getattr(scan, "_data", None)
+        if isinstance(data, dict):
+            decode_binary_arrays(data)
+        return self._bind_scan(scan)
+
+    def _bind(self, item):
+        if isinstance(item, ScanBunch):
+            self._prepare_scan(item.precursor)
+            for product in item.products:
+                self._prepare_scan(product)
+            return item
+        return self._prepare_scan(item)
+
+    def _read_ahead(self):
+        while not self._stop_event.is_set():
+            try:
+                with self._lock:
+                    item = self._bind(next(self.source))
+            except StopIteration:
+                self._put(PREFETCH_DONE)
+                return
+            except Exception as err:
+                self._put(_PrefetchError(err, sys.exc_info()[2]))
+                return
+            if not self._put(item):
+                return
+
+    def start(self):
+        """Start the reading thread if it is not already running
+        """
+        self.raise_if_detached()
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._exhausted = False
+        self._thread = threading.Thread(target=self._read_ahead, name="ScanPrefetcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+
+    def stop(self):
+        """Stop the reading thread and discard any items it has read ahead
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._drain()
+        self._thread.join()
+        self._thread = None
+        self._drain()
+
+    def next(self):
+        if self._thread is None:
+            if self._exhausted:
+                raise StopIteration()
+            self.start()
+        item = self._queue.get()
+        if item is PREFETCH_DONE:
+            self._exhausted = True
+            self.stop()
+            raise StopIteration()
+        elif isinstance(item, _PrefetchError):
+            self._exhausted = True
+            self.stop()
+            raise item.error
+        return item
+
+    def __next__(self):
+        return self.next()
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stop the reading thread and close the wrapped source
+        """
+        self.stop()
+        if self.source is not None:
+            self.source.close()
+
+    def reset(self):
+        self.stop()
+        self._exhausted = False
+        with self._lock:
+            self.source.reset()
+
+    def make_iterator(self, iterator=None, grouped=True):
+        self.stop()
+        self._exhausted = False
+        with self._lock:
+            self.source.make_iterator(iterator, grouped=grouped)
+
+    def start_from_scan(self, *args, **kwargs):
+        self.stop()
+        self._exhausted = False
+        with self._lock:
+            self.source.start_from_scan(*args, **kwargs)
+        return self
+
+    def get_scan_by_id(self, scan_id):
+        self.raise_if_detached()
+        with self._lock:
+            return self._bind_scan(self.source.get_scan_by_id(scan_id))
+
+    def get_scan_by_index(self, index):
+        self.raise_if_detached()
+        with self._lock:
+            return self._bind_scan(self.source.get_scan_by_index(index))
+
+    def get_scan_by_time(self, time):
+        self.raise_if_detached()
+        with self._lock:
+            return self._bind_scan(self.source.get_scan_by_time(time))
+
+    def find_previous_ms1(self, start_index):
+        with self._lock:
+            return self._bind_scan(self.source.find_previous_ms1(start_index))
+
+    def find_next_ms1(self, start_index):
+        with self._lock:
+            return self._bind_scan(self.source.find_next_ms1(start_index))
+
+    @property
+    def ms_level_time_index(self):
+        with self._lock:
+            return self.source.ms_level_time_index
+
+    @property
+    def index(self):
+        return self.source.index
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in ("source", "_lock"):
+            raise AttributeError(name)
+        value = getattr(self.source, name)
+        if not callable(value):
+            return value
+        lock = self._lock
+
+        def locked(*args, **kwargs):
+            with lock:
+                return value(*args, **kwargs)
+        return locked
@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+
+
+def estimate_scan_size(scan):
+    """Estimate the number of bytes held by the signal arrays of `scan`.
+
+    If the scan's arrays have not been loaded yet, the arrays or encoded
+    payloads in its underlying data are measured instead.
+
+    Parameters
+    ----------
+    scan : Scan
+
+    Returns
+    -------
+    int
+    """
+    arrays = getattr(scan, "_arrays", None)
+    if arrays is None:
+        data = getattr(scan, "_data", None)
+        if not isinstance(data, dict):
+            return 0
+        arrays = data.values()
+    size = 0
+    for array in arrays:
+        size += getattr(array, "nbytes", 0) or 0
+    return size
+
+
+class ScanCache(object):
+    """The interface shared by scan caches, a mapping from scan id to :class:`~.Scan`
+    which counts how often lookups are served from the cache.
+
+    Only lookups through :meth:`__getitem__` and :meth:`get` are counted.
+
+    Attributes
+    ----------
+    hits : int
+        The number of lookups which found a cached scan
+    misses : int
+        The number of lookups which did not find a cached scan
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / float(total)
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        raise NotImplementedError()
+
+    def __getitem__(self, key):
+        try:
+            value = self._lookup(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        raise NotImplementedError()
+
+    def __delitem__(self, key):
+        raise NotImplementedError()
+
+    def __contains__(self, key):
+        raise NotImplementedError()
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def _repr_details(self):
+        return ""
+
+    def __repr__(self):
+        return "%s(%d scans%s, hits=%d, misses=%d)" % (
+            self.__class__.__name__, len(self), self._repr_details(), self.hits, self.misses)
+
+
+class WeakScanCache(ScanCache):
+    """Holds only weak references to scans, so a scan stays cached only as long
+    as something else keeps it alive. This is the default policy.
+    """
+
+    def __init__(self):
+        super(WeakScanCache, self).__init__()
+        self._store = WeakValueDictionary()
+
+    def _lookup(self, key):
+        return self._store[key]
+
+    def __setitem__(self, key, value):
+        self._store[key] = value
+
+    def __delitem__(self, key):
+        del self._store[key]
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __len__(self):
+        return len(self._store)
+
+    def clear(self):
+        self._store.clear()
+
+
+class LRUScanCache(WeakScanCache):
+    """Keeps strong references to the most recently used scans, evicting the least
+    recently used ones when either limit is exceeded.
+
+    Evicted scans which are still referenced elsewhere continue to be found through
+    a weak reference, as with :class:`WeakScanCache`, so the same object is returned
+    for the same scan for as long as it is alive.
+
+    Attributes
+    ----------
+    max_scans : int or None
+        The maximum number of scans to hold strong references to
+    max_bytes : int or None
+        The maximum total size of the signal arrays of the scans held, as
+        estimated by :func:`estimate_scan_size`
+    current_bytes : int
+        The estimated size of the scans currently held
+    evictions : int
+        The number of scans evicted so far
+    """
+
+    def __init__(self, max_scans=None, max_bytes=None):
+        if max_scans is None and max_bytes is None:
+            raise ValueError("At least one of `max_scans` and `max_bytes` must be provided")
+        super(LRUScanCache, self).__init__()
+        self.max_scans = max_scans
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self._recent = OrderedDict()
+        self._sizes = {}
+
+    def reset_counters(self):
+        super(LRUScanCache, self).reset_counters()
+        self.evictions = 0
+
+    def _touch(self, key, value):
+        self._recent.pop(key, None)
+        self._recent[key] = value
+        # Arrays may be loaded after a scan was cached, so its size is re-measured
+        # whenever it is used.
+        size = estimate_scan_size(value)
+        self.current_bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        self._evict()
+
+    def _discard(self, key):
+        self._recent.pop(key, None)
+        self.current_bytes -= self._sizes.pop(key, 0)
+
+    def _evict(self):
+        while self._recent:
+            over_count = self.max_scans is not None and len(self._recent) > self.max_scans
+            over_size = self.max_bytes is not None and self.current_bytes > self.max_bytes
+            if not (over_count or over_size):
+                break
+            # Always keep the most recently used scan, even if it alone is larger
+            # than the byte budget.
+            if len(self._recent) == 1 and not over_count:
+                break
+            key = next(iter(self._recent))
+            self._discard(key)
+            self.evictions += 1
+
+    def _lookup(self, key):
+        value = self._store[key]
+        self._touch(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._store[key] = value
+        self._touch(key, value)
+
+    def __delitem__(self, key):
+        del self._store[key]
+        self._discard(key)
+
+    def clear(self):
+        super(LRUScanCache, self).clear()
+        self._recent.clear()
+        self._sizes.clear()
+        self.current_bytes = 0
+
+    @property
+    def strong_count(self):
+        """The number of scans currently held by strong reference
+        """
+        return len(self._recent)
+
+    def _repr_details(self):
+        return ", %d held, %d bytes" % (self.strong_count, self.current_bytes)
+
+
+def make_scan_cache(policy=None):
+    """Create a scan cache from a cache policy specification.
+
+    Parameters
+    ----------
+    policy : ScanCache, str, int or None
+        If :const:`None` or ``"weak"``, a :class:`WeakScanCache`. If an :class:`int`,
+        an :class:`LRUScanCache` holding at most that many scans. If a :class:`ScanCache`,
+        it is used as-is.
+
+    Returns
+    -------
+    ScanCache
+    """
+    if policy is None or policy == "weak":
+        return WeakScanCache()
+    elif isinstance(policy, ScanCache):
+        return policy
+    elif isinstance(policy, int) and not isinstance(policy, bool):
+        return LRUScanCache(max_scans=policy)
+    raise ValueError("Could not interpret %r as a scan cache policy" % (policy,))
@@ -0,0 +1,187 @@
+import os
+
+import numpy as np
+
+
+_scan_metadata_columns = [
+    ("index", "<i8"),
+    ("scan_time", "<f8"),
+    ("ms_level", "<i2"),
+    ("polarity", "<i1"),
+    ("tic", "<f8"),
+    ("base_peak_mz", "<f8"),
+    ("base_peak_intensity", "<f8"),
+    ("precursor_mz", "<f8"),
+    ("precursor_charge", "<i4"),
+    ("isolation_window_lower", "<f8"),
+    ("isolation_window_target", "<f8"),
+    ("isolation_window_upper", "<f8"),
+    ("activation_energy", "<f8"),
+]
+
+
+def scan_metadata_dtype(id_length=1):
+    """Build the dtype of a scan metadata table whose ``id`` column holds
+    strings of up to `id_length` characters.
+
+    Missing floating point values are stored as NaN, and a missing precursor
+    charge as 0.
+
+    Parameters
+    ----------
+    id_length : int
+
+    Returns
+    -------
+    np.dtype
+    """
+    return np.dtype([("id", "U%d" % max(id_length, 1))] + _scan_metadata_columns)
+
+
+def summarize_signal(mz_array, intensity_array):
+    """Compute the total ion current and base peak of a spectrum
+
+    Parameters
+    ----------
+    mz_array : np.ndarray
+    intensity_array : np.ndarray
+
+    Returns
+    -------
+    tic : float
+    base_peak_mz : float
+    base_peak_intensity : float
+    """
+    if len(intensity_array) == 0:
+        return 0.0, np.nan, 0.0
+    i = np.argmax(intensity_array)
+    return float(np.sum(intensity_array)), float(mz_array[i]), float(intensity_array[i])
+
+
+def _value(x):
+    return np.nan if x is None else x
+
+
+class ScanMetadataTableBuilder(object):
+    """Accumulates the rows of a columnar scan metadata table, one scan at
+    a time, and packs them into a NumPy structured array with :meth:`build`.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, scan_id, index, scan_time, ms_level, polarity=0, tic=None,
+            base_peak_mz=None, base_peak_intensity=None, precursor_mz=None,
+            precursor_charge=None, isolation_window=None, activation_energy=None):
+        if isolation_window is None:
+            isolation_window = (None, None, None)
+        try:
+            precursor_charge = int(precursor_charge)
+        except (TypeError, ValueError):
+            precursor_charge = 0
+        self.ids.append(scan_id)
+        self.rows.append((
+            index, _value(scan_time), ms_level, polarity or 0, _value(tic),
+            _value(base_peak_mz), _value(base_peak_intensity), _value(precursor_mz),
+            precursor_charge, _value(isolation_window[0]), _value(isolation_window[1]),
+            _value(isolation_window[2]), _value(activation_energy)))
+
+    def add_missing(self, scan_id, index):
+        """Add a placeholder row for an entry of the index which could not be read
+        as a scan, with an MS level of 0 and a NaN scan time, so that the rows of the
+        table stay aligned with scan indices.
+
+        Parameters
+        ----------
+        scan_id : str
+        index : int
+        """
+        self.add(scan_id, index, None, 0)
+
+    def add_scan(self, scan, signal_summary=None):
+        """Add a row describing `scan`, reading its arrays to compute the
+        total ion current and base peak unless `signal_summary` is given.
+
+        Parameters
+        ----------
+        scan : Scan
+        signal_summary : tuple, optional
+            The total ion current, base peak m/z and base peak intensity
+        """
+        if signal_summary is None:
+            signal_summary = summarize_signal(*scan.arrays)
+        tic, base_peak_mz, base_peak_intensity = signal_summary
+        pinfo = scan.precursor_information
+        activation = scan.activation
+        self.add(
+            scan.id, scan.index, scan.scan_time, scan.ms_level, scan.polarity,
+            tic, base_peak_mz, base_peak_intensity,
+            pinfo.mz if pinfo is not None else None,
+            pinfo.charge if pinfo is not None else None,
+            scan.isolation_window,
+            activation.energy if activation is not None else None)
+
+    def build(self):
+        """Pack the accumulated rows into a table
+
+        Returns
+        -------
+        np.ndarray
+        """
+        dtype = scan_metadata_dtype(max([len(i) for i in self.ids] or [1]))
+        table = np.empty(len(self.rows), dtype=dtype)
+        table['id'] = self.ids
+        columns = list(zip(*self.rows)) if self.rows else [[] for _ in _scan_metadata_columns]
+        for (name, _), column in zip(_scan_metadata_columns, columns):
+            table[name] = column
+        return table
+
+
+def scan_metadata_table_path(source_file):
+    return os.path.splitext(source_file)[0] + '-scan-metadata.npz'
+
+
+def _source_signature(source_file):
+    stat = os.stat(source_file)
+    return np.array([stat.st_size, stat.st_mtime], dtype=np.float64)
+
+
+def save_scan_metadata_table(table, source_file):
+    """Save `table` alongside `source_file`, along with the source file's size
+    and modification time so that a stale table is not loaded later.
+
+    Parameters
+    ----------
+    table : np.ndarray
+    source_file : str
+    """
+    with open(scan_metadata_table_path(source_file), 'wb') as fh:
+        np.savez(fh, table=table, source_signature=_source_signature(source_file))
+
+
+def load_scan_metadata_table(source_file):
+    """Load the table saved alongside `source_file` by :func:`save_scan_metadata_table`,
+    if there is one and the source file has not changed since.
+
+    Parameters
+    ----------
+    source_file : str
+
+    Returns
+    -------
+    np.ndarray or None
+    """
+    path = scan_metadata_table_path(source_file)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if not np.array_equal(data['source_signature'], _source_signature(source_file)):
+                return None
+            return data['table']
+    except (IOError, OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,451 @@
+"""A binary spectrum store which keeps the raw signal of every scan in a run
+in one memory-mapped file, so that data which is processed many times only
+has to be decoded from its original format once.
+
+The file is laid out as::
+
+    MAGIC | float64 signal data | metadata table | JSON header | trailer
+
+The signal data holds the m/z array followed by the intensity array of each scan,
+concatenated in scan order. The metadata table is a NumPy structured array with one
+fixed-width record per scan locating its signal and describing it, and the JSON header
+holds the table's dtype and the variable length string columns. The trailer records the
+position and size of the header, so a store can be written in a single pass.
+"""
+import io
+import os
+import json
+import struct
+
+import numpy as np
+
+from .common import (
+    ScanDataSource, ScanIterator, RandomAccessScanSource,
+    PrecursorInformation, ChargeNotProvided, ActivationInformation,
+    IsolationWindow, MSLevelTimeIndex)
+from .scan_metadata import scan_metadata_dtype, summarize_signal
+from ..utils import Base
+
+
+MAGIC = b"MSDSTORE"
+FORMAT_VERSION = 1
+_TRAILER = struct.Struct("<QQ8s")
+_CHARGE_NOT_PROVIDED = np.iinfo(np.int32).min
+
+metadata_dtype = np.dtype([
+    ("scan_time", "<f8"),
+    ("ms_level", "<i2"),
+    ("polarity", "<i1"),
+    ("is_profile", "?"),
+    ("data_offset", "<i8"),
+    ("data_length", "<i8"),
+    ("has_precursor", "?"),
+    ("precursor_mz", "<f8"),
+    ("precursor_intensity", "<f8"),
+    ("precursor_charge", "<i4"),
+    ("isolation_window_lower", "<f8"),
+    ("isolation_window_target", "<f8"),
+    ("isolation_window_upper", "<f8"),
+    ("activation_energy", "<f8"),
+])
+
+
+def _nan_if_none(value):
+    return np.nan if value is None else value
+
+
+def _none_if_nan(value):
+    return None if np.isnan(value) else float(value)
+
+
+class SpectrumStoreWriter(object):
+    """Writes scans to a spectrum store file in a single pass.
+
+    Attributes
+    ----------
+    path : str
+        The path to write to
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = io.open(path, 'wb')
+        self.handle.write(MAGIC)
+        self._records = []
+        self._ids = []
+        self._titles = []
+        self._precursor_scan_ids = []
+        self._activation_methods = []
+        self._data_length = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add_scan(self, scan):
+        """Append `scan`'s raw signal and metadata to the store
+
+        Parameters
+        ----------
+        scan : Scan
+        """
+        mz_array, intensity_array = scan.arrays
+        mz_array = np.asarray(mz_array, dtype='<f8')
+        intensity_array = np.asarray(intensity_array, dtype='<f8')
+        n = len(mz_array)
+        self.handle.write(mz_array.tobytes())
+        self.handle.write(intensity_array.tobytes())
+
+        record = np.zeros(1, dtype=metadata_dtype)[0]
+        record['scan_time'] = scan.scan_time
+        record['ms_level'] = scan.ms_level
+        record['polarity'] = scan.polarity or 0
+        record['is_profile'] = bool(scan.is_profile)
+        record['data_offset'] = self._data_length
+        record['data_length'] = n
+        self._data_length += 2 * n
+
+        pinfo = scan.precursor_information
+        precursor_scan_id = None
+        if pinfo is not None:
+            record['has_precursor'] = True
+            record['precursor_mz'] = pinfo.mz
+            record['precursor_intensity'] = _nan_if_none(pinfo.intensity)
+            charge = pinfo.charge
+            if charge is None or charge is ChargeNotProvided:
+                charge = _CHARGE_NOT_PROVIDED
+            record['precursor_charge'] = charge
+            precursor_scan_id = pinfo.precursor_scan_id
+        isolation_window = scan.isolation_window
+        if isolation_window is None:
+            isolation_window = (None, None, None)
+        record['isolation_window_lower'] = _nan_if_none(isolation_window[0])
+        record['isolation_window_target'] = _nan_if_none(isolation_window[1])
+        record['isolation_window_upper'] = _nan_if_none(isolation_window[2])
+        activation = scan.activation
+        if activation is not None:
+            record['activation_energy'] = _nan_if_none(activation.energy)
+            self._activation_methods.append(str(activation.method))
+        else:
+            record['activation_energy'] = np.nan
+            self._activation_methods.append(None)
+
+        self._records.append(record)
+        self._ids.append(scan.id)
+        self._titles.append(scan.title)
+        self._precursor_scan_ids.append(precursor_scan_id)
+
+    def close(self):
+        """Write the metadata table, header and trailer, and close the file
+        """
+        if self._closed:
+            return
+        metadata = np.array(self._records, dtype=metadata_dtype)
+        metadata_offset = self.handle.tell()
+        self.handle.write(metadata.tobytes())
+        header = {
+            "version": FORMAT_VERSION,
+            "n_scans": len(metadata),
+            "data_length": self._data_length,
+            "metadata_offset": metadata_offset,
+            "metadata_dtype": metadata_dtype.descr,
+            "ids": self._ids,
+            "titles": self._titles,
+            "precursor_scan_ids": self._precursor_scan_ids,
+            "activation_methods": self._activation_methods,
+        }
+        header_offset = self.handle.tell()
+        encoded = json.dumps(header).encode('utf8')
+        self.handle.write(encoded)
+        self.handle.write(_TRAILER.pack(header_offset, len(encoded), MAGIC))
+        self.handle.close()
+        self._closed = True
+
+
+def convert_to_spectrum_store(reader, path):
+    """Copy every scan read from `reader` into a new spectrum store at `path`
+
+    Parameters
+    ----------
+    reader : ScanIterator
+        Any scan reader
+    path : str
+        The path to write the store to
+
+    Returns
+    -------
+    SpectrumStoreLoader
+        A reader over the new store
+    """
+    reader.make_iterator(grouped=False)
+    try:
+        with SpectrumStoreWriter(path) as writer:
+            for scan in reader:
+                writer.add_scan(scan)
+    finally:
+        reader.reset()
+    return SpectrumStoreLoader(path)
+
+
+def is_spectrum_store(path):
+    with io.open(path, 'rb') as handle:
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+class SpectrumStorePtr(Base):
+    __slots__ = ("index", )
+
+    def __init__(self, index):
+        self.index = index
+
+
+class SpectrumStoreInterface(ScanDataSource):
+    """Provides implementations of all of the methods needed to implement the
+    :class:`ScanDataSource` for spectrum store files. Not intended for direct instantiation.
+    """
+
+    def _scan_arrays(self, scan):
+        record = self._metadata[scan.index]
+        offset = record['data_offset']
+        n = record['data_length']
+        # Copy out of the read-only memory map so the arrays may be modified
+        mz_array = np.array(self._signal[offset:offset + n])
+        intensity_array = np.array(self._signal[offset + n:offset + 2 * n])
+        return mz_array, intensity_array
+
+    def _precursor_information(self, scan):
+        record = self._metadata[scan.index]
+        if not record['has_precursor']:
+            return None
+        charge = int(record['precursor_charge'])
+        if charge == _CHARGE_NOT_PROVIDED:
+            charge = ChargeNotProvided
+        intensity = record['precursor_intensity']
+        return PrecursorInformation(
+            float(record['precursor_mz']), None if np.isnan(intensity) else float(intensity),
+            charge, self._precursor_scan_ids[scan.index], source=self,
+            product_scan_id=self._ids[scan.index])
+
+    def _scan_title(self, scan):
+        return self._titles[scan.index]
+
+    def _scan_id(self, scan):
+        return self._ids[scan.index]
+
+    def _scan_index(self, scan):
+        return scan.index
+
+    def _ms_level(self, scan):
+        return int(self._metadata[scan.index]['ms_level'])
+
+    def _scan_time(self, scan):
+        return float(self._metadata[scan.index]['scan_time'])
+
+    def _is_profile(self, scan):
+        return bool(self._metadata[scan.index]['is_profile'])
+
+    def _polarity(self, scan):
+        return int(self._metadata[scan.index]['polarity'])
+
+    def _activation(self, scan):
+        method = self._activation_methods[scan.index]
+        if method is None:
+            return None
+        return ActivationInformation(
+            method, _none_if_nan(self._metadata[scan.index]['activation_energy']))
+
+    def _isolation_window(self, scan):
+        record = self._metadata[scan.index]
+        window = (record['isolation_window_lower'], record['isolation_window_target'],
+                  record['isolation_window_upper'])
+        if all(np.isnan(v) for v in window):
+            return None
+        return IsolationWindow(*map(_none_if_nan, window))
+
+
+class SpectrumStoreLoader(SpectrumStoreInterface, RandomAccessScanSource, ScanIterator):
+    """Reads scans from a spectrum store written by :class:`SpectrumStoreWriter`
+    or :func:`convert_to_spectrum_store`. Provides both iterative and random access.
+
+    Opening a store reads only its header, and the signal data is memory-mapped, so
+    scans are read without any decoding.
+
+    Attributes
+    ----------
+    source_file: str
+        Path to file to read from.
+    metadata: np.ndarray
+        The metadata table, a structured array with one record per scan
+    """
+
+    def __init__(self, source_file, scan_cache=None):
+        self.source_file = source_file
+        self._read_header()
+        self._initialize_scan_cache(scan_cache)
+        self._id_to_index = None
+        self._producer = None
+        self.make_iterator()
+
+    def _read_header(self):
+        with io.open(self.source_file, 'rb') as handle:
+            if handle.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%r is not a spectrum store" % (self.source_file,))
+            handle.seek(-_TRAILER.size, os.SEEK_END)
+            header_offset, header_length, magic = _TRAILER.unpack(handle.read(_TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError("%r is an incomplete spectrum store" % (self.source_file,))
+            handle.seek(header_offset)
+            header = json.loads(handle.read(header_length).decode('utf8'))
+        n_scans = header['n_scans']
+        dtype = np.dtype([tuple(field) for field in header['metadata_dtype']])
+        if n_scans:
+            self._metadata = np.memmap(
+                self.source_file, dtype=dtype, mode='r',
+                offset=header['metadata_offset'], shape=(n_scans,))
+        else:
+            self._metadata = np.zeros(0, dtype=dtype)
+        if header['data_length']:
+            self._signal = np.memmap(
+                self.source_file, dtype='<f8', mode='r',
+                offset=len(MAGIC), shape=(header['data_length'],))
+        else:
+            self._signal = np.zeros(0)
+        self._ids = header['ids']
+        self._titles = header['titles']
+        self._precursor_scan_ids = header['precursor_scan_ids']
+        self._activation_methods = header['activation_methods']
+
+    @property
+    def metadata(self):
+        return self._metadata
+
+    @property
+    def index(self):
+        if self._id_to_index is None:
+            self._id_to_index = {scan_id: i for i, scan_id in enumerate(self._ids)}
+        return self._id_to_index
+
+    @property
+    def source(self):
+        return self.source_file
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.source_file)
+
+    def __reduce__(self):
+        return self.__class__, (self.source_file,)
+
+    def close(self):
+        self._signal = None
+        self._metadata = None
+
+    def reset(self):
+        self.make_iterator(None)
+        self._scan_cache.clear()
+
+    def _make_default_iterator(self):
+        return (SpectrumStorePtr(i) for i in range(len(self._ids)))
+
+    def _validate(self, scan):
+        return True
+
+    def next(self):
+        return next(self._producer)
+
+    def _build_ms_level_time_index(self):
+        return MSLevelTimeIndex(self._metadata['ms_level'], self._metadata['scan_time'])
+
+    def _build_scan_metadata_table(self):
+        metadata = self._metadata
+        table = np.empty(len(metadata), dtype=scan_metadata_dtype(max([len(i) for i in self._ids] or [1])))
+        table['id'] = self._ids
+        table['index'] = np.arange(len(metadata))
+        for name in ('scan_time', 'ms_level', 'polarity', 'precursor_mz', 'isolation_window_lower',
+                     'isolation_window_target', 'isolation_window_upper', 'activation_energy'):
+            table[name] = metadata[name]
+        charges = metadata['precursor_charge']
+        table['precursor_charge'] = np.where(charges == _CHARGE_NOT_PROVIDED, 0, charges)
+        table['precursor_mz'][~metadata['has_precursor']] = np.nan
+        for i, record in enumerate(metadata):
+            offset = record['data_offset']
+            n = record['data_length']
+            table['tic'][i], table['base_peak_mz'][i], table['base_peak_intensity'][i] = summarize_signal(
+                self._signal[offset:offset + n], self._signal[offset + n:offset + 2 * n])
+        return table
+
+    def get_scan_by_index(self, index):
+        """Retrieve the scan object for the specified scan index.
+
+        Parameters
+        ----------
+        index: int
+            The index to get the scan for
+
+        Returns
+        -------
+        Scan
+        """
+        if index < 0:
+            index += len(self._ids)
+        if not 0 <= index < len(self._ids):
+            raise IndexError(index)
+        scan_id = self._ids[index]
+        try:
+            return self._scan_cache[scan_id]
+        except KeyError:
+            packed = self._make_scan(SpectrumStorePtr(index))
+            self._scan_cache[scan_id] = packed
+            return packed
+
+    def get_scan_by_id(self, scan_id):
+        """Retrieve the scan object for the specified scan id.
+
+        Parameters
+        ----------
+        scan_id : str
+            The unique scan id value to be retrieved
+
+        Returns
+        -------
+        Scan
+        """
+        return self.get_scan_by_index(self.index[scan_id])
+
+    def get_scan_by_time(self, time):
+        """Retrieve the scan whose scan time is nearest to `time`
+
+        Parameters
+        ----------
+        time : float
+            The time to get the nearest scan from
+
+        Returns
+        -------
+        Scan
+        """
+        index = self.ms_level_time_index.find_time(time)
+        if index is None:
+            return None
+        return self.get_scan_by_index(index)
+
+    def start_from_scan(self, scan_id=None, rt=None, index=None, require_ms1=True, grouped=True):
+        if scan_id is not None:
+            scan = self.get_scan_by_id(scan_id)
+        elif rt is not None:
+            scan = self.get_scan_by_time(rt)
+        elif index is not None:
+            scan = self.get_scan_by_index(min(max(index, 0), len(self._ids) - 1))
+        else:
+            raise ValueError("Must provide a scan locator, one of (scan_id, rt, index)")
+        if require_ms1:
+            scan = self._locate_ms1_scan(scan)
+        start = scan.index
+        self.make_iterator(
+            (SpectrumStorePtr(i) for i in range(start, len(self._ids))), grouped=grouped)
+        return self
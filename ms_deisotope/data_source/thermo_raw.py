@@ -2,7 +2,6 @@
 import re
 import os
 
-from weakref import WeakValueDictionary
 from collections import OrderedDict, defaultdict
 
 import logging
@@ -14,6 +13,7 @@ from ms_deisotope.data_source.common import (
     Scan, PrecursorInformation, ScanBunch, ChargeNotProvided,
     ActivationInformation, IsolationWindow,
     component, ComponentGroup, InstrumentInformation)
+from ms_deisotope.data_source.scan_metadata import ScanMetadataTableBuilder
 
 from ms_deisotope.utils import Base
 
@@ -477,7 +477,7 @@ class ThermoRawLoader(ThermoRawDataInterface, RandomAccessScanSource, ScanIterat
         self._source = _ThermoRawFileAPI(self.source_file)
         self._producer = None
         self.make_iterator()
-        self._scan_cache = WeakValueDictionary()
+        self._initialize_scan_cache(kwargs.get("scan_cache"))
         self._index = self._pack_index()
         self._first_scan_time = self.get_scan_by_index(0).scan_time
         self._last_scan_time = self.get_scan_by_id(self._source.LastSpectrumNumber).scan_time
@@ -506,7 +506,7 @@ class ThermoRawLoader(ThermoRawDataInterface, RandomAccessScanSource, ScanIterat
 
     def reset(self):
         self.make_iterator(None)
-        self._scan_cache = WeakValueDictionary()
+        self._scan_cache.clear()
 
     def get_scan_by_id(self, scan_id):
         """Retrieve the scan object for the specified scan id.
@@ -608,6 +608,31 @@ class ThermoRawLoader(ThermoRawDataInterface, RandomAccessScanSource, ScanIterat
             self._producer = self._single_scan_iterator(iterator)
         return self
 
+    def _build_scan_metadata_table(self):
+        """Collect the metadata of every scan in :attr:`index`, reading the
+        total ion current and base peak from each scan's header instead of
+        its mass list.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        builder = ScanMetadataTableBuilder()
+        for scan_id, scan_number in self.index.items():
+            header = self._source.GetScanHeaderInfoForScanNum(scan_number)
+            scan = ThermoRawScanPtr(scan_number)
+            pinfo = self._precursor_information(scan)
+            activation = self._activation(scan)
+            builder.add(
+                scan_id, self._scan_index(scan), header['StartTime'], self._ms_level(scan),
+                self._polarity(scan), header['TIC'], header['BasePeakMass'],
+                header['BasePeakIntensity'],
+                pinfo.mz if pinfo is not None else None,
+                pinfo.charge if pinfo is not None else None,
+                self._isolation_window(scan),
+                activation.energy if activation is not None else None)
+        return builder.build()
+
     def _make_scan_index_producer(self, start_index=None, start_time=None):
         if start_index is not None:
             return range(start_index + 1, self._source.NumSpectra + 1)
@@ -3,9 +3,13 @@ import io
 import gzip
 import os
 
-from weakref import WeakValueDictionary
+
+import numpy as np
+
 from .common import (
-    ScanIterator, RandomAccessScanSource)
+    ScanIterator, RandomAccessScanSource, MSLevelTimeIndex)
+from .scan_metadata import ScanMetadataTableBuilder
+from ..utils import basestring
 from lxml import etree
 from lxml.etree import XMLSyntaxError
 from pyteomics import xml
@@ -24,6 +28,13 @@ def in_minutes(x):
 
 
 class XMLReaderBase(RandomAccessScanSource, ScanIterator):
+    #: A byte string which marks the end of the metadata describing a scan
+    #: in the XML document, before its binary data arrays. If :const:`None`,
+    #: :meth:`_build_ms_level_time_index` falls back to loading each scan.
+    _scan_header_terminator = None
+    _scan_header_block_size = 4096
+    _scan_header_max_size = 2 ** 16
+
     @property
     def index(self):
         return self._source._offset_index
@@ -49,7 +60,7 @@ class XMLReaderBase(RandomAccessScanSource, ScanIterator):
         except (IOError, AttributeError):
             pass
         self.make_iterator(None)
-        self._scan_cache = WeakValueDictionary()
+        self._scan_cache.clear()
 
     def _validate(self, scan):
         raise NotImplementedError()
@@ -92,13 +103,157 @@ class XMLReaderBase(RandomAccessScanSource, ScanIterator):
             return packed
 
     def _get_scan_by_id_raw(self, scan_id):
+        self._reopen_if_exhausted()
         return self._source.get_by_id(scan_id)
 
+    def _reopen_if_exhausted(self):
+        # The underlying parser closes its file once iteration over it is
+        # exhausted, which would break random access afterwards, for instance
+        # when the file has been read to its end ahead of the consumer.
+        try:
+            closed = self._source.closed
+        except (AttributeError, ValueError):
+            return
+        if closed:
+            self._source.reset()
+
+    def _read_scan_header(self, handle, offset):
+        handle.seek(offset)
+        header = b''
+        while len(header) < self._scan_header_max_size:
+            block = handle.read(self._scan_header_block_size)
+            if not block:
+                break
+            header += block
+            end = header.find(self._scan_header_terminator)
+            if end != -1:
+                return header[:end]
+        return header
+
+    def _parse_scan_header(self, header):
+        """Extract the MS level and scan time from the bytes at the start of
+        a scan's XML element, as read by :meth:`_read_scan_header`.
+
+        Parameters
+        ----------
+        header : bytes
+
+        Returns
+        -------
+        ms_level : int or None
+            The MS level of the scan, or :const:`None` if it could not be found
+            in `header`. ``0`` if the element is not a scan.
+        scan_time : float
+            The scan time in minutes
+        """
+        raise NotImplementedError()
+
+    def _parse_scan_metadata(self, header):
+        """Extract the metadata stored in a :meth:`scan_metadata_table` from
+        the bytes at the start of a scan's XML element, as read by
+        :meth:`_read_scan_header`.
+
+        Parameters
+        ----------
+        header : bytes
+
+        Returns
+        -------
+        dict or None
+            The keyword arguments of :meth:`~.ScanMetadataTableBuilder.add`
+            besides the scan id and index, or :const:`None` if the element
+            is not a scan. If the MS level or total ion current are missing,
+            the scan is loaded in full instead.
+        """
+        raise NotImplementedError()
+
+    def _iter_scan_headers(self):
+        """Iterate over the scan ids in :attr:`index` along with the bytes at the
+        start of each scan's XML element, as read by :meth:`_read_scan_header`.
+
+        Yields
+        ------
+        scan_id : str
+        header : bytes
+        """
+        handle = self._source._source
+        owns_handle = handle.closed
+        if owns_handle:
+            # The parser closes its file once iteration is exhausted, so read the
+            # headers through a fresh handle instead.
+            handle = io.open(self.source_file, 'rb')
+        position = handle.tell()
+        try:
+            for scan_id, offset in self.index.offsets.items():
+                yield scan_id.decode('utf-8'), self._read_scan_header(handle, offset)
+        finally:
+            if owns_handle:
+                handle.close()
+            else:
+                handle.seek(position)
+
+    def _build_ms_level_time_index(self):
+        """Collect the MS level and scan time of every scan in :attr:`index`
+        by reading only the metadata block at the start of each scan's XML
+        element, without decoding any scans.
+
+        Scans whose MS level cannot be found this way, for instance because
+        it is stored in a referenceable parameter group, are loaded in full.
+
+        Returns
+        -------
+        MSLevelTimeIndex
+        """
+        if self._scan_header_terminator is None or not self._use_index:
+            return super(XMLReaderBase, self)._build_ms_level_time_index()
+        n = len(self.index.offsets)
+        ms_levels = np.zeros(n, dtype=np.int16)
+        scan_times = np.zeros(n, dtype=np.float64)
+        for i, (scan_id, header) in enumerate(self._iter_scan_headers()):
+            ms_level, scan_time = self._parse_scan_header(header)
+            if ms_level is None:
+                try:
+                    scan = self.get_scan_by_id(scan_id)
+                    ms_level, scan_time = scan.ms_level, scan.scan_time
+                except KeyError:
+                    ms_level, scan_time = 0, np.nan
+            ms_levels[i] = ms_level
+            scan_times[i] = scan_time
+        return MSLevelTimeIndex(ms_levels, scan_times)
+
+    def _build_scan_metadata_table(self):
+        """Collect the metadata of every scan in :attr:`index` from the metadata
+        block at the start of each scan's XML element, without decoding any
+        signal arrays where the file records the total ion current and base peak.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        if self._scan_header_terminator is None or not self._use_index:
+            return super(XMLReaderBase, self)._build_scan_metadata_table()
+        builder = ScanMetadataTableBuilder()
+        for i, (scan_id, header) in enumerate(self._iter_scan_headers()):
+            metadata = self._parse_scan_metadata(header)
+            if metadata is None:
+                builder.add_missing(scan_id, i)
+                continue
+            if metadata.get('ms_level') is None or metadata.get('tic') is None:
+                try:
+                    builder.add_scan(self.get_scan_by_id(scan_id))
+                except KeyError:
+                    builder.add_missing(scan_id, i)
+                continue
+            builder.add(scan_id, i, **metadata)
+        return builder.build()
+
     def get_scan_by_time(self, time):
         """Retrieve the scan object for the specified scan time.
 
         This internally calls :meth:`get_scan_by_id` which will
-        use its cache.
+        use its cache. If the :attr:`ms_level_time_index` has
+        already been built, the scan is located using it instead
+        of a binary search over parsed scans.
 
         Parameters
         ----------
@@ -109,6 +264,8 @@ class XMLReaderBase(RandomAccessScanSource, ScanIterator):
         -------
         Scan
         """
+        if self._ms_level_time_index is not None:
+            return self.get_scan_by_index(self._ms_level_time_index.find_time(time))
         scan_ids = tuple(self.index)
         lo = 0
         hi = len(scan_ids)
@@ -187,6 +344,7 @@ class XMLReaderBase(RandomAccessScanSource, ScanIterator):
             scan = self._locate_ms1_scan(scan)
             scan_id = scan.id
 
+        self._reopen_if_exhausted()
         iterator = self._yield_from_index(self._source, scan_id)
         self.make_iterator(iterator, grouped=grouped)
         return self
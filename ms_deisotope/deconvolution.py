@@ -7,10 +7,12 @@ from ms_peak_picker import FittedPeak
 from .averagine import (
     AveragineCache, peptide, glycopeptide, glycan, neutral_mass, isotopic_variants,
     isotopic_shift, PROTON, shift_isotopic_pattern)
-from .peak_set import DeconvolutedPeak, DeconvolutedPeakSolution, DeconvolutedPeakSet
+from .peak_set import DeconvolutedPeak, DeconvolutedPeakSolution, DeconvolutedPeakSet, merge_isobaric_peaks
 from .scoring import IsotopicFitRecord, penalized_msdeconv
 from .utils import range, Base, TrivialTargetedDeconvolutionResult, DeconvolutionProcessResult
 from .envelope_statistics import a_to_a2_ratio, average_mz, most_abundant_mz
+from .neighbor_table import IsotopicNeighborTable
+from .profiling import DeconvolutionProfile, phase_timer, timer
 from .peak_dependency_network import PeakDependenceGraph, NetworkedTargetedDeconvolutionResult
 from .constants import (
     TRUNCATE_AFTER,
@@ -171,6 +173,10 @@ class DeconvoluterBase(Base):
     merge_isobaric_peaks : bool
         If multiple passes produce peaks with identical mass values,
         should those peaks be summed
+    isobaric_merge_tolerance : float
+        The parts-per-million error tolerance within which peaks of the same
+        charge are considered identical when merging isobaric peaks. Defaults
+        to 0, only merging exactly equal masses
     minimum_intensity : float
         Experimental peaks whose intensity is below this level will be ignored
         by peak querying methods
@@ -187,6 +193,7 @@ class DeconvoluterBase(Base):
     use_subtraction = False
     scale_method = 'sum'
     merge_isobaric_peaks = True
+    isobaric_merge_tolerance = 0.
     minimum_intensity = 5.
     verbose = False
 
@@ -322,19 +329,7 @@ class DeconvoluterBase(Base):
                     match.intensity = 1.
 
     def _merge_peaks(self, peak_list):
-        peak_list = sorted(peak_list, key=operator.attrgetter("neutral_mass"))
-        if not peak_list:
-            return []
-        current_peak = peak_list[0]
-        merged_peaks = []
-        for peak in peak_list[1:]:
-            if current_peak.neutral_mass == peak.neutral_mass and current_peak.charge == peak.charge:
-                current_peak.intensity += peak.intensity
-            else:
-                merged_peaks.append(current_peak)
-                current_peak = peak
-        merged_peaks.append(current_peak)
-        return merged_peaks
+        return merge_isobaric_peaks(peak_list, self.isobaric_merge_tolerance)
 
     def _find_next_putative_peak(self, mz, charge, step=1, tolerance=ERROR_TOLERANCE):
         """
@@ -540,6 +535,22 @@ class ExhaustivePeakSearchDeconvoluterBase(object):
     and `_fit_peaks_at_charges`
 
     """
+    _neighbor_table = None
+
+    def _get_neighbor_table(self):
+        """Get the :class:`~.IsotopicNeighborTable` for :attr:`peaklist`, building
+        it if :attr:`peaklist` has not been indexed yet.
+
+        Returns
+        -------
+        IsotopicNeighborTable
+        """
+        table = self._neighbor_table
+        if table is None or not table.is_indexed(self.peaklist):
+            table = self._neighbor_table = IsotopicNeighborTable(self.peaklist)
+        table.minimum_intensity = self.minimum_intensity
+        return table
+
     def _update_charge_bounds_with_prediction(self, peak, charge_range):
         """Update the charge range upper limit in `charge_range` based upon the
         Fourier-Patterson charge state estimate for `peak`
@@ -599,6 +610,12 @@ class ExhaustivePeakSearchDeconvoluterBase(object):
         set
             The set of all unique candidate (monoisotopic peak, charge state)
         """
+        table = self._get_neighbor_table()
+        if table.contains(peak):
+            return self._get_all_peak_charge_pairs_from_table(
+                table, peak, error_tolerance, charge_range, left_search_limit,
+                right_search_limit, use_charge_state_hint, recalculate_starting_peak)
+
         if use_charge_state_hint:
             charge_range = self._update_charge_bounds_with_prediction(
                 peak, charge_range)
@@ -641,6 +658,64 @@ class ExhaustivePeakSearchDeconvoluterBase(object):
 
         return target_peaks
 
+    def _get_all_peak_charge_pairs_from_table(self, table, peak, error_tolerance=ERROR_TOLERANCE,
+                                              charge_range=(1, 8), left_search_limit=3,
+                                              right_search_limit=3, use_charge_state_hint=False,
+                                              recalculate_starting_peak=True):
+        """The same search as :meth:`_get_all_peak_charge_pairs`, answered by looking up
+        `peak`'s neighbors in a precomputed :class:`~.IsotopicNeighborTable` rather than
+        searching :attr:`peaklist` for every charge and step.
+
+        Parameters
+        ----------
+        table : IsotopicNeighborTable
+            The neighbor table for :attr:`peaklist`, which must contain `peak`
+
+        See Also
+        --------
+        :meth:`_get_all_peak_charge_pairs`
+
+        Returns
+        -------
+        set
+            The set of all unique candidate (monoisotopic peak, charge state)
+        """
+        if use_charge_state_hint:
+            charge_range = self._update_charge_bounds_with_prediction(
+                peak, charge_range)
+
+        target_peaks = set()
+        if self.verbose:
+            info("Considering charge range %r for %r" %
+                 (list(charge_range_(*charge_range)), peak))
+        for charge in charge_range_(*charge_range):
+            target_peaks.add((peak, charge))
+
+            # Look Left
+            for i in range(1, left_search_limit):
+                prev_peak = table.find(peak, charge, -i)
+                target_peaks.add((prev_peak, charge))
+
+                if recalculate_starting_peak:
+                    target_peaks.update(table.find_previous_putative_peak(
+                        peak, charge, i, 2 * error_tolerance))
+
+            # Look Right
+            for i in range(1, right_search_limit):
+                nxt_peak = table.find(peak, charge, i)
+                target_peaks.add((nxt_peak, charge))
+
+                if recalculate_starting_peak:
+                    target_peaks.update(table.find_next_putative_peak(
+                        peak, charge, i, 2 * error_tolerance))
+
+            if recalculate_starting_peak:
+                for i in range(min(left_search_limit, 2)):
+                    target_peaks.update(table.find_next_putative_peak(
+                        peak, charge, step=i, tolerance=2 * error_tolerance))
+
+        return target_peaks
+
     def _fit_all_charge_states(self, peak, error_tolerance=ERROR_TOLERANCE, charge_range=(1, 8), left_search_limit=3,
                                right_search_limit=3, use_charge_state_hint=False,
                                recalculate_starting_peak=True, charge_carrier=PROTON,
@@ -1104,7 +1179,12 @@ class PeakDependenceGraphDeconvoluterBase(ExhaustivePeakSearchDeconvoluterBase):
     peak_dependency_network : PeakDependenceGraph
         The peak dependence graph onto which isotopic fit dependences on peaks
         are constructed and solved.
+    profiler : :class:`~.DeconvolutionProfile` or None
+        If not :const:`None`, the per-phase timings, fit counts and cluster sizes
+        of this deconvolution are recorded into it. Defaults to :const:`None`
     """
+    profiler = None
+
     def __init__(self, peaklist, *args, **kwargs):
         max_missed_peaks = kwargs.pop("max_missed_peaks", 1)
         ExhaustivePeakSearchDeconvoluterBase.__init__(self)
@@ -1193,6 +1273,9 @@ class PeakDependenceGraphDeconvoluterBase(ExhaustivePeakSearchDeconvoluterBase):
             self.peak_dependency_network.add_fit_dependence(candidate)
             results.discard(candidate)
 
+        if self.profiler is not None:
+            self.profiler.count("fits_explored", n)
+            self.profiler.count("fits_kept", n - len(results))
         return i
 
     def populate_graph(self, error_tolerance=ERROR_TOLERANCE, charge_range=(1, 8), left_search_limit=1,
@@ -1252,7 +1335,11 @@ class PeakDependenceGraphDeconvoluterBase(ExhaustivePeakSearchDeconvoluterBase):
             The mass of the charge carrier as used for the deconvolution. Required to
             back-out the neutral mass of the deconvoluted result
         """
-        disjoint_envelopes = self.peak_dependency_network.find_non_overlapping_intervals()
+        profiler = self.profiler
+        with phase_timer(profiler, "find_non_overlapping_intervals"):
+            disjoint_envelopes = self.peak_dependency_network.find_non_overlapping_intervals()
+        if profiler is not None:
+            profiler.add_clusters(disjoint_envelopes)
         i = 0
         for cluster in disjoint_envelopes:
             disjoint_best_fits = cluster.disjoint_best_fits()
@@ -1286,7 +1373,12 @@ class PeakDependenceGraphDeconvoluterBase(ExhaustivePeakSearchDeconvoluterBase):
                 self._deconvoluted_peaks.append(dpeak)
                 i += 1
                 if self.use_subtraction:
-                    self.subtraction(tid, error_tolerance)
+                    if profiler is not None:
+                        start = timer()
+                        self.subtraction(tid, error_tolerance)
+                        profiler.add_time("subtraction", timer() - start)
+                    else:
+                        self.subtraction(tid, error_tolerance)
 
     def targeted_deconvolution(self, peak, error_tolerance=ERROR_TOLERANCE, charge_range=(1, 8),
                                use_charge_state_hint=False,
@@ -1378,19 +1470,24 @@ class PeakDependenceGraphDeconvoluterBase(ExhaustivePeakSearchDeconvoluterBase):
         if not self.use_subtraction:
             iterations = 1
 
+        profiler = self.profiler
         begin_signal = sum([p.intensity for p in self.peaklist])
         for i in range(iterations):
             self.peak_dependency_network.reset()
-            self.populate_graph(
-                error_tolerance=error_tolerance, charge_range=charge_range,
-                left_search_limit=left_search_limit, right_search_limit=right_search_limit,
-                use_charge_state_hint=use_charge_state_hint, charge_carrier=charge_carrier,
-                truncate_after=truncate_after, ignore_below=ignore_below)
+            with phase_timer(profiler, "populate_graph"):
+                self.populate_graph(
+                    error_tolerance=error_tolerance, charge_range=charge_range,
+                    left_search_limit=left_search_limit, right_search_limit=right_search_limit,
+                    use_charge_state_hint=use_charge_state_hint, charge_carrier=charge_carrier,
+                    truncate_after=truncate_after, ignore_below=ignore_below)
             self.postprocess_fits(
                 charge_range=charge_range,
                 charge_carrier=charge_carrier,
                 error_tolerance=error_tolerance)
-            self.select_best_disjoint_subgraphs(error_tolerance, charge_carrier)
+            with phase_timer(profiler, "select_best_disjoint_subgraphs"):
+                self.select_best_disjoint_subgraphs(error_tolerance, charge_carrier)
+            if profiler is not None:
+                profiler.count("iterations")
             self._slice_cache.clear()
             end_signal = sum([p.intensity for p in self.peaklist]) + 1
 
@@ -1770,7 +1867,32 @@ def deconvolute_peaks(peaklist,
                       use_charge_state_hint_for_priorities=False, left_search_limit=3, right_search_limit=3,
                       left_search_limit_for_priorities=None, right_search_limit_for_priorities=None,
                       verbose_priorities=False, verbose=False, charge_carrier=PROTON, truncate_after=TRUNCATE_AFTER,
-                      deconvoluter_type=AveraginePeakDependenceGraphDeconvoluter, **kwargs):
+                      deconvoluter_type=AveraginePeakDependenceGraphDeconvoluter, profile=False, **kwargs):
+    """Deconvolute `peaklist` with `deconvoluter_type`, first extracting solutions for
+    each entry in `priority_list`.
+
+    Parameters
+    ----------
+    peaklist : PeakSet or list of FittedPeak
+        The centroided peaks to deconvolute
+    decon_config : dict, optional
+        Keyword arguments used to construct the deconvoluter
+    charge_range : tuple, optional
+        The range of charge states to consider. Defaults to (1, 8)
+    error_tolerance : float, optional
+        The parts-per-million error tolerance in m/z to search with
+    priority_list : list, optional
+        Peaks or :class:`~.PriorityTarget` instances which must be deconvoluted
+    profile : bool or :class:`~.DeconvolutionProfile`, optional
+        Whether to record a :class:`~.DeconvolutionProfile` of the work done. If a
+        profile instance is passed, it is recorded into directly. Defaults to :const:`False`
+    **kwargs
+        Forwarded to the deconvoluter's constructor
+
+    Returns
+    -------
+    DeconvolutionProcessResult
+    """
     if priority_list is None:
         priority_list = []
     if left_search_limit_for_priorities is None:
@@ -1782,12 +1904,22 @@ def deconvolute_peaks(peaklist,
     decon_config.update(kwargs)
     decon_config.setdefault("use_subtraction", True)
     decon_config.setdefault("scale_method", SCALE_METHOD)
+    start = timer()
     decon = deconvoluter_type(peaklist=peaklist, **decon_config)
 
+    profiler = None
+    if profile:
+        profiler = profile if isinstance(profile, DeconvolutionProfile) else DeconvolutionProfile()
+        decon.profiler = profiler
+        cache_state = profiler.averagine_cache_state(decon)
+        profiler.add_time("setup", timer() - start)
+
     if verbose_priorities or verbose:
         decon.verbose = True
 
     priority_list_results = []
+    if profiler is not None:
+        start = timer()
     for p in priority_list:
         try:
             target_info = p
@@ -1806,13 +1938,16 @@ def deconvolute_peaks(peaklist,
             charge_carrier=charge_carrier,
             truncate_after=truncate_after)
         priority_list_results.append(priority_result)
+    if profiler is not None:
+        profiler.add_time("targeted_deconvolution", timer() - start)
 
     if verbose_priorities and not verbose:
         decon.verbose = False
 
-    deconvoluted_peaks = decon.deconvolute(
-        error_tolerance=error_tolerance, charge_range=charge_range, left_search_limit=left_search_limit,
-        right_search_limit=right_search_limit, charge_carrier=charge_carrier, truncate_after=truncate_after)
+    with phase_timer(profiler, "deconvolute"):
+        deconvoluted_peaks = decon.deconvolute(
+            error_tolerance=error_tolerance, charge_range=charge_range, left_search_limit=left_search_limit,
+            right_search_limit=right_search_limit, charge_carrier=charge_carrier, truncate_after=truncate_after)
 
     acc = []
     errors = []
@@ -1827,5 +1962,10 @@ def deconvolute_peaks(peaklist,
 
     priority_list_results = acc
 
+    if profiler is not None:
+        profiler.record_averagine_cache_usage(cache_state)
+        profiler.count("spectra")
+        profiler.count("peaks_deconvoluted", len(deconvoluted_peaks))
+
     return DeconvolutionProcessResult(
-        decon, deconvoluted_peaks, priority_list_results, errors)
+        decon, deconvoluted_peaks, priority_list_results, errors, profile=profiler)
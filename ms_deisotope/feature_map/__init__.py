@@ -1,2 +1,3 @@
 from .scan_interval_tree import ScanIntervalTree
-from .scan_index import ExtendedScanIndex
+from .scan_index import (
+    ExtendedScanIndex, ExtendedScanIndexWriter, LazyExtendedScanIndex, PrecursorMassIndex)
@@ -1,10 +1,153 @@
 import json
+import threading
 from collections import OrderedDict
 
+import numpy as np
+
 from ms_deisotope.averagine import neutral_mass
 from ms_deisotope.data_source.common import PrecursorInformation, ChargeNotProvided
 
 
+def _package_product_scan(product):
+    precursor_information = product.precursor_information
+    if precursor_information.extracted_neutral_mass != 0:
+        charge = precursor_information.extracted_charge
+        if charge == ChargeNotProvided:
+            charge = 'ChargeNotProvided'
+        package = {
+            "neutral_mass": precursor_information.extracted_neutral_mass,
+            "mz": precursor_information.extracted_mz,
+            "intensity": precursor_information.extracted_intensity,
+            "charge": charge,
+            "precursor_scan_id": precursor_information.precursor_scan_id,
+            "product_scan_id": product.id,
+            "scan_time": product.scan_time,
+            "defaulted": precursor_information.defaulted,
+            "orphan": precursor_information.orphan
+        }
+    else:
+        charge = precursor_information.extracted_charge
+        if charge == ChargeNotProvided:
+            charge = 'ChargeNotProvided'
+        package = {
+            "neutral_mass": precursor_information.neutral_mass,
+            "mz": precursor_information.mz,
+            "intensity": precursor_information.intensity,
+            "charge": charge,
+            "precursor_scan_id": precursor_information.precursor_scan_id,
+            "product_scan_id": product.id,
+            "scan_time": product.scan_time,
+            "defaulted": precursor_information.defaulted,
+            "orphan": precursor_information.orphan
+        }
+    return package
+
+
+def _package_precursor_scan(bunch):
+    return {
+        "scan_time": bunch.precursor.scan_time,
+        "product_scan_ids": [
+            product.id for product in bunch.products
+        ],
+        "msms_peaks": [
+            p.index.neutral_mass for p in bunch.precursor.deconvoluted_peak_set
+            if p.chosen_for_msms
+        ] if bunch.precursor.deconvoluted_peak_set is not None else [],
+    }
+
+
+def _charge_value(charge):
+    try:
+        return int(charge)
+    except (TypeError, ValueError):
+        return 0
+
+
+class PrecursorMassIndex(object):
+    """The precursor neutral mass, scan time and charge of each MSn scan in an
+    extended scan index, as columns sorted by neutral mass, so that scans can
+    be found by precursor mass with a binary search.
+
+    Parameters
+    ----------
+    neutral_mass : Sequence of float
+    scan_time : Sequence of float
+    charge : Sequence of int
+    scan_ids : Sequence of str
+        The id of each MSn scan
+
+    Attributes
+    ----------
+    neutral_mass : np.ndarray
+        The precursor neutral masses, in ascending order
+    scan_time : np.ndarray
+        The scan time of each MSn scan
+    charge : np.ndarray
+        The precursor charge of each MSn scan, 0 when it is not known
+    scan_ids : list
+        The id of each MSn scan
+    """
+
+    def __init__(self, neutral_mass, scan_time, charge, scan_ids):
+        neutral_mass = np.asarray(neutral_mass, dtype=np.float64)
+        order = np.argsort(neutral_mass, kind='mergesort')
+        self.neutral_mass = neutral_mass[order]
+        self.scan_time = np.asarray(scan_time, dtype=np.float64)[order]
+        self.charge = np.asarray(charge, dtype=np.int32)[order]
+        self.scan_ids = [scan_ids[i] for i in order]
+
+    def __len__(self):
+        return len(self.scan_ids)
+
+    @classmethod
+    def from_records(cls, msn_ids):
+        """Build an index from a mapping of MSn scan id to the record
+        :class:`ExtendedScanIndex` holds for it
+
+        Parameters
+        ----------
+        msn_ids : Mapping
+
+        Returns
+        -------
+        PrecursorMassIndex
+        """
+        scan_ids = list(msn_ids.keys())
+        records = [msn_ids[key] for key in scan_ids]
+        return cls([r['neutral_mass'] for r in records], [r['scan_time'] for r in records],
+                   [_charge_value(r['charge']) for r in records], scan_ids)
+
+    def find(self, neutral_mass, mass_error_tolerance=1e-5, start_time=None, end_time=None):
+        """Find the MSn scans whose precursor neutral mass is within `mass_error_tolerance`
+        of `neutral_mass`, and optionally which were acquired between `start_time` and
+        `end_time`, inclusive.
+
+        Parameters
+        ----------
+        neutral_mass : float
+        mass_error_tolerance : float
+        start_time : float, optional
+        end_time : float, optional
+
+        Returns
+        -------
+        list of str
+            The matching scan ids, in order of precursor neutral mass
+        """
+        w = neutral_mass * mass_error_tolerance
+        lo = np.searchsorted(self.neutral_mass, neutral_mass - w, side='left')
+        hi = np.searchsorted(self.neutral_mass, neutral_mass + w, side='right')
+        if start_time is None and end_time is None:
+            return self.scan_ids[lo:hi]
+        times = self.scan_time[lo:hi]
+        mask = np.ones(len(times), dtype=bool)
+        if start_time is not None:
+            mask &= times >= start_time
+        if end_time is not None:
+            mask &= times <= end_time
+        return [self.scan_ids[i] for i in np.flatnonzero(mask) + lo]
+
+
 class ExtendedScanIndex(object):
     SCHEMA_VERSION = "1.0"
 
@@ -18,6 +161,7 @@ class ExtendedScanIndex(object):
         self.ms1_ids = OrderedDict(ms1_ids)
         self.msn_ids = OrderedDict(msn_ids)
         self.schema_version = schema_version
+        self._precursor_mass_index = None
 
     def get_scan_dict(self, key):
         try:
@@ -28,53 +172,36 @@ class ExtendedScanIndex(object):
     def __getitem__(self, key):
         return self.get_scan_dict(key)
 
-    def _package_precursor_information(self, product):
-        precursor_information = product.precursor_information
-        if precursor_information.extracted_neutral_mass != 0:
-            charge = precursor_information.extracted_charge
-            if charge == ChargeNotProvided:
-                charge = 'ChargeNotProvided'
-            package = {
-                "neutral_mass": precursor_information.extracted_neutral_mass,
-                "mz": precursor_information.extracted_mz,
-                "intensity": precursor_information.extracted_intensity,
-                "charge": charge,
-                "precursor_scan_id": precursor_information.precursor_scan_id,
-                "product_scan_id": product.id,
-                "scan_time": product.scan_time,
-                "defaulted": precursor_information.defaulted,
-                "orphan": precursor_information.orphan
-            }
-        else:
-            charge = precursor_information.extracted_charge
-            if charge == ChargeNotProvided:
-                charge = 'ChargeNotProvided'
-            package = {
-                "neutral_mass": precursor_information.neutral_mass,
-                "mz": precursor_information.mz,
-                "intensity": precursor_information.intensity,
-                "charge": charge,
-                "precursor_scan_id": precursor_information.precursor_scan_id,
-                "product_scan_id": product.id,
-                "scan_time": product.scan_time,
-                "defaulted": precursor_information.defaulted,
-                "orphan": precursor_information.orphan
-            }
-        return package
+    _package_precursor_information = staticmethod(_package_product_scan)
 
     def add_scan_bunch(self, bunch):
-        self.ms1_ids[bunch.precursor.id] = {
-            "scan_time": bunch.precursor.scan_time,
-            "product_scan_ids": [
-                product.id for product in bunch.products
-            ],
-            "msms_peaks": [
-                p.index.neutral_mass for p in bunch.precursor.deconvoluted_peak_set
-                if p.chosen_for_msms
-            ] if bunch.precursor.deconvoluted_peak_set is not None else [],
-        }
+        self.ms1_ids[bunch.precursor.id] = _package_precursor_scan(bunch)
         for product in bunch.products:
-            self.msn_ids[product.id] = self._package_precursor_information(product)
+            self.msn_ids[product.id] = _package_product_scan(product)
+        self._precursor_mass_index = None
+
+    def precursor_mass_index(self):
+        """The :class:`PrecursorMassIndex` of the MSn scans in this index,
+        which is built on first use and kept until more scans are added.
+
+        Returns
+        -------
+        PrecursorMassIndex
+        """
+        if self._precursor_mass_index is None:
+            self._precursor_mass_index = PrecursorMassIndex.from_records(self.msn_ids)
+        return self._precursor_mass_index
+
+    def scan_times(self):
+        """Map each scan id to its scan time
+
+        Returns
+        -------
+        dict
+        """
+        times = {key: info['scan_time'] for key, info in self.ms1_ids.items()}
+        times.update((key, info['scan_time']) for key, info in self.msn_ids.items())
+        return times
 
     def serialize(self, handle):
         mapping = {
@@ -99,29 +226,188 @@ class ExtendedScanIndex(object):
         mapping = json.load(handle)
         return cls(**mapping)
 
+    def _make_precursor_information(self, info, bind=None):
+        charge = info['charge']
+        return PrecursorInformation(
+            info['mz'], info['intensity'], charge, info['precursor_scan_id'],
+            bind, info['neutral_mass'], charge, info['intensity'],
+            product_scan_id=info['product_scan_id'], orphan=info.get('orphan', False),
+            defaulted=info.get('defaulted', False))
+
     def get_precursor_information(self, bind=None):
-        out = []
-        for key, info in self.msn_ids.items():
-            mz = info['mz']
-            neutral_mass = info['neutral_mass']
-            charge = info['charge']
-            intensity = info['intensity']
-            precursor_scan_id = info['precursor_scan_id']
-            product_scan_id = info['product_scan_id']
-            pinfo = PrecursorInformation(
-                mz, intensity, charge, precursor_scan_id,
-                bind, neutral_mass, charge, intensity,
-                product_scan_id=product_scan_id)
-            out.append(pinfo)
-        return out
-
-    def find_msms_by_precursor_mass(self, neutral_mass, mass_error_tolerance=1e-5, bind=None):
-        m = neutral_mass
-        w = neutral_mass * mass_error_tolerance
-        lo = m - w
-        hi = m + w
-        out = []
-        for pinfo in self.get_precursor_information(bind):
-            if lo <= pinfo.neutral_mass <= hi:
-                out.append(pinfo)
-        return out
+        return [self._make_precursor_information(info, bind) for info in self.msn_ids.values()]
+
+    def find_msms_by_precursor_mass(self, neutral_mass, mass_error_tolerance=1e-5, bind=None,
+                                    start_time=None, end_time=None):
+        scan_ids = self.precursor_mass_index().find(
+            neutral_mass, mass_error_tolerance, start_time, end_time)
+        return [self._make_precursor_information(self.msn_ids[scan_id], bind) for scan_id in scan_ids]
+
+
+class ExtendedScanIndexWriter(object):
+    """Writes an extended scan index to a file incrementally, one line per scan,
+    as scan bunches are added, instead of holding the whole index in memory.
+
+    Each line holds the kind of scan, ``ms1`` or ``msn``, its id, scan time,
+    precursor neutral mass and charge, separated by tabs, followed by the JSON record
+    :class:`ExtendedScanIndex` would hold for it. The leading columns let
+    :class:`LazyExtendedScanIndex` load the file without parsing any JSON. Files
+    of schema version 2.0 lack the charge column.
+
+    Parameters
+    ----------
+    handle : file
+        A file opened for writing text
+    """
+    FORMAT_MARKER = "#ms_deisotope-extended-scan-index"
+    SCHEMA_VERSION = "2.1"
+
+    #: The number of columns before the JSON record in each version of the format
+    LEADING_COLUMNS = {
+        "2.0": 4,
+        "2.1": 5,
+    }
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.schema_version = self.SCHEMA_VERSION
+        self.handle.write("%s\t%s\n" % (self.FORMAT_MARKER, self.schema_version))
+
+    def _write_record(self, kind, scan_id, record, neutral_mass=None, charge=None):
+        self.handle.write("%s\t%s\t%r\t%s\t%s\t%s\n" % (
+            kind, scan_id, float(record['scan_time']),
+            '' if neutral_mass is None else repr(float(neutral_mass)),
+            '' if charge is None else _charge_value(charge),
+            json.dumps(record)))
+
+    def add_scan_bunch(self, bunch):
+        self._write_record("ms1", bunch.precursor.id, _package_precursor_scan(bunch))
+        for product in bunch.products:
+            record = _package_product_scan(product)
+            self._write_record("msn", product.id, record, record['neutral_mass'], record['charge'])
+
+    def flush(self):
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+    @staticmethod
+    def index_file_name(name):
+        return name + '-idx.tsv'
+
+
+class _IndexRecordMap(object):
+    """A read-only mapping from scan id to the record describing that scan
+    in a :class:`LazyExtendedScanIndex`, parsed from the file when accessed.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.offsets = OrderedDict()
+
+    def __getitem__(self, key):
+        return self.index._read_record(self.offsets[key])
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def values(self):
+        return [self[key] for key in self.offsets]
+
+    def items(self):
+        return [(key, self[key]) for key in self.offsets]
+
+
+class LazyExtendedScanIndex(ExtendedScanIndex):
+    """Reads an extended scan index written by :class:`ExtendedScanIndexWriter`.
+
+    Opening the index only reads the leading columns of each line, from which
+    the :class:`PrecursorMassIndex` is built. The record of each scan is parsed
+    when it is looked up, so :meth:`find_msms_by_precursor_mass` only reads the
+    records in the mass window.
+
+    Parameters
+    ----------
+    path : str
+        The path to the index file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ms1_ids = _IndexRecordMap(self)
+        self.msn_ids = _IndexRecordMap(self)
+        self._scan_times = {}
+        self._handle = open(path, 'rb')
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        header = self._handle.readline()
+        fields = header.decode('utf8').rstrip('\n').split('\t')
+        if fields[0] != ExtendedScanIndexWriter.FORMAT_MARKER:
+            self.close()
+            raise ValueError("%r is not an extended scan index file" % (self.path,))
+        self.schema_version = fields[1]
+        try:
+            self._leading_columns = ExtendedScanIndexWriter.LEADING_COLUMNS[self.schema_version]
+        except KeyError:
+            self.close()
+            raise ValueError("%r has unsupported extended scan index schema version %r" % (
+                self.path, self.schema_version))
+        n = self._leading_columns
+        offset = len(header)
+        masses = []
+        times = []
+        charges = []
+        msn_ids = []
+        for line in self._handle:
+            # A run which was interrupted may leave a partial last line behind
+            if not line.endswith(b'\n'):
+                break
+            fields = line.split(b'\t', n)
+            kind, scan_id, scan_time, neutral_mass = fields[:4]
+            scan_id = scan_id.decode('utf8')
+            scan_time = float(scan_time)
+            self._scan_times[scan_id] = scan_time
+            if kind == b'ms1':
+                self.ms1_ids.offsets[scan_id] = offset
+            else:
+                self.msn_ids.offsets[scan_id] = offset
+                masses.append(float(neutral_mass))
+                times.append(scan_time)
+                if n > 4:
+                    charges.append(int(fields[4]))
+                else:
+                    charges.append(_charge_value(json.loads(fields[n].decode('utf8'))['charge']))
+                msn_ids.append(scan_id)
+            offset += len(line)
+        self._precursor_mass_index = PrecursorMassIndex(masses, times, charges, msn_ids)
+
+    def _read_record(self, offset):
+        with self._lock:
+            self._handle.seek(offset)
+            line = self._handle.readline()
+        n = self._leading_columns
+        return json.loads(line.split(b'\t', n)[n].decode('utf8'))
+
+    def scan_times(self):
+        return dict(self._scan_times)
+
+    def close(self):
+        self._handle.close()
@@ -0,0 +1,174 @@
+import numpy as np
+
+from ms_peak_picker import FittedPeak
+
+from .averagine import isotopic_shift
+from .constants import ERROR_TOLERANCE
+from .utils import ppm_error
+
+
+class IsotopicNeighborTable(object):
+    """A precomputed lookup table from each peak in a peak list to the peaks
+    which could be its isotopic neighbors at a given charge state and step.
+
+    For each (charge, step) pair, the expected position of every peak's
+    neighbor is computed at once and located in the sorted m/z array with
+    a single vectorized :func:`numpy.searchsorted` sweep. Only the range of
+    candidate positions is stored, so the table remains valid when peak
+    intensities change during subtraction. When more than one peak falls
+    within the tolerance window, the choice between them is delegated to
+    the peak list's own :meth:`has_peak` so the result is always the same
+    as :meth:`~.DeconvoluterBase.has_peak`.
+
+    Rows are computed lazily the first time a (charge, step, tolerance)
+    combination is requested, and reused for every subsequent lookup in
+    the same peak list.
+
+    Attributes
+    ----------
+    peaklist : PeakIndex or PeakSet
+        The peak list this table indexes
+    peaks : tuple
+        The peaks of the indexed peak list, sorted by m/z
+    mzs : np.ndarray
+        The m/z of each peak in :attr:`peaks`
+    minimum_intensity : float
+        Peaks below this intensity are treated as missing by :meth:`find`
+    """
+
+    def __init__(self, peaklist, minimum_intensity=5.):
+        self.peaklist = peaklist
+        self.peak_set = getattr(peaklist, "peaks", peaklist)
+        self.peaks = tuple(self.peak_set)
+        self.mzs = np.array([p.mz for p in self.peaks], dtype=np.float64)
+        self.minimum_intensity = minimum_intensity
+        self._match_ranges = {}
+        self._slice_ranges = {}
+
+    def __len__(self):
+        return len(self.peaks)
+
+    def __repr__(self):
+        return "%s(%d peaks)" % (self.__class__.__name__, len(self))
+
+    def is_indexed(self, peaklist):
+        """Check whether this table was built from `peaklist`
+        """
+        return getattr(peaklist, "peaks", peaklist) is self.peak_set
+
+    def contains(self, peak):
+        """Check whether `peak` is a member of the indexed peak list,
+        at the position given by its :attr:`peak_count`.
+        """
+        i = peak.peak_count
+        return 0 <= i < len(self.peaks) and self.peaks[i] is peak
+
+    def _match_range(self, charge, step, error_tolerance):
+        key = (charge, step, error_tolerance)
+        try:
+            return self._match_ranges[key]
+        except KeyError:
+            query = self.mzs + isotopic_shift(charge) * step
+            lo = np.searchsorted(self.mzs, query / (1 + error_tolerance), 'left')
+            hi = np.searchsorted(self.mzs, query / (1 - error_tolerance), 'right')
+            ranges = self._match_ranges[key] = (lo, hi)
+            return ranges
+
+    def _slice_range(self, charge, step, tolerance):
+        key = (charge, step, tolerance)
+        try:
+            return self._slice_ranges[key]
+        except KeyError:
+            query = self.mzs + isotopic_shift(charge) * step
+            lo = np.searchsorted(self.mzs, query - query * tolerance, 'left')
+            hi = np.searchsorted(self.mzs, query + query * tolerance, 'right')
+            ranges = self._slice_ranges[key] = (lo, hi)
+            return ranges
+
+    def find(self, peak, charge, step, error_tolerance=ERROR_TOLERANCE):
+        """Find the peak `step` isotopic positions away from `peak` at `charge`.
+
+        A negative `step` looks for preceding peaks. Mirrors
+        :func:`~.has_previous_peak_at_charge` and :func:`~.has_successor_peak_at_charge`,
+        returning a placeholder peak when no peak above :attr:`minimum_intensity`
+        is found.
+
+        Parameters
+        ----------
+        peak : FittedPeak
+            A peak from the indexed peak list
+        charge : int
+            The charge state to step at
+        step : int
+            The number of isotopic positions to step
+        error_tolerance : float, optional
+            The parts-per-million error tolerance for a match
+
+        Returns
+        -------
+        FittedPeak
+        """
+        i = peak.peak_count
+        lo, hi = self._match_range(charge, step, error_tolerance)
+        query = peak.mz + isotopic_shift(charge) * step
+        n_candidates = hi[i] - lo[i]
+        if n_candidates == 0:
+            best = None
+        elif n_candidates == 1:
+            best = self.peaks[lo[i]]
+            if abs(ppm_error(query, best.mz)) >= error_tolerance:
+                best = None
+        else:
+            best = self.peaklist.has_peak(query, error_tolerance)
+        if best is None or best.intensity < self.minimum_intensity:
+            return FittedPeak(query, 1.0, 1.0, -1, 0, 0, 0)
+        return best
+
+    def between(self, peak, charge, step, tolerance):
+        """Get the peaks within `tolerance` of the position `step` isotopic positions away
+        from `peak` at `charge`, like :meth:`~.DeconvoluterBase.between`.
+
+        Parameters
+        ----------
+        peak : FittedPeak
+            A peak from the indexed peak list
+        charge : int
+            The charge state to step at
+        step : int
+            The number of isotopic positions to step
+        tolerance : float
+            The relative width of the window around the expected position
+
+        Returns
+        -------
+        tuple of FittedPeak
+        """
+        i = peak.peak_count
+        lo, hi = self._slice_range(charge, step, tolerance)
+        return self.peaks[lo[i]:hi[i]]
+
+    def find_next_putative_peak(self, peak, charge, step=1, tolerance=ERROR_TOLERANCE):
+        """Table-driven equivalent of :meth:`~.DeconvoluterBase._find_next_putative_peak`
+        starting from ``peak.mz``.
+        """
+        shift = isotopic_shift(charge)
+        candidates = []
+        for forward in self.between(peak, charge, step, tolerance):
+            prev_peak_mz = forward.mz - (shift * step)
+            dummy_peak = FittedPeak(prev_peak_mz, 1.0, 1.0, -1, 0, 0, 0)
+            candidates.append((dummy_peak, charge))
+        return candidates
+
+    def find_previous_putative_peak(self, peak, charge, step=1, tolerance=ERROR_TOLERANCE):
+        """Table-driven equivalent of :meth:`~.DeconvoluterBase._find_previous_putative_peak`
+        starting from ``peak.mz``.
+        """
+        candidates = []
+        for backward in self.between(peak, charge, -1, tolerance):
+            if step == 1:
+                candidates.extend(self.find_next_putative_peak(
+                    backward, charge, 1, tolerance))
+            else:
+                candidates.extend(
+                    self.find_previous_putative_peak(backward, charge, step - 1, tolerance))
+        return candidates
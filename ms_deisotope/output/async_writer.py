@@ -0,0 +1,199 @@
+import sys
+import threading
+import time
+
+try:
+    from queue import Queue, Full
+except ImportError:  # pragma: no cover
+    from Queue import Queue, Full
+
+from .common import ScanSerializerBase
+
+
+class _WriterDone(object):
+    def __repr__(self):
+        return "WRITER_DONE"
+
+
+WRITER_DONE = _WriterDone()
+
+
+class _WriterError(object):
+    __slots__ = ("error", "traceback")
+
+    def __init__(self, error, traceback):
+        self.error = error
+        self.traceback = traceback
+
+
+class AsyncScanSerializer(ScanSerializerBase):
+    """Runs any :class:`~.ScanSerializerBase` on a dedicated thread, so that
+    processing the next scans overlaps with writing the previous ones.
+
+    Calls to :meth:`save` and :meth:`save_scan_bunch` are queued, in order, in a
+    bounded queue, and return as soon as there is room in it. When the queue is
+    full the producer blocks until the writing thread catches up, and the time
+    spent waiting is added to :attr:`stall_time`. An error raised by the wrapped
+    serializer stops the writing thread and is re-raised to the producer by the
+    next call to :meth:`save`, :meth:`save_scan_bunch`, :meth:`flush` or
+    :meth:`complete`.
+
+    :meth:`complete` waits for every queued call to be written, completes the
+    wrapped serializer on the writing thread and joins it. Any other attribute
+    is read from the wrapped serializer directly, which is only safe once it has
+    finished writing, after :meth:`flush`.
+
+    Attributes
+    ----------
+    serializer : ScanSerializerBase
+        The wrapped serializer
+    queue_size : int
+        The maximum number of calls waiting to be written
+    stall_time : float
+        The total number of seconds the producer has spent waiting for room
+        in the queue
+    write_time : float
+        The total number of seconds the writing thread has spent writing
+    max_queue_depth : int
+        The largest number of calls that have been waiting at once
+    items_written : int
+        The number of calls the writing thread has finished
+    """
+
+    def __init__(self, serializer, queue_size=8, poll_interval=0.1):
+        self.serializer = serializer
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self._queue = Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = None
+        self._completed = False
+        self.stall_time = 0.0
+        self.write_time = 0.0
+        self.max_queue_depth = 0
+        self.items_written = 0
+
+    def __repr__(self):
+        return "%s(%r, %d)" % (self.__class__.__name__, self.serializer, self.queue_size)
+
+    @property
+    def queue_depth(self):
+        """The number of calls currently waiting to be written
+        """
+        return self._queue.qsize()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def metrics(self):
+        """Summarize how the producer and the writing thread have kept up with
+        one another
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "stall_time": self.stall_time,
+            "write_time": self.write_time,
+            "items_written": self.items_written,
+        }
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is WRITER_DONE:
+                    return
+                method, args, kwargs = item
+                start = time.time()
+                getattr(self.serializer, method)(*args, **kwargs)
+                self.write_time += time.time() - start
+                self.items_written += 1
+            except Exception as err:
+                self._error = _WriterError(err, sys.exc_info()[2])
+                return
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        """Start the writing thread if it is not already running
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._write, name="AsyncScanSerializer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error.error
+
+    def _put(self, item):
+        self._raise_if_failed()
+        if self._completed:
+            raise ValueError("Cannot write to a completed serializer")
+        self.start()
+        start = None
+        while True:
+            try:
+                self._queue.put(item, timeout=self.poll_interval if start is not None else 0)
+                break
+            except Full:
+                if start is None:
+                    start = time.time()
+                self._raise_if_failed()
+                if not self.is_running:
+                    raise ValueError("The writing thread has stopped")
+        if start is not None:
+            self.stall_time += time.time() - start
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def save_scan_bunch(self, bunch, **kwargs):
+        self._put(("save_scan_bunch", (bunch,), kwargs))
+
+    def save(self, bunch, **kwargs):
+        self._put(("save", (bunch,), kwargs))
+
+    def flush(self):
+        """Wait until every queued call has been written, or the writing
+        thread has failed
+        """
+        while self.is_running and self._queue.unfinished_tasks:
+            time.sleep(self.poll_interval / 10.)
+        self._raise_if_failed()
+
+    def complete(self):
+        """Write every queued call, complete the wrapped serializer and
+        stop the writing thread
+        """
+        if self._completed:
+            self._raise_if_failed()
+            return
+        self._put(("complete", (), {}))
+        self._completed = True
+        self._put_done()
+        self._thread.join()
+        self._raise_if_failed()
+
+    def _put_done(self):
+        while self.is_running:
+            try:
+                self._queue.put(WRITER_DONE, timeout=self.poll_interval)
+                return
+            except Full:
+                continue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.complete()
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "serializer":
+            raise AttributeError(name)
+        return getattr(self.serializer, name)
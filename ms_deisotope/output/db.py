@@ -1,15 +1,19 @@
 from uuid import uuid4
+from binascii import hexlify
+from collections import defaultdict
+import csv
+import io
 import os
 
-from sqlalchemy import create_engine, select, func, event
-from sqlalchemy.orm import sessionmaker, scoped_session, validates, deferred
+from sqlalchemy import create_engine, func, event, text
+from sqlalchemy.orm import sessionmaker, scoped_session, validates, deferred, undefer
 from sqlalchemy.orm.session import object_session
 from sqlalchemy.engine import Connectable
 
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import (
     Column, Numeric, Integer, String, ForeignKey, PickleType,
-    Boolean)
+    Boolean, LargeBinary)
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.mutable import Mutable, MutableDict
 
@@ -27,12 +31,19 @@ from ms_deisotope.data_source.common import (
     ProcessedScan, PrecursorInformation as MemoryPrecursorInformation, ScanBunch)
 
 from ms_deisotope.output.common import ScanSerializerBase, ScanDeserializerBase
+from ms_deisotope.utils import basestring
 
 
 def Mass(index=True):
     return Column(Numeric(14, 6, asdecimal=False), index=index)
 
 
+#: The value of ``MSScan.info['peak_storage']`` for scans whose peaks are stored
+#: in :class:`DeconvolutedPeakArrays` and :class:`FittedPeakArrays` instead of one
+#: row per peak
+PACKED_PEAK_STORAGE = "packed"
+
+
 class MutableList(Mutable, list):
 
     @classmethod
@@ -154,13 +165,55 @@ class MSScan(Base):
         session = object_session(self)
         conn = session.connection()
 
+        packed = self.has_packed_peaks
+
+        peak_set_items = None
         if fitted:
-            q = conn.execute(select([FittedPeak.__table__]).where(
-                FittedPeak.__table__.c.scan_id == self.id)).fetchall()
+            if packed:
+                peak_set_items = FittedPeakArrays.load_peaks(conn, self.id)
+            else:
+                q = conn.execute(FittedPeak.__table__.select().where(
+                    FittedPeak.__table__.c.scan_id == self.id)).fetchall()
+
+                peak_set_items = list(
+                    map(make_memory_fitted_peak, q))
+
+        deconvoluted_peak_set_items = None
+        if deconvoluted:
+            if packed:
+                deconvoluted_peak_set_items = DeconvolutedPeakArrays.load_peaks(conn, self.id)
+            else:
+                q = conn.execute(DeconvolutedPeak.__table__.select().where(
+                    DeconvolutedPeak.__table__.c.scan_id == self.id)).fetchall()
+
+                deconvoluted_peak_set_items = list(
+                    map(make_memory_deconvoluted_peak, q))
+
+        return self._convert_with_peaks(
+            precursor_information, peak_set_items, deconvoluted_peak_set_items)
+
+    @property
+    def has_packed_peaks(self):
+        info = self.info or {}
+        return info.get('peak_storage') == PACKED_PEAK_STORAGE
 
-            peak_set_items = list(
-                map(make_memory_fitted_peak, q))
+    def _convert_with_peaks(self, precursor_information, peak_set_items=None,
+                            deconvoluted_peak_set_items=None):
+        """Build a :class:`~.ProcessedScan` from peaks which have already been read
 
+        Parameters
+        ----------
+        precursor_information : :class:`~.PrecursorInformation` or None
+        peak_set_items : list, optional
+            The fitted peaks of the scan. If :const:`None`, the peak set is empty.
+        deconvoluted_peak_set_items : list, optional
+            The deconvoluted peaks of the scan. If :const:`None`, the peak set is empty.
+
+        Returns
+        -------
+        ProcessedScan
+        """
+        if peak_set_items is not None:
             peak_set = PeakSet(peak_set_items)
             peak_set._index()
             peak_index = PeakIndex(np.array([], dtype=np.float64), np.array(
@@ -169,13 +222,7 @@ class MSScan(Base):
             peak_index = PeakIndex(np.array([], dtype=np.float64), np.array(
                 [], dtype=np.float64), PeakSet([]))
 
-        if deconvoluted:
-            q = conn.execute(select([DeconvolutedPeak.__table__]).where(
-                DeconvolutedPeak.__table__.c.scan_id == self.id)).fetchall()
-
-            deconvoluted_peak_set_items = list(
-                map(make_memory_deconvoluted_peak, q))
-
+        if deconvoluted_peak_set_items is not None:
             deconvoluted_peak_set = DeconvolutedPeakSet(
                 deconvoluted_peak_set_items)
             deconvoluted_peak_set._reindex()
@@ -261,11 +308,13 @@ class PrecursorInformation(Base):
         return "DBPrecursorInformation({}, {}, {})".format(
             self.precursor.scan_id, self.neutral_mass, self.charge)
 
-    def convert(self, data_source=None):
+    def convert(self, data_source=None, precursor_scan_id=None):
+        if precursor_scan_id is None:
+            precursor_scan_id = self.precursor.scan_id
         return MemoryPrecursorInformation(
             mass_charge_ratio(self.neutral_mass,
                               self.charge), self.intensity, self.charge,
-            self.precursor.scan_id, data_source, self.neutral_mass, self.charge,
+            precursor_scan_id, data_source, self.neutral_mass, self.charge,
             self.intensity)
 
     @classmethod
@@ -375,6 +424,247 @@ class DeconvolutedPeak(Base, PeakMixin):
             chosen_for_msms=peak.chosen_for_msms, area=(peak.area if peak.area is not None else 0.))
 
 
+def _pack(values, dtype):
+    return np.asarray(values, dtype=dtype).tobytes()
+
+
+def _unpack(blob, dtype):
+    return np.frombuffer(blob, dtype=dtype)
+
+
+class PeakArraysMixin(object):
+    """Stores the peak set of one scan as a single row of packed little-endian
+    arrays, one column per peak attribute.
+
+    Subclasses list their array columns and element types in :attr:`array_columns`.
+    """
+    array_columns = []
+
+    peak_count = Column(Integer)
+
+    @classmethod
+    def columns(cls):
+        """The columns of a row built by :meth:`pack`, in order
+
+        Returns
+        -------
+        list of str
+        """
+        return ["scan_id", "peak_count"] + [name for name, _ in cls.array_columns]
+
+    @classmethod
+    def _pack_columns(cls, scan_id, n, columns):
+        return tuple([scan_id, n] + [
+            _pack(columns[name], dtype) for name, dtype in cls.array_columns])
+
+    @classmethod
+    def _unpack_columns(cls, row):
+        return {
+            name: _unpack(getattr(row, name), dtype).tolist()
+            for name, dtype in cls.array_columns
+        }
+
+    @classmethod
+    def load_peaks(cls, connection, scan_id):
+        """Read the peaks of the scan with primary key `scan_id`
+
+        Parameters
+        ----------
+        connection : sqlalchemy.engine.Connection
+        scan_id : int
+
+        Returns
+        -------
+        list
+        """
+        row = connection.execute(cls.__table__.select().where(
+            cls.__table__.c.scan_id == scan_id)).first()
+        if row is None:
+            return []
+        return cls.unpack(row)
+
+
+class FittedPeakArrays(Base, PeakArraysMixin):
+    __tablename__ = "FittedPeakArrays"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scan_id = Column(Integer, ForeignKey(
+        MSScan.id, ondelete='CASCADE'), index=True, unique=True)
+
+    mz = Column(LargeBinary)
+    intensity = Column(LargeBinary)
+    signal_to_noise = Column(LargeBinary)
+    full_width_at_half_max = Column(LargeBinary)
+    area = Column(LargeBinary)
+
+    array_columns = [
+        ("mz", "<f8"),
+        ("intensity", "<f8"),
+        ("signal_to_noise", "<f8"),
+        ("full_width_at_half_max", "<f8"),
+        ("area", "<f8"),
+    ]
+
+    @classmethod
+    def pack(cls, peaks, scan_id):
+        """Pack `peaks` into a row of :meth:`columns`
+
+        Parameters
+        ----------
+        peaks : Iterable of :class:`~.FittedPeak`
+        scan_id : int
+
+        Returns
+        -------
+        tuple
+        """
+        peaks = list(peaks)
+        columns = {
+            "mz": [p.mz for p in peaks],
+            "intensity": [p.intensity for p in peaks],
+            "signal_to_noise": [p.signal_to_noise for p in peaks],
+            "full_width_at_half_max": [p.full_width_at_half_max for p in peaks],
+            "area": [p.area if p.area is not None else 0. for p in peaks],
+        }
+        return cls._pack_columns(scan_id, len(peaks), columns)
+
+    @classmethod
+    def unpack(cls, row):
+        c = cls._unpack_columns(row)
+        return [
+            MemoryFittedPeak(mz, intensity, signal_to_noise, -1, -1, fwhm, area)
+            for mz, intensity, signal_to_noise, fwhm, area in zip(
+                c['mz'], c['intensity'], c['signal_to_noise'],
+                c['full_width_at_half_max'], c['area'])
+        ]
+
+
+class DeconvolutedPeakArrays(Base, PeakArraysMixin):
+    """The deconvoluted peak set of one scan as packed arrays. The isotopic
+    envelope of the ``i``-th peak is ``envelope_mz[envelope_offsets[i]:envelope_offsets[i + 1]]``
+    and the matching slice of ``envelope_intensity``.
+    """
+    __tablename__ = "DeconvolutedPeakArrays"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scan_id = Column(Integer, ForeignKey(
+        MSScan.id, ondelete='CASCADE'), index=True, unique=True)
+
+    mz = Column(LargeBinary)
+    neutral_mass = Column(LargeBinary)
+    intensity = Column(LargeBinary)
+    charge = Column(LargeBinary)
+    score = Column(LargeBinary)
+    signal_to_noise = Column(LargeBinary)
+    full_width_at_half_max = Column(LargeBinary)
+    a_to_a2_ratio = Column(LargeBinary)
+    most_abundant_mass = Column(LargeBinary)
+    average_mass = Column(LargeBinary)
+    area = Column(LargeBinary)
+    chosen_for_msms = Column(LargeBinary)
+    envelope_offsets = Column(LargeBinary)
+    envelope_mz = Column(LargeBinary)
+    envelope_intensity = Column(LargeBinary)
+
+    array_columns = [
+        ("mz", "<f8"),
+        ("neutral_mass", "<f8"),
+        ("intensity", "<f8"),
+        ("charge", "<i4"),
+        ("score", "<f8"),
+        ("signal_to_noise", "<f8"),
+        ("full_width_at_half_max", "<f8"),
+        ("a_to_a2_ratio", "<f8"),
+        ("most_abundant_mass", "<f8"),
+        ("average_mass", "<f8"),
+        ("area", "<f8"),
+        ("chosen_for_msms", "u1"),
+        ("envelope_offsets", "<i4"),
+        ("envelope_mz", "<f8"),
+        ("envelope_intensity", "<f8"),
+    ]
+
+    @classmethod
+    def pack(cls, peaks, scan_id):
+        """Pack `peaks` into a row of :meth:`columns`
+
+        Parameters
+        ----------
+        peaks : Iterable of :class:`~.DeconvolutedPeak`
+        scan_id : int
+
+        Returns
+        -------
+        tuple
+        """
+        peaks = list(peaks)
+        offsets = [0]
+        envelope_mz = []
+        envelope_intensity = []
+        for peak in peaks:
+            for pair in peak.envelope:
+                envelope_mz.append(pair[0])
+                envelope_intensity.append(pair[1])
+            offsets.append(len(envelope_mz))
+        columns = {
+            "mz": [p.mz for p in peaks],
+            "neutral_mass": [p.neutral_mass for p in peaks],
+            "intensity": [p.intensity for p in peaks],
+            "charge": [p.charge for p in peaks],
+            "score": [p.score for p in peaks],
+            "signal_to_noise": [p.signal_to_noise for p in peaks],
+            "full_width_at_half_max": [p.full_width_at_half_max for p in peaks],
+            "a_to_a2_ratio": [p.a_to_a2_ratio for p in peaks],
+            "most_abundant_mass": [p.most_abundant_mass for p in peaks],
+            "average_mass": [p.average_mass for p in peaks],
+            "area": [p.area if p.area is not None else 0. for p in peaks],
+            "chosen_for_msms": [bool(p.chosen_for_msms) for p in peaks],
+            "envelope_offsets": offsets,
+            "envelope_mz": envelope_mz,
+            "envelope_intensity": envelope_intensity,
+        }
+        return cls._pack_columns(scan_id, len(peaks), columns)
+
+    @classmethod
+    def unpack(cls, row):
+        c = cls._unpack_columns(row)
+        offsets = c['envelope_offsets']
+        envelope_mz = c['envelope_mz']
+        envelope_intensity = c['envelope_intensity']
+        peaks = []
+        for i in range(row.peak_count):
+            start, end = offsets[i], offsets[i + 1]
+            peaks.append(MemoryDeconvolutedPeak(
+                c['neutral_mass'][i], c['intensity'][i], c['charge'][i],
+                c['signal_to_noise'][i], -1, c['full_width_at_half_max'][i],
+                c['a_to_a2_ratio'][i], c['most_abundant_mass'][i], c['average_mass'][i],
+                c['score'][i], Envelope(zip(envelope_mz[start:end], envelope_intensity[start:end])),
+                c['mz'][i], None, bool(c['chosen_for_msms'][i]), c['area'][i]))
+        return peaks
+
+
+class DeconvolutedPeakMassIndex(Base):
+    """The neutral mass of each peak in a :class:`DeconvolutedPeakArrays` row, for
+    scans whose peaks must be found by mass range with an indexed query.
+    """
+    __tablename__ = "DeconvolutedPeakMassIndex"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scan_id = Column(Integer, ForeignKey(
+        MSScan.id, ondelete='CASCADE'), index=True)
+    peak_index = Column(Integer)
+    neutral_mass = Mass()
+
+    @classmethod
+    def columns(cls):
+        return ["scan_id", "peak_index", "neutral_mass"]
+
+    @classmethod
+    def index_peaks(cls, peaks, scan_id, rows):
+        for i, peak in enumerate(peaks):
+            rows.append((scan_id, i, peak.neutral_mass))
+
+
 def serialize_scan_bunch(session, bunch, sample_run_id=None):
     precursor = bunch.precursor
     db_precursor = MSScan.serialize(precursor, sample_run_id=sample_run_id)
@@ -521,6 +811,307 @@ class ScanSerializationBatcher(object):
         self.count = 0
 
 
+def _integer_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class BulkInsert(object):
+    """Inserts many rows into one table with as little per-row overhead as
+    the database driver allows.
+
+    On PostgreSQL with :mod:`psycopg2`, rows are streamed with ``COPY``.
+    Otherwise, if the driver uses positional parameters, like :mod:`sqlite3`,
+    rows are passed straight to the driver's ``executemany`` as tuples, and
+    for any other driver through SQLAlchemy Core's ``executemany``.
+
+    Parameters
+    ----------
+    table : sqlalchemy.Table
+    columns : list of str
+        The names of the columns each row holds a value for, in order
+    """
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = list(columns)
+        self._compiled = {}
+
+    def _processors(self, dialect):
+        return [
+            self.table.c[name].type.bind_processor(dialect)
+            for name in self.columns
+        ]
+
+    def _process(self, rows, processors):
+        active = [(i, f) for i, f in enumerate(processors) if f is not None]
+        if not active:
+            return rows
+        out = []
+        for row in rows:
+            row = list(row)
+            for i, f in active:
+                row[i] = f(row[i])
+            out.append(row)
+        return out
+
+    def _compile(self, dialect):
+        try:
+            return self._compiled[dialect.name]
+        except KeyError:
+            statement = self.table.insert().compile(dialect=dialect, column_keys=self.columns)
+            order = [self.columns.index(name) for name in statement.positiontup]
+            self._compiled[dialect.name] = (str(statement), order)
+            return self._compiled[dialect.name]
+
+    def _copy(self, cursor, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                ('\\x' + hexlify(value).decode('ascii')) if isinstance(value, bytes) else
+                ('t' if value else 'f') if isinstance(value, bool) else value
+                for value in row])
+        buffer.seek(0)
+        cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (
+            self.table.name, ', '.join('"%s"' % name for name in self.columns)), buffer)
+
+    def execute(self, connection, rows):
+        """Insert `rows` using `connection`, within its current transaction
+
+        Parameters
+        ----------
+        connection : sqlalchemy.engine.Connection
+        rows : list of tuple
+        """
+        if not rows:
+            return
+        dialect = connection.dialect
+        if dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+            rows = self._process(rows, self._processors(dialect))
+            cursor = connection.connection.cursor()
+            try:
+                self._copy(cursor, rows)
+            finally:
+                cursor.close()
+        elif dialect.positional:
+            rows = self._process(rows, self._processors(dialect))
+            sql, order = self._compile(dialect)
+            cursor = connection.connection.cursor()
+            try:
+                cursor.executemany(sql, [tuple(row[i] for i in order) for row in rows])
+            finally:
+                cursor.close()
+        else:
+            connection.execute(
+                self.table.insert(), [dict(zip(self.columns, row)) for row in rows])
+
+
+class ScanKeyAllocator(object):
+    """Hands out primary keys for new :class:`MSScan` rows before they are
+    written, so that rows referring to them can be built without a round trip
+    to the database.
+
+    On PostgreSQL keys are drawn from the table's sequence. Elsewhere they
+    continue from the largest key in the table when the allocator was made,
+    which assumes no other writer is adding scans at the same time.
+
+    Parameters
+    ----------
+    connection : sqlalchemy.engine.Connection
+    """
+
+    def __init__(self, connection):
+        self.use_sequence = connection.dialect.name == 'postgresql'
+        self._next = None
+        if not self.use_sequence:
+            current = connection.execute(
+                text('SELECT max(id) FROM "%s"' % MSScan.__tablename__)).scalar()
+            self._next = (current or 0) + 1
+
+    def allocate(self, connection, n):
+        """Reserve `n` consecutive keys
+
+        Parameters
+        ----------
+        connection : sqlalchemy.engine.Connection
+        n : int
+
+        Returns
+        -------
+        list of int
+        """
+        if n == 0:
+            return []
+        if self.use_sequence:
+            return [row[0] for row in connection.execute(text(
+                "SELECT nextval(pg_get_serial_sequence('\"%s\"', 'id')) "
+                "FROM generate_series(1, :n)" % MSScan.__tablename__), {"n": n})]
+        keys = list(range(self._next, self._next + n))
+        self._next += n
+        return keys
+
+
+class BulkScanWriter(object):
+    """Saves :class:`~.ScanBunch` objects to the database in batches using
+    SQLAlchemy Core instead of ORM objects.
+
+    The primary keys of scans are assigned up front by a :class:`ScanKeyAllocator`,
+    so each batch is written with one :class:`BulkInsert` per table inside a single
+    transaction, without flushing to learn keys.
+
+    Attributes
+    ----------
+    session : Session
+        The session whose connection and transaction rows are written with
+    sample_run_id : int
+        The primary key of the db.SampleRun the scans belong to
+    batch_size : int
+        The number of ScanBunch objects to accumulate before writing them
+    ms1_fitted : bool
+        Whether to save the fitted peaks of MS1 scans
+    msn_fitted : bool
+        Whether to save the fitted peaks of MSn scans
+    peak_storage : str
+        ``"rows"`` to store one row per peak, or ``"packed"`` to store the peaks
+        of each scan as one row of arrays in :class:`DeconvolutedPeakArrays` and
+        :class:`FittedPeakArrays`
+    mass_index_ms_levels : Container of int
+        When peaks are packed, the MS levels of the scans whose deconvoluted peaks'
+        neutral masses are written to :class:`DeconvolutedPeakMassIndex`
+    count : int
+        The number of ScanBunch objects accumulated since the last write
+    """
+
+    scan_insert = BulkInsert(MSScan.__table__, [
+        "id", "index", "ms_level", "scan_time", "title", "scan_id", "sample_run_id", "info"])
+    precursor_information_insert = BulkInsert(PrecursorInformation.__table__, [
+        "sample_run_id", "precursor_id", "product_id", "neutral_mass", "charge",
+        "intensity", "defaulted", "orphan"])
+    fitted_peak_insert = BulkInsert(FittedPeak.__table__, [
+        "scan_id", "mz", "intensity", "signal_to_noise", "full_width_at_half_max", "area"])
+    deconvoluted_peak_insert = BulkInsert(DeconvolutedPeak.__table__, [
+        "scan_id", "mz", "intensity", "signal_to_noise", "full_width_at_half_max", "area",
+        "neutral_mass", "average_mass", "most_abundant_mass", "charge", "score",
+        "envelope", "a_to_a2_ratio", "chosen_for_msms"])
+    fitted_peak_arrays_insert = BulkInsert(FittedPeakArrays.__table__, FittedPeakArrays.columns())
+    deconvoluted_peak_arrays_insert = BulkInsert(
+        DeconvolutedPeakArrays.__table__, DeconvolutedPeakArrays.columns())
+    mass_index_insert = BulkInsert(
+        DeconvolutedPeakMassIndex.__table__, DeconvolutedPeakMassIndex.columns())
+
+    def __init__(self, session, sample_run_id, batch_size=50, ms1_fitted=True, msn_fitted=True,
+                 peak_storage="rows", mass_index_ms_levels=(1,)):
+        if peak_storage not in ("rows", PACKED_PEAK_STORAGE):
+            raise ValueError("Unknown peak storage %r" % (peak_storage,))
+        self.session = session
+        self.sample_run_id = sample_run_id
+        self.batch_size = batch_size
+        self.ms1_fitted = ms1_fitted
+        self.msn_fitted = msn_fitted
+        self.peak_storage = peak_storage
+        self.mass_index_ms_levels = mass_index_ms_levels
+        self.bunches = []
+        self.count = 0
+        self._key_allocator = None
+
+    def add(self, bunch):
+        """Add `bunch` to the current batch, and write the batch if it is full
+
+        Parameters
+        ----------
+        bunch : ScanBunch
+        """
+        self.bunches.append(bunch)
+        self.count += 1
+        self.check_condition()
+
+    def check_condition(self):
+        if self.count >= self.batch_size:
+            self.serialize_batch()
+
+    def _scan_row(self, key, scan):
+        info = {'activation': scan.activation}
+        if self.peak_storage == PACKED_PEAK_STORAGE:
+            info['peak_storage'] = PACKED_PEAK_STORAGE
+        return (key, scan.index, scan.ms_level, float(scan.scan_time), scan.title, scan.id,
+                self.sample_run_id, info)
+
+    def _fitted_peak_rows(self, key, peaks, rows):
+        if self.peak_storage == PACKED_PEAK_STORAGE:
+            rows.append(FittedPeakArrays.pack(peaks, key))
+            return
+        for peak in peaks:
+            rows.append((
+                key, peak.mz, peak.intensity, peak.signal_to_noise,
+                peak.full_width_at_half_max, peak.area if peak.area is not None else 0.))
+
+    def _deconvoluted_peak_rows(self, key, scan, rows, mass_index):
+        peaks = scan.deconvoluted_peak_set
+        if self.peak_storage == PACKED_PEAK_STORAGE:
+            rows.append(DeconvolutedPeakArrays.pack(peaks, key))
+            if scan.ms_level in self.mass_index_ms_levels:
+                DeconvolutedPeakMassIndex.index_peaks(peaks, key, mass_index)
+            return
+        for peak in peaks:
+            rows.append((
+                key, peak.mz, peak.intensity, peak.signal_to_noise,
+                peak.full_width_at_half_max, peak.area if peak.area is not None else 0.,
+                peak.neutral_mass, peak.average_mass, peak.most_abundant_mass,
+                peak.charge, peak.score, list(peak.envelope), peak.a_to_a2_ratio,
+                peak.chosen_for_msms))
+
+    def serialize_batch(self):
+        """Write the accumulated scans, precursor information and peaks in one
+        transaction, then reset :attr:`count`
+        """
+        if not self.bunches:
+            return
+        connection = self.session.connection()
+        if self._key_allocator is None:
+            self._key_allocator = ScanKeyAllocator(connection)
+        keys = iter(self._key_allocator.allocate(
+            connection, sum(len(bunch.products) + 1 for bunch in self.bunches)))
+        scans = []
+        precursors = []
+        fitted = []
+        deconvoluted = []
+        mass_index = []
+        for bunch in self.bunches:
+            precursor_key = next(keys)
+            scans.append(self._scan_row(precursor_key, bunch.precursor))
+            if self.ms1_fitted:
+                self._fitted_peak_rows(precursor_key, bunch.precursor.peak_set, fitted)
+            self._deconvoluted_peak_rows(
+                precursor_key, bunch.precursor, deconvoluted, mass_index)
+            for product in bunch.products:
+                product_key = next(keys)
+                scans.append(self._scan_row(product_key, product))
+                pinfo = product.precursor_information
+                precursors.append((
+                    self.sample_run_id, precursor_key, product_key,
+                    pinfo.extracted_neutral_mass, _integer_or_none(pinfo.extracted_charge),
+                    pinfo.extracted_intensity, pinfo.defaulted, pinfo.orphan))
+                if self.msn_fitted:
+                    self._fitted_peak_rows(product_key, product.peak_set, fitted)
+                self._deconvoluted_peak_rows(
+                    product_key, product, deconvoluted, mass_index)
+        self.scan_insert.execute(connection, scans)
+        self.precursor_information_insert.execute(connection, precursors)
+        if self.peak_storage == PACKED_PEAK_STORAGE:
+            self.fitted_peak_arrays_insert.execute(connection, fitted)
+            self.deconvoluted_peak_arrays_insert.execute(connection, deconvoluted)
+            self.mass_index_insert.execute(connection, mass_index)
+        else:
+            self.fitted_peak_insert.execute(connection, fitted)
+            self.deconvoluted_peak_insert.execute(connection, deconvoluted)
+        self.session.commit()
+        self.bunches = []
+        self.count = 0
+
+
 def configure_connection(connection, create_tables=True):
     if isinstance(connection, basestring):
         try:
@@ -777,13 +1368,61 @@ class BatchingDatabaseScanSerializer(DatabaseScanSerializer):
         super(BatchingDatabaseScanSerializer, self).complete()
 
 
+class BulkDatabaseScanSerializer(DatabaseScanSerializer):
+    """A :class:`DatabaseScanSerializer` which writes scans in batches with a
+    :class:`BulkScanWriter`, committing once per batch.
+
+    `peak_storage` and `mass_index_ms_levels` are passed on to :class:`BulkScanWriter`.
+    """
+
+    def __init__(self, connection, sample_name=None, overwrite=True, save_fitted=False, batch_size=50,
+                 peak_storage="rows", mass_index_ms_levels=(1,)):
+        super(BulkDatabaseScanSerializer, self).__init__(
+            connection, sample_name, overwrite, save_fitted)
+        self._batch = None
+        self.batch_size = batch_size
+        self.peak_storage = peak_storage
+        self.mass_index_ms_levels = mass_index_ms_levels
+
+    @property
+    def batch(self):
+        if self._batch is None:
+            self._batch = BulkScanWriter(
+                self.session, self.sample_run_id, self.batch_size, self.save_fitted, self.save_fitted,
+                self.peak_storage, self.mass_index_ms_levels)
+        return self._batch
+
+    def save(self, bunch, commit=True):
+        self.batch.add(bunch)
+
+    def commit(self):
+        self.batch.serialize_batch()
+
+    def complete(self):
+        self.batch.serialize_batch()
+        super(BulkDatabaseScanSerializer, self).complete()
+
+
 def flatten(iterable):
     return [y for x in iterable for y in x]
 
 
 class DatabaseScanDeserializer(ScanDeserializerBase, DatabaseBoundOperation):
+    """Reads the scans of one sample run back from the database.
+
+    Iteration reads :attr:`iteration_batch_size` scan bunches at a time, with
+    one query each for their scans, precursor information and peaks.
+
+    Parameters
+    ----------
+    connection : str, Connectable or ConnectionRecipe
+    sample_name : str, optional
+    sample_run_id : int, optional
+    iteration_batch_size : int
+        The number of scan bunches to read at once while iterating
+    """
 
-    def __init__(self, connection, sample_name=None, sample_run_id=None):
+    def __init__(self, connection, sample_name=None, sample_run_id=None, iteration_batch_size=25):
 
         DatabaseBoundOperation.__init__(self, connection)
 
@@ -792,6 +1431,8 @@ class DatabaseScanDeserializer(ScanDeserializerBase, DatabaseBoundOperation):
         self._sample_run_id = sample_run_id
         self._iterator = None
         self._scan_id_to_retention_time_cache = None
+        self._scan_time_index = {}
+        self.iteration_batch_size = iteration_batch_size
 
     def _intialize_scan_id_to_retention_time_cache(self):
         self._scan_id_to_retention_time_cache = dict(
@@ -858,46 +1499,119 @@ class DatabaseScanDeserializer(ScanDeserializerBase, DatabaseBoundOperation):
             self._scan_id_to_retention_time_cache[scan_id] = q
             return q
 
-    def _select_index(self, require_ms1=True):
-        indices_q = self.session.query(MSScan.index).filter(
-            MSScan.sample_run_id == self.sample_run_id).order_by(MSScan.index.asc())
-        if require_ms1:
-            indices_q = indices_q.filter(MSScan.ms_level == 1)
-        indices = flatten(indices_q.all())
-        return indices
+    def _load_peaks(self, scans, fitted=True, deconvoluted=True):
+        """Read the peaks of many scans at once
+
+        Parameters
+        ----------
+        scans : list of MSScan
+        fitted : bool
+        deconvoluted : bool
+
+        Returns
+        -------
+        fitted_peaks : defaultdict of list
+            The fitted peaks of each scan, by primary key
+        deconvoluted_peaks : defaultdict of list
+            The deconvoluted peaks of each scan, by primary key
+        """
+        connection = self.session.connection()
+        fitted_peaks = defaultdict(list)
+        deconvoluted_peaks = defaultdict(list)
+        packed_keys = [scan.id for scan in scans if scan.has_packed_peaks]
+        row_keys = [scan.id for scan in scans if not scan.has_packed_peaks]
+        for model, array_model, accumulator, make_peak, load in (
+                (FittedPeak, FittedPeakArrays, fitted_peaks, make_memory_fitted_peak, fitted),
+                (DeconvolutedPeak, DeconvolutedPeakArrays, deconvoluted_peaks,
+                 make_memory_deconvoluted_peak, deconvoluted)):
+            if not load:
+                continue
+            if row_keys:
+                table = model.__table__
+                for row in connection.execute(table.select().where(
+                        table.c.scan_id.in_(row_keys)).order_by(table.c.id)):
+                    accumulator[row.scan_id].append(make_peak(row))
+            if packed_keys:
+                table = array_model.__table__
+                for row in connection.execute(table.select().where(table.c.scan_id.in_(packed_keys))):
+                    accumulator[row.scan_id] = array_model.unpack(row)
+        return fitted_peaks, deconvoluted_peaks
+
+    def _load_bunches(self, precursors):
+        """Build the :class:`~.ScanBunch` of each scan in `precursors`, reading
+        their products and all of their peaks with a fixed number of queries
+
+        Parameters
+        ----------
+        precursors : list of MSScan
+
+        Returns
+        -------
+        list of ScanBunch
+        """
+        precursor_keys = [scan.id for scan in precursors]
+        product_information = self.session.query(PrecursorInformation).filter(
+            PrecursorInformation.precursor_id.in_(precursor_keys)).all()
+        product_keys = [pinfo.product_id for pinfo in product_information]
+        products = self.session.query(MSScan).options(undefer(MSScan.info)).filter(
+            MSScan.id.in_(product_keys)).order_by(MSScan.index).all() if product_keys else []
+        fitted_peaks, deconvoluted_peaks = self._load_peaks(precursors + products)
+
+        by_product = {pinfo.product_id: pinfo for pinfo in product_information}
+        products_of = defaultdict(list)
+        precursor_scan_ids = {scan.id: scan.scan_id for scan in precursors}
+        for product in products:
+            pinfo = by_product[product.id]
+            precursor_information = pinfo.convert(
+                self, precursor_scan_id=precursor_scan_ids[pinfo.precursor_id])
+            products_of[pinfo.precursor_id].append(product._convert_with_peaks(
+                precursor_information, fitted_peaks[product.id], deconvoluted_peaks[product.id]))
+
+        # When iterating over every scan, not just MS1 scans, precursors may be MSn scans
+        # with precursor information of their own
+        own_information = {}
+        msn_keys = [scan.id for scan in precursors if scan.ms_level > 1]
+        if msn_keys:
+            for pinfo in self.session.query(PrecursorInformation).filter(
+                    PrecursorInformation.product_id.in_(msn_keys)):
+                own_information[pinfo.product_id] = pinfo.convert(self)
+        return [
+            ScanBunch(
+                precursor._convert_with_peaks(
+                    own_information.get(precursor.id), fitted_peaks[precursor.id],
+                    deconvoluted_peaks[precursor.id]),
+                products_of[precursor.id])
+            for precursor in precursors
+        ]
 
     def _iterate_over_index(self, start=0, require_ms1=True):
-        indices = self._select_index(require_ms1)
-        try:
-            i = indices.index(start)
-        except ValueError:
-            lo = 0
-            hi = len(indices)
-
-            while lo != hi:
-                mid = (lo + hi) / 2
-                x = indices[mid]
-                if x == start:
-                    i = mid
-                    break
-                elif lo == (hi - 1):
-                    i = mid
-                    break
-                elif x > start:
-                    hi = mid
-                else:
-                    lo = mid
-        items = indices[i:]
-        i = 0
-        n = len(items)
-        while i < n:
-            index = items[i]
-            scan = self.session.query(MSScan).filter(
-                MSScan.index == index,
-                MSScan.sample_run_id == self.sample_run_id).one()
-            products = [pi.product for pi in scan.product_information]
-            yield ScanBunch(scan.convert(), [p.convert() for p in products])
-            i += 1
+        def window():
+            q = self.session.query(MSScan).options(undefer(MSScan.info)).filter(
+                MSScan.sample_run_id == self.sample_run_id)
+            if require_ms1:
+                q = q.filter(MSScan.ms_level == 1)
+            return q
+
+        # Begin at the last scan at or before `start`, so that starting from an
+        # MSn scan yields the bunch it belongs to, falling back to the first scan
+        floor = None
+        if start > 0:
+            floor = window().with_entities(MSScan.index).filter(
+                MSScan.index <= start).order_by(MSScan.index.desc()).limit(1).scalar()
+        last_index = None
+        while True:
+            q = window()
+            if last_index is None:
+                if floor is not None:
+                    q = q.filter(MSScan.index >= floor)
+            else:
+                q = q.filter(MSScan.index > last_index)
+            precursors = q.order_by(MSScan.index.asc()).limit(self.iteration_batch_size).all()
+            if not precursors:
+                break
+            last_index = precursors[-1].index
+            for bunch in self._load_bunches(precursors):
+                yield bunch
 
     def __iter__(self):
         return self
@@ -912,35 +1626,42 @@ class DatabaseScanDeserializer(ScanDeserializerBase, DatabaseBoundOperation):
             MSScan.scan_id == scan_id, MSScan.sample_run_id == self.sample_run_id).first()
         return q
 
-    def _get_scan_by_time(self, rt, require_ms1=False):
-        times_q = self.session.query(MSScan.scan_time).filter(
-            MSScan.sample_run_id == self.sample_run_id).order_by(MSScan.scan_time.asc())
-        if require_ms1:
-            times_q = times_q.filter(MSScan.ms_level == 1)
-        times = flatten(times_q.all())
+    def _get_scan_time_index(self, require_ms1=False):
+        """The scan times of the sample run in ascending order, with the
+        primary key of each scan, read once and cached.
+
+        Parameters
+        ----------
+        require_ms1 : bool
+            Whether to include only MS1 scans
+
+        Returns
+        -------
+        times : np.ndarray
+        keys : np.ndarray
+        """
         try:
-            i = times.index(rt)
-        except ValueError:
-            lo = 0
-            hi = len(times)
-
-            while lo != hi:
-                mid = (lo + hi) / 2
-                x = times[mid]
-                if x == rt:
-                    i = mid
-                    break
-                elif lo == (hi - 1):
-                    i = mid
-                    break
-                elif x > rt:
-                    hi = mid
-                else:
-                    lo = mid
-        scan = self.session.query(MSScan).filter(
-            MSScan.scan_time == times[i],
-            MSScan.sample_run_id == self.sample_run_id).one()
-        return scan
+            return self._scan_time_index[require_ms1]
+        except KeyError:
+            q = self.session.query(MSScan.scan_time, MSScan.id).filter(
+                MSScan.sample_run_id == self.sample_run_id)
+            if require_ms1:
+                q = q.filter(MSScan.ms_level == 1)
+            rows = q.order_by(MSScan.scan_time.asc(), MSScan.index.asc()).all()
+            times = np.array([row[0] for row in rows], dtype=np.float64)
+            keys = np.array([row[1] for row in rows], dtype=np.int64)
+            self._scan_time_index[require_ms1] = (times, keys)
+            return times, keys
+
+    def _get_scan_by_time(self, rt, require_ms1=False):
+        times, keys = self._get_scan_time_index(require_ms1)
+        if len(times) == 0:
+            raise IndexError("No scans found for time %r" % (rt,))
+        i = np.searchsorted(times, rt, side='left')
+        if i == len(times) or times[i] != rt:
+            # The last scan acquired before rt, or the first scan if none were
+            i = max(np.searchsorted(times, rt, side='right') - 1, 0)
+        return self.session.query(MSScan).filter(MSScan.id == int(keys[i])).one()
 
     def reset(self):
         self._iterator = None
@@ -964,9 +1685,11 @@ class DatabaseScanDeserializer(ScanDeserializerBase, DatabaseBoundOperation):
         return mem
 
     def _locate_ms1_scan(self, scan):
-        while scan.ms_level != 1:
-            scan = self._get_scan_by_index(scan.index - 1)
-        return scan
+        if scan.ms_level == 1:
+            return scan
+        return self.session.query(MSScan).filter(
+            MSScan.sample_run_id == self.sample_run_id, MSScan.ms_level == 1,
+            MSScan.index < scan.index).order_by(MSScan.index.desc()).limit(1).one()
 
     def start_from_scan(self, scan_id=None, rt=None, index=None, require_ms1=True):
         if scan_id is None:
@@ -1000,12 +1723,46 @@ class DatabaseScanDeserializer(ScanDeserializerBase, DatabaseBoundOperation):
         return q
 
     def ms1_peaks_above(self, threshold=1000):
+        """Find all MS1 peaks whose neutral mass is above `threshold`.
+
+        Parameters
+        ----------
+        threshold : float, optional
+            The minimum neutral mass of a peak to report
+
+        Returns
+        -------
+        list of tuple
+            Triples of scan id, :class:`~.DeconvolutedPeak` and peak key. The key of
+            a peak stored as a row is its integer :attr:`DeconvolutedPeak.id`, while the
+            key of a peak stored in a packed array is the tuple ``(scan key, peak_index)``,
+            so keys from the two storage modes never compare equal.
+        """
         accumulate = [
             (x[0], x[1].convert(), x[1].id) for x in self.session.query(MSScan.scan_id, DeconvolutedPeak).join(
                 DeconvolutedPeak).filter(
                 MSScan.ms_level == 1, MSScan.sample_run_id == self.sample_run_id,
                 DeconvolutedPeak.neutral_mass > threshold
             ).order_by(MSScan.index).yield_per(1000)]
+        accumulate.extend(self._packed_ms1_peaks_above(threshold))
+        return accumulate
+
+    def _packed_ms1_peaks_above(self, threshold=1000):
+        q = self.session.query(
+            MSScan.scan_id, MSScan.id, DeconvolutedPeakMassIndex.peak_index).join(
+            DeconvolutedPeakMassIndex, DeconvolutedPeakMassIndex.scan_id == MSScan.id).filter(
+            MSScan.ms_level == 1, MSScan.sample_run_id == self.sample_run_id,
+            DeconvolutedPeakMassIndex.neutral_mass > threshold
+        ).order_by(MSScan.index, DeconvolutedPeakMassIndex.peak_index)
+        connection = self.session.connection()
+        accumulate = []
+        last_key = None
+        peaks = None
+        for scan_id, key, peak_index in q:
+            if key != last_key:
+                peaks = DeconvolutedPeakArrays.load_peaks(connection, key)
+                last_key = key
+            accumulate.append((scan_id, peaks[peak_index], (key, peak_index)))
         return accumulate
 
     def precursor_information(self):
@@ -1,5 +1,6 @@
 import os
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
 from uuid import uuid4
 import warnings
 
@@ -9,10 +10,17 @@ from ms_peak_picker import PeakIndex, PeakSet, FittedPeak
 
 try:
     from psims.mzml import writer
+    from psims.mzml.binary_encoding import dtype_to_encoding
 except ImportError:
     print("MzMLWriter not available.")
     writer = None
 
+try:
+    from psims.mzml.writer import ARRAY_TYPES, NON_STANDARD_ARRAY
+except ImportError:
+    ARRAY_TYPES = None
+    NON_STANDARD_ARRAY = None
+
 try:
     WindowsError
     on_windows = True
@@ -20,13 +28,16 @@ except NameError:
     on_windows = False
 
 from .common import ScanSerializerBase, ScanDeserializerBase
-from .text_utils import (envelopes_to_array, decode_envelopes)
+from .text_utils import (
+    envelopes_to_array, decode_envelopes,
+    envelopes_to_compact_array, decode_compact_envelopes)
 from ms_deisotope import peak_set
 from ms_deisotope.utils import Base
 from ms_deisotope.averagine import neutral_mass
-from ms_deisotope.data_source.common import PrecursorInformation, ScanBunch
-from ms_deisotope.data_source.mzml import MzMLLoader
-from ms_deisotope.feature_map import ExtendedScanIndex
+from ms_deisotope.data_source.common import ScanBunch
+from ms_deisotope.data_source.mzml import MzMLLoader, decode_binary_arrays
+from ms_deisotope.data_source.binary_codecs import encode_array, resolve_codec, codec_dtype
+from ms_deisotope.feature_map import ExtendedScanIndex, ExtendedScanIndexWriter, LazyExtendedScanIndex
 
 
 class SampleRun(Base):
@@ -78,12 +89,269 @@ def describe_spectrum(peak_list):
     return descriptors
 
 
+def describe_spectrum_arrays(mz_array, intensity_array):
+    """Build the same spectrum descriptors as :func:`describe_spectrum`
+    from the peak arrays of a spectrum.
+
+    Parameters
+    ----------
+    mz_array : np.ndarray
+    intensity_array : np.ndarray
+
+    Returns
+    -------
+    list of dict
+    """
+    if len(mz_array) == 0:
+        return [
+            {"name": "base peak m/z", "value": 0},
+            {"name": "base peak intensity", "value": 0},
+            {"name": "total ion current", "value": 0},
+        ]
+    i = np.argmax(intensity_array)
+    return [
+        {"name": "base peak m/z", "value": float(mz_array[i])},
+        {"name": "base peak intensity", "value": float(intensity_array[i])},
+        {"name": "total ion current", "value": float(intensity_array.sum())},
+        {"name": "lowest observed m/z", "value": float(mz_array.min())},
+        {"name": "highest observed m/z", "value": float(mz_array.max())},
+    ]
+
+
+class PeakArrays(Base):
+    """The peaks of a spectrum as contiguous arrays, ready to be written by
+    :class:`MzMLScanSerializer` without visiting each peak again.
+
+    The arrays of deconvoluted peaks must include the charge, score and envelope
+    of every peak, all of which a deconvoluted spectrum is written with.
+
+    Attributes
+    ----------
+    mz_array : np.ndarray
+    intensity_array : np.ndarray
+    charge_array : np.ndarray or None
+        The charge of each peak of a deconvoluted spectrum
+    score_array : np.ndarray or None
+        The deconvolution score of each peak of a deconvoluted spectrum
+    envelopes : list of :class:`~.Envelope` or None
+        The isotopic envelope of each peak of a deconvoluted spectrum
+    """
+
+    def __init__(self, mz_array, intensity_array, charge_array=None, score_array=None, envelopes=None):
+        self.mz_array = np.asarray(mz_array, dtype=np.float64)
+        self.intensity_array = np.asarray(intensity_array, dtype=np.float64)
+        self.charge_array = np.asarray(charge_array, dtype=np.int32) if charge_array is not None else None
+        self.score_array = np.asarray(score_array, dtype=np.float64) if score_array is not None else None
+        self.envelopes = envelopes
+        self._validate()
+
+    def _validate(self):
+        deconvoluted = [self.charge_array, self.score_array, self.envelopes]
+        if any(array is not None for array in deconvoluted) and any(array is None for array in deconvoluted):
+            raise ValueError("The arrays of deconvoluted peaks must include charges, scores and envelopes")
+        n = len(self.mz_array)
+        for array in [self.intensity_array] + deconvoluted:
+            if array is not None and len(array) != n:
+                raise ValueError("All peak arrays must have the same length, %d != %d" % (len(array), n))
+
+    def __len__(self):
+        return len(self.mz_array)
+
+    @property
+    def is_deconvoluted(self):
+        return self.charge_array is not None
+
+    @classmethod
+    def from_peak_set(cls, peaks, deconvoluted=True):
+        """Collect the arrays of a peak set in a single pass over its peaks
+
+        Parameters
+        ----------
+        peaks : :class:`~.DeconvolutedPeakSet` or :class:`~.PeakIndex`
+        deconvoluted : bool
+            Whether `peaks` holds deconvoluted peaks, whose charges, scores
+            and envelopes are also collected
+
+        Returns
+        -------
+        PeakArrays
+        """
+        if not deconvoluted:
+            table = np.array([(p.mz, p.intensity) for p in peaks], dtype=np.float64).reshape((-1, 2))
+            return cls(np.ascontiguousarray(table[:, 0]), np.ascontiguousarray(table[:, 1]))
+        envelopes = []
+        rows = []
+        for p in peaks:
+            rows.append((p.mz, p.intensity, p.charge, p.score))
+            envelopes.append(p.envelope)
+        table = np.array(rows, dtype=np.float64).reshape((-1, 4))
+        return cls(
+            np.ascontiguousarray(table[:, 0]), np.ascontiguousarray(table[:, 1]),
+            table[:, 2].astype(np.int32), np.ascontiguousarray(table[:, 3]), envelopes)
+
+    def describe(self):
+        return describe_spectrum_arrays(self.mz_array, self.intensity_array)
+
+
+#: The types arrays are encoded as, matching the defaults of :meth:`psims.mzml.writer.MzMLWriter.spectrum`
+_array_dtypes = {
+    "m/z array": np.float64,
+    "charge array": np.int32,
+}
+
+
+#: A codec for each array of deconvoluted output, using MS-Numpress followed by zlib
+#: compression for the m/z, intensity and score arrays, and zlib compression alone
+#: for the charge and isotopic envelope arrays, which must be preserved exactly.
+NUMPRESS_COMPRESSION = {
+    "m/z array": "numpress-linear+zlib",
+    "intensity array": "numpress-slof+zlib",
+    "deconvolution score array": "numpress-slof+zlib",
+    "charge array": "zlib",
+}
+
+
+class EncodedArray(object):
+    """A binary data array which has already been converted, compressed and
+    base64 encoded, so that :class:`PreEncodedMzMLWriter` can write it as-is.
+
+    Attributes
+    ----------
+    encoded : bytes
+    length : int
+        The number of elements in the array before encoding
+    dtype : type
+    compression : str
+    """
+    __slots__ = ("encoded", "length", "dtype", "compression")
+
+    def __init__(self, encoded, length, dtype, compression):
+        self.encoded = encoded
+        self.length = length
+        self.dtype = dtype
+        self.compression = compression
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "%s(%d bytes, %d elements)" % (self.__class__.__name__, len(self.encoded), self.length)
+
+    def resolve(self):
+        return self
+
+
+class PreEncodedMzMLWriter(writer.MzMLWriter):
+    """An :class:`~psims.mzml.writer.MzMLWriter` which also accepts :class:`EncodedArray`
+    instances wherever it accepts an array, writing their already encoded data.
+    """
+
+    def _prepare_array(self, array, encoding=32, compression=writer.COMPRESSION_ZLIB,
+                       array_type=None, default_array_length=None, scope=None, **kwargs):
+        if not isinstance(array, EncodedArray):
+            return super(PreEncodedMzMLWriter, self)._prepare_array(
+                array, encoding=encoding, compression=compression, array_type=array_type,
+                default_array_length=default_array_length, scope=scope, **kwargs)
+        params = []
+        if array_type is not None:
+            params.append(array_type)
+            array_name = array_type['name'] if isinstance(array_type, dict) else array_type
+            if ARRAY_TYPES is not None and array_name not in ARRAY_TYPES:
+                params.append({"name": NON_STANDARD_ARRAY, "value": array_name})
+        params.append(array.compression)
+        params.append(dtype_to_encoding[array.dtype])
+        override_length = default_array_length is not None and array.length != default_array_length
+        return self.BinaryDataArray(
+            self.Binary(array.encoded), len(array.encoded),
+            array_length=(array.length if override_length else None),
+            params=params)
+
+
+def encode_binary_array(array, compression, dtype):
+    """Convert, compress and base64 encode `array`. This is the work
+    :class:`MzMLScanSerializer` hands to its encoding pool.
+
+    Parameters
+    ----------
+    array : np.ndarray
+    compression : str
+        A codec known to :mod:`~.binary_codecs`
+    dtype : type
+
+    Returns
+    -------
+    bytes
+    """
+    return encode_array(array, compression=compression, dtype=dtype)
+
+
+class _PendingSpectrum(object):
+    __slots__ = ("arrays", "other_arrays", "kwargs")
+
+    def __init__(self, arrays, other_arrays, kwargs):
+        self.arrays = arrays
+        self.other_arrays = other_arrays
+        self.kwargs = kwargs
+
+    def resolve(self):
+        arrays = [array.resolve() if array is not None else None for array in self.arrays]
+        other_arrays = [(name, array.resolve()) for name, array in self.other_arrays]
+        return arrays, other_arrays
+
+
+class _PendingArray(object):
+    __slots__ = ("result", "length", "dtype", "compression")
+
+    def __init__(self, result, length, dtype, compression):
+        self.result = result
+        self.length = length
+        self.dtype = dtype
+        self.compression = compression
+
+    def resolve(self):
+        return EncodedArray(self.result.get(), self.length, self.dtype, self.compression)
+
+
 class MzMLScanSerializer(ScanSerializerBase):
+    """Writes processed scans to an mzML file.
+
+    Encoding the binary data arrays of each spectrum may be handed to a pool of
+    workers with `encoding_pool`. Spectra are then written in the order they were
+    saved once their arrays are ready, and at most `max_in_flight` spectra are held
+    waiting for their arrays at once.
+
+    Parameters
+    ----------
+    handle : file
+        The file to write to
+    n_spectra : int
+        The number of spectra which will be written
+    compression : str or dict
+        The codec to encode each binary data array with, any of those known to
+        :mod:`~.binary_codecs`, or a mapping from array name to codec, where arrays
+        not named use zlib compression. See :data:`NUMPRESS_COMPRESSION`.
+    deconvoluted : bool
+        Whether to write the deconvoluted peak sets of scans
+    sample_name : str, optional
+    build_extra_index : bool
+        Whether to write an extended scan index alongside the file. It is written
+        by an :class:`~.ExtendedScanIndexWriter` as each scan bunch is saved.
+    compact_envelopes : bool
+        Whether to write isotopic envelopes in the compact encoding
+    encoding_pool : int or Pool, optional
+        If an :class:`int` greater than zero, the number of threads used to encode
+        arrays. Otherwise any object with an ``apply_async`` method, like a
+        :class:`multiprocessing.Pool`, which is not closed by the serializer.
+        By default arrays are encoded on the calling thread.
+    max_in_flight : int
+        The maximum number of spectra waiting for their arrays to be encoded
+    """
 
     def __init__(self, handle, n_spectra=2e4, compression=writer.COMPRESSION_ZLIB,
-                 deconvoluted=True, sample_name=None, build_extra_index=True):
+                 deconvoluted=True, sample_name=None, build_extra_index=True,
+                 compact_envelopes=False, encoding_pool=None, max_in_flight=32):
         self.handle = handle
-        self.writer = writer.MzMLWriter(handle)
+        self.writer = PreEncodedMzMLWriter(handle)
         self.n_spectra = n_spectra
         self.compression = compression
         self._has_started_writing_spectra = False
@@ -95,6 +363,7 @@ class MzMLScanSerializer(ScanSerializerBase):
 
         self.writer.controlled_vocabularies()
         self.deconvoluted = deconvoluted
+        self.compact_envelopes = compact_envelopes
         self.sample_name = sample_name
 
         self.file_contents_list = []
@@ -121,8 +390,18 @@ class MzMLScanSerializer(ScanSerializerBase):
         self.chromatogram_queue = []
 
         self.indexer = None
-        if build_extra_index:
-            self.indexer = ExtendedScanIndex()
+        self.build_extra_index = build_extra_index
+
+        self._owns_encoding_pool = False
+        if isinstance(encoding_pool, int):
+            if encoding_pool > 0:
+                encoding_pool = ThreadPool(encoding_pool)
+                self._owns_encoding_pool = True
+            else:
+                encoding_pool = None
+        self.encoding_pool = encoding_pool
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self._in_flight = deque()
 
     def add_instrument_configuration(self, configuration):
         component_list = []
@@ -237,10 +516,13 @@ class MzMLScanSerializer(ScanSerializerBase):
         })
         # NOTE: Only correct for CID/HCD spectra with absolute collision energies, but that is all I have
         # to test with.
+        # The unit is named by accession since its label differs between
+        # versions of the unit ontology
         params.append({
             "name": "collision energy",
             "value": activation_information.energy,
-            "unitName": "electron volts"
+            "unitAccession": "UO:0000266",
+            "unitName": "electronvolt"
         })
         for key, val in activation_information.data.items():
             arg = {
@@ -287,107 +569,166 @@ class MzMLScanSerializer(ScanSerializerBase):
             }
         return package
 
-    def _prepare_extra_arrays(self, scan):
+    def _prepare_extra_arrays(self, scan, peak_arrays=None):
+        if peak_arrays is None:
+            peak_arrays = self._get_peak_arrays(scan)
         extra_arrays = []
         if self.deconvoluted:
-            score_array = [
-                peak.score for peak in scan.deconvoluted_peak_set
-            ]
-            extra_arrays.append(("deconvolution score array", score_array))
-            envelope_array = envelopes_to_array([peak.envelope for peak in scan.deconvoluted_peak_set])
-            extra_arrays.append(("isotopic envelopes array", envelope_array))
+            extra_arrays.append(("deconvolution score array", peak_arrays.score_array))
+            if self.compact_envelopes:
+                envelope_array = envelopes_to_compact_array(
+                    peak_arrays.envelopes, peak_arrays.mz_array)
+                extra_arrays.append(("compact isotopic envelopes array", envelope_array))
+            else:
+                envelope_array = envelopes_to_array(peak_arrays.envelopes)
+                extra_arrays.append(("isotopic envelopes array", envelope_array))
         return extra_arrays
 
-    def save_scan_bunch(self, bunch, **kwargs):
-        if not self._has_started_writing_spectra:
-            self._add_spectrum_list()
-            self._has_started_writing_spectra = True
-
+    def _get_peak_arrays(self, scan):
         if self.deconvoluted:
-            precursor_peaks = bunch.precursor.deconvoluted_peak_set
+            peaks = scan.deconvoluted_peak_set
         else:
-            precursor_peaks = bunch.precursor.peak_set
-
-        if len(precursor_peaks) == 0:
-            return
-
-        polarity = bunch.precursor.polarity
-        if self.deconvoluted:
-            charge_array = [p.charge for p in precursor_peaks]
-        else:
-            charge_array = None
-
-        descriptors = describe_spectrum(precursor_peaks)
+            peaks = scan.peak_set
+        return PeakArrays.from_peak_set(peaks, self.deconvoluted)
+
+    def _resolve_peak_arrays(self, scan, peak_arrays):
+        arrays = peak_arrays.get(scan.id)
+        if arrays is None:
+            return self._get_peak_arrays(scan)
+        if self.deconvoluted and not arrays.is_deconvoluted:
+            raise ValueError(
+                "The peak arrays of %r lack the charges, scores and envelopes of deconvoluted peaks" % (
+                    scan.id,))
+        return arrays
+
+    def _write_scan(self, scan, peak_arrays, is_precursor=True):
+        descriptors = peak_arrays.describe()
+        self.total_ion_chromatogram_tracker[
+            scan.scan_time] = _total_intensity_from_descriptors(descriptors)
+        self.base_peak_chromatogram_tracker[
+            scan.scan_time] = _base_peak_from_descriptors(descriptors)
 
-        instrument_config = bunch.precursor.instrument_configuration
+        instrument_config = scan.instrument_configuration
         if instrument_config is None:
             instrument_config_id = None
         else:
             instrument_config_id = instrument_config.id
 
-        self.writer.write_spectrum(
-            [p.mz for p in precursor_peaks], [p.intensity for p in precursor_peaks], charge_array,
-            id=bunch.precursor.id, params=[
-                {"name": "ms level", "value": bunch.precursor.ms_level},
-                {"name": "MS1 spectrum"}] + descriptors,
-            polarity=polarity,
-            scan_start_time=bunch.precursor.scan_time,
-            compression=self.compression,
-            other_arrays=self._prepare_extra_arrays(bunch.precursor),
-            instrument_configuration_id=instrument_config_id)
+        if is_precursor:
+            params = [{"name": "ms level", "value": scan.ms_level}, {"name": "MS1 spectrum"}]
+            precursor_information = None
+        else:
+            params = [{"name": "ms level", "value": scan.ms_level}, {"name": "MSn spectrum"}]
+            precursor_information = self._pack_precursor_information(
+                scan.precursor_information, scan.activation, scan.isolation_window)
+
+        self._write_spectrum(
+            [peak_arrays.mz_array, peak_arrays.intensity_array,
+             peak_arrays.charge_array if self.deconvoluted else None],
+            self._prepare_extra_arrays(scan, peak_arrays),
+            dict(id=scan.id, params=params + descriptors,
+                 polarity=scan.polarity,
+                 scan_start_time=scan.scan_time,
+                 precursor_information=precursor_information,
+                 instrument_configuration_id=instrument_config_id))
+
+    def _compression_for(self, array_name):
+        if isinstance(self.compression, dict):
+            return self.compression.get(array_name, writer.COMPRESSION_ZLIB)
+        return self.compression
+
+    def _encode_array(self, array_name, array, dtype=None):
+        if dtype is None:
+            dtype = _array_dtypes.get(array_name, np.float32)
+        compression = resolve_codec(self._compression_for(array_name))
+        dtype = codec_dtype(compression, dtype)
+        if self.encoding_pool is None:
+            return EncodedArray(encode_binary_array(array, compression, dtype), len(array), dtype, compression)
+        result = self.encoding_pool.apply_async(encode_binary_array, (array, compression, dtype))
+        return _PendingArray(result, len(array), dtype, compression)
+
+    def _write_spectrum(self, arrays, other_arrays, kwargs):
+        names = ("m/z array", "intensity array", "charge array")
+        pending = _PendingSpectrum(
+            [self._encode_array(name, array) if array is not None else None
+             for name, array in zip(names, arrays)],
+            [(name, self._encode_array(name, array)) for name, array in other_arrays],
+            kwargs)
+        self._in_flight.append(pending)
+        limit = self.max_in_flight if self.encoding_pool is not None else 0
+        while len(self._in_flight) > limit:
+            self._write_pending(self._in_flight.popleft())
+
+    def _write_pending(self, pending):
+        arrays, other_arrays = pending.resolve()
+        self.writer.write_spectrum(*arrays, other_arrays=other_arrays, **pending.kwargs)
+
+    def flush(self):
+        """Wait for the arrays of every spectrum saved so far to be encoded,
+        and write those spectra.
+        """
+        while self._in_flight:
+            self._write_pending(self._in_flight.popleft())
 
-        self.total_ion_chromatogram_tracker[
-            bunch.precursor.scan_time] = _total_intensity_from_descriptors(descriptors)
-        self.base_peak_chromatogram_tracker[
-            bunch.precursor.scan_time] = _base_peak_from_descriptors(descriptors)
+    def _close_encoding_pool(self):
+        if self._owns_encoding_pool and self.encoding_pool is not None:
+            self.encoding_pool.close()
+            self.encoding_pool.join()
+            self.encoding_pool = None
+            self._owns_encoding_pool = False
 
-        for prod in bunch.products:
-            if self.deconvoluted:
-                product_peaks = prod.deconvoluted_peak_set
-            else:
-                product_peaks = prod.peak_set
+    def save_scan_bunch(self, bunch, peak_arrays=None, **kwargs):
+        """Write the precursor and product scans of `bunch`.
 
-            descriptors = describe_spectrum(product_peaks)
+        Parameters
+        ----------
+        bunch : ScanBunch
+        peak_arrays : Mapping, optional
+            A mapping from scan id to :class:`PeakArrays` to write in place of
+            the peak sets of those scans, for callers which already hold their
+            peaks as arrays.
+        """
+        if not self._has_started_writing_spectra:
+            self._add_spectrum_list()
+            self._has_started_writing_spectra = True
 
-            self.total_ion_chromatogram_tracker[
-                prod.scan_time] = _total_intensity_from_descriptors(descriptors)
-            self.base_peak_chromatogram_tracker[
-                prod.scan_time] = _base_peak_from_descriptors(descriptors)
+        if peak_arrays is None:
+            peak_arrays = {}
 
-            if self.deconvoluted:
-                charge_array = [p.charge for p in product_peaks]
-            else:
-                charge_array = None
+        precursor_arrays = self._resolve_peak_arrays(bunch.precursor, peak_arrays)
 
-            instrument_config = prod.instrument_configuration
-            if instrument_config is None:
-                instrument_config_id = None
-            else:
-                instrument_config_id = instrument_config.id
-            self.writer.write_spectrum(
-                [p.mz for p in product_peaks], [p.intensity for p in product_peaks], charge_array,
-                id=prod.id, params=[
-                    {"name": "ms level", "value": prod.ms_level},
-                    {"name": "MSn spectrum"}] + descriptors,
-                polarity=prod.polarity,
-                scan_start_time=prod.scan_time,
-                precursor_information=self._pack_precursor_information(
-                    prod.precursor_information,
-                    prod.activation,
-                    prod.isolation_window),
-                compression=self.compression,
-                other_arrays=self._prepare_extra_arrays(prod),
-                instrument_configuration_id=instrument_config_id)
+        if len(precursor_arrays) == 0:
+            return
 
-        if self.indexer is not None:
-            self.indexer.add_scan_bunch(bunch)
+        self._write_scan(bunch.precursor, precursor_arrays, is_precursor=True)
+
+        for prod in bunch.products:
+            self._write_scan(prod, self._resolve_peak_arrays(prod, peak_arrays), is_precursor=False)
+
+        if self.build_extra_index:
+            if self.indexer is None:
+                self._open_indexer()
+            if self.indexer is not None:
+                self.indexer.add_scan_bunch(bunch)
+
+    def _open_indexer(self):
+        try:
+            name = self.handle.name
+        except AttributeError:
+            name = "_detatched_mzml_index"
+        try:
+            self.indexer = ExtendedScanIndexWriter(
+                open(ExtendedScanIndexWriter.index_file_name(name), 'w'))
+        except IOError as e:
+            warnings.warn("Could not write extended index file due to error %r" % (e,))
+            self.build_extra_index = False
 
     def save_chromatogram(self, chromatogram_dict, chromatogram_type, params=None, **kwargs):
         time_array, intensity_array = zip(*chromatogram_dict.items())
         self.writer.write_chromatogram(
-            time_array, intensity_array, id=kwargs.get('id'),
-            chromatogram_type=chromatogram_type, compression=self.compression,
-            params=params)
+            self._encode_array("time array", time_array, np.float32).resolve(),
+            self._encode_array("intensity array", intensity_array, np.float32).resolve(),
+            id=kwargs.get('id'), chromatogram_type=chromatogram_type, params=params)
 
     def _make_default_chromatograms(self):
         d = dict(
@@ -414,21 +755,18 @@ class MzMLScanSerializer(ScanSerializerBase):
                     **chromatogram)
 
     def complete(self):
+        try:
+            self.flush()
+        finally:
+            self._close_encoding_pool()
         self._spectrum_list_tag.__exit__(None, None, None)
         self._make_default_chromatograms()
         self.write_chromatograms()
         self._run_tag.__exit__(None, None, None)
         self.writer.__exit__(None, None, None)
         if self.indexer is not None:
-            try:
-                name = self.handle.name
-            except AttributeError:
-                name = "_detatched_mzml_index"
-            try:
-                with open(ExtendedScanIndex.index_file_name(name), 'w') as ixfile:
-                    self.indexer.serialize(ixfile)
-            except IOError as e:
-                warnings.warn("Could not write extended index file due to error %r" % (e,))
+            self.indexer.close()
+            self.indexer = None
 
     def format(self):
         try:
@@ -448,9 +786,13 @@ class MzMLScanSerializer(ScanSerializerBase):
 
 
 def deserialize_deconvoluted_peak_set(scan_dict):
-    envelopes = decode_envelopes(scan_dict["isotopic envelopes array"])
-    peaks = []
     mz_array = scan_dict['m/z array']
+    if "compact isotopic envelopes array" in scan_dict:
+        envelopes = decode_compact_envelopes(
+            scan_dict["compact isotopic envelopes array"], mz_array)
+    else:
+        envelopes = decode_envelopes(scan_dict["isotopic envelopes array"])
+    peaks = []
     intensity_array = scan_dict['intensity array']
     charge_array = scan_dict['charge array']
     score_array = scan_dict['deconvolution score array']
@@ -495,8 +837,8 @@ class ProcessedMzMLDeserializer(MzMLLoader, ScanDeserializerBase):
         that may have been generated with the data
         file being accessed.
     """
-    def __init__(self, source_file, use_index=True):
-        MzMLLoader.__init__(self, source_file, use_index=use_index)
+    def __init__(self, source_file, use_index=True, scan_cache=None):
+        MzMLLoader.__init__(self, source_file, use_index=use_index, scan_cache=scan_cache)
         self.extended_index = None
         self._scan_id_to_rt = dict()
         self._sample_run = None
@@ -513,14 +855,22 @@ class ProcessedMzMLDeserializer(MzMLLoader, ScanDeserializerBase):
             self._build_scan_id_to_rt_cache()
 
     def read_index_file(self):
-        with open(self._index_file_name) as handle:
-            self.extended_index = ExtendedScanIndex.deserialize(handle)
+        if os.path.exists(self._index_file_name):
+            self.extended_index = LazyExtendedScanIndex(self._index_file_name)
+        else:
+            with open(self._legacy_index_file_name) as handle:
+                self.extended_index = ExtendedScanIndex.deserialize(handle)
+
+    def close(self):
+        if isinstance(self.extended_index, LazyExtendedScanIndex):
+            self.extended_index.close()
+        super(ProcessedMzMLDeserializer, self).close()
 
     deserialize_deconvoluted_peak_set = staticmethod(deserialize_deconvoluted_peak_set)
     deserialize_peak_set = staticmethod(deserialize_peak_set)
 
     def has_index_file(self):
-        return os.path.exists(self._index_file_name)
+        return os.path.exists(self._index_file_name) or os.path.exists(self._legacy_index_file_name)
 
     def _make_sample_run(self):
         samples = self.samples()
@@ -607,24 +957,31 @@ class ProcessedMzMLDeserializer(MzMLLoader, ScanDeserializerBase):
 
     @property
     def _index_file_name(self):
+        return ExtendedScanIndexWriter.index_file_name(self.source_file)
+
+    @property
+    def _legacy_index_file_name(self):
         return ExtendedScanIndex.index_file_name(self.source_file)
 
     def build_extended_index(self, header_only=True):
         self.reset()
         indexer = ExtendedScanIndex()
+        try:
+            writer = ExtendedScanIndexWriter(open(self._index_file_name, 'w'))
+        except (IOError, OSError, TypeError) as err:
+            print(err)
+            writer = None
         iterator = self
         if header_only:
             iterator = self.iter_scan_headers()
         for bunch in iterator:
             indexer.add_scan_bunch(bunch)
+            if writer is not None:
+                writer.add_scan_bunch(bunch)
+        if writer is not None:
+            writer.close()
         self.reset()
         self.extended_index = indexer
-        try:
-            with open(self._index_file_name, 'w') as handle:
-                indexer.serialize(handle)
-        except (IOError, OSError, AttributeError) as err:
-            print(err)
-            pass
 
     def _make_scan(self, data):
         scan = super(ProcessedMzMLDeserializer, self)._make_scan(data)
@@ -633,7 +990,8 @@ class ProcessedMzMLDeserializer(MzMLLoader, ScanDeserializerBase):
             selected_ion_dict = self._get_selected_ion(data)
             scan.precursor_information.orphan = selected_ion_dict.get("ms_deisotope:orphan") == "true"
             scan.precursor_information.defaulted = selected_ion_dict.get("ms_deisotope:defaulted") == "true"
-        if "isotopic envelopes array" in data:
+        decode_binary_arrays(data)
+        if "isotopic envelopes array" in data or "compact isotopic envelopes array" in data:
             scan.peak_set = PeakIndex(np.array([]), np.array([]), PeakSet([]))
             scan.deconvoluted_peak_set = deserialize_deconvoluted_peak_set(data)
             if scan.id in self.extended_index.ms1_ids:
@@ -655,31 +1013,12 @@ class ProcessedMzMLDeserializer(MzMLLoader, ScanDeserializerBase):
 
     def _build_scan_id_to_rt_cache(self):
         if self.extended_index:
-            for key in self.extended_index.ms1_ids:
-                self._scan_id_to_rt[key] = self.extended_index.ms1_ids[key]['scan_time']
-            for key in self.extended_index.msn_ids:
-                self._scan_id_to_rt[key] = self.extended_index.msn_ids[key]['scan_time']
+            self._scan_id_to_rt.update(self.extended_index.scan_times())
 
     # LC-MS/MS Database API
 
     def precursor_information(self):
-        out = []
-        for key, info in self.extended_index.msn_ids.items():
-            mz = info['mz']
-            neutral_mass = info['neutral_mass']
-            charge = info['charge']
-            intensity = info['intensity']
-            precursor_scan_id = info['precursor_scan_id']
-            product_scan_id = info['product_scan_id']
-            orphan = info.get('orphan', False)
-            defaulted = info.get('defaulted', False)
-            pinfo = PrecursorInformation(
-                mz, intensity, charge, precursor_scan_id,
-                self, neutral_mass, charge, intensity,
-                product_scan_id=product_scan_id, orphan=orphan,
-                defaulted=defaulted)
-            out.append(pinfo)
-        return out
+        return self.extended_index.get_precursor_information(self)
 
     def ms1_peaks_above(self, mass_threshold=500, intensity_threshold=1000.):
         accumulate = []
@@ -693,8 +1032,8 @@ class ProcessedMzMLDeserializer(MzMLLoader, ScanDeserializerBase):
 
     def ms1_scan_times(self):
         times = sorted(
-            [bundle['scan_time'] for bundle in
-             self.extended_index.ms1_ids.values()])
+            [self.convert_scan_id_to_retention_time(scan_id) for scan_id in
+             self.extended_index.ms1_ids])
         return np.array(times)
 
     def extract_total_ion_current_chromatogram(self):
@@ -705,25 +1044,26 @@ class ProcessedMzMLDeserializer(MzMLLoader, ScanDeserializerBase):
         return np.array(current)
 
     def msms_for(self, neutral_mass, mass_error_tolerance=1e-5, start_time=None, end_time=None):
-        m = neutral_mass
-        w = neutral_mass * mass_error_tolerance
-        lo = m - w
-        hi = m + w
-        out = []
-        for pinfo in self.precursor_information():
-            if lo <= pinfo.neutral_mass <= hi:
-                valid = True
-                product = None
-                if start_time is not None or end_time is not None:
-                    product = self.get_scan_header_by_id(pinfo.product_scan_id)
-                if start_time is not None and product.scan_time < start_time:
-                    valid = False
-                elif end_time is not None and product.scan_time > end_time:
-                    valid = False
-                if valid:
-                    out.append(pinfo)
-        return out
+        """Find the precursors of MSn scans whose neutral mass is within `mass_error_tolerance`
+        of `neutral_mass`, and optionally whose MSn scan was acquired between `start_time`
+        and `end_time`, inclusive.
 
+        This is a range query over the extended index's :class:`~.PrecursorMassIndex`,
+        which is built once and reused by later queries.
+
+        Parameters
+        ----------
+        neutral_mass : float
+        mass_error_tolerance : float
+        start_time : float, optional
+        end_time : float, optional
+
+        Returns
+        -------
+        list of :class:`~.PrecursorInformation`
+        """
+        return self.extended_index.find_msms_by_precursor_mass(
+            neutral_mass, mass_error_tolerance, self, start_time, end_time)
 
 try:
     has_c = True
@@ -0,0 +1,437 @@
+"""Write processed mzML in shards, one per worker, and merge the shards into a
+single indexed mzML file.
+
+When scans are deconvoluted in parallel, each worker writes the scan bunches it
+processed to its own shard with :class:`MzMLShardSerializer`, instead of sending
+them back to be written in order by a single :class:`~.MzMLScanSerializer`. Each
+shard is a complete processed mzML file with its own extended scan index.
+
+:func:`merge_mzml_shards` then orders the scan bunches of all shards by the scan
+time of their precursors using the shards' extended scan indices, and copies the
+XML of each spectrum into the merged file as-is, without decoding its binary data
+arrays. Only the ``index`` attribute of each spectrum is rewritten. The total ion
+current and base peak chromatograms are rebuilt from the summary parameters of
+each spectrum, and the offset index and checksum of the merged file are computed
+as it is written.
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from xml.sax.saxutils import escape, unescape
+
+import numpy as np
+
+from ms_deisotope.data_source.binary_codecs import (
+    encode_array, resolve_codec, NO_COMPRESSION, ZLIB_COMPRESSION)
+from ms_deisotope.feature_map import ExtendedScanIndexWriter
+
+from .mzml import MzMLScanSerializer
+
+
+def shard_file_name(path, shard_index):
+    """Get the path of the shard numbered `shard_index` of the mzML
+    file to be written at `path`.
+
+    Parameters
+    ----------
+    path : str
+    shard_index : int
+
+    Returns
+    -------
+    str
+    """
+    root, ext = os.path.splitext(path)
+    return "%s.shard-%03d%s" % (root, shard_index, ext)
+
+
+class MzMLShardSerializer(MzMLScanSerializer):
+    """Writes the scan bunches processed by one worker to a shard of the mzML
+    file to be written at `path`, along with the extended scan index of those
+    scan bunches, for :func:`merge_mzml_shards` to combine.
+
+    Parameters
+    ----------
+    path : str
+        The path of the merged mzML file
+    shard_index : int
+        The number of this shard, unique among the workers
+    **kwargs
+        Forwarded to :class:`~.MzMLScanSerializer`
+    """
+
+    def __init__(self, path, shard_index, **kwargs):
+        kwargs['build_extra_index'] = True
+        self.path = shard_file_name(path, shard_index)
+        self.shard_index = shard_index
+        super(MzMLShardSerializer, self).__init__(open(self.path, 'wb'), **kwargs)
+
+    def complete(self):
+        # A worker which was given no scans still writes a valid, empty shard
+        if not self._has_started_writing_spectra:
+            self._add_spectrum_list()
+            self._has_started_writing_spectra = True
+        if self.indexer is None:
+            self._open_indexer()
+        super(MzMLShardSerializer, self).complete()
+        if not self.handle.closed:
+            self.handle.close()
+
+
+_index_list_offset_pattern = re.compile(br"<indexListOffset>(\d+)</indexListOffset>")
+_index_pattern = re.compile(br"<index name=\"([^\"]+)\">(.*?)</index>", re.DOTALL)
+_offset_pattern = re.compile(br"<offset idRef=\"([^\"]*)\">(\d+)</offset>")
+_spectrum_index_pattern = re.compile(br"(<spectrum\b[^>]*?\sindex=\")\d+(\")")
+_spectrum_list_count_pattern = re.compile(br"(<spectrumList\b[^>]*?\scount=\")[^\"]*(\")")
+_data_processing_ref_pattern = re.compile(br"<spectrumList\b[^>]*?\sdefaultDataProcessingRef=\"([^\"]*)\"")
+_attribute_pattern = re.compile(br"(\w+)=\"([^\"]*)\"")
+
+
+def _cv_param_pattern(accession):
+    return re.compile(br"<cvParam\b[^>]*?\saccession=\"" + accession + br"\"[^>]*>")
+
+
+_scan_start_time_pattern = _cv_param_pattern(b"MS:1000016")
+_total_ion_current_pattern = _cv_param_pattern(b"MS:1000285")
+_base_peak_intensity_pattern = _cv_param_pattern(b"MS:1000505")
+
+
+def _cv_param_value(pattern, block):
+    match = pattern.search(block)
+    if match is None:
+        return None, None
+    attributes = dict(_attribute_pattern.findall(match.group(0)))
+    return float(attributes[b'value']), attributes.get(b'unitName')
+
+
+class _ShardBunch(object):
+    __slots__ = ("scan_time", "scan_ids", "index_lines")
+
+    def __init__(self, scan_time):
+        self.scan_time = scan_time
+        self.scan_ids = []
+        self.index_lines = []
+
+
+class _ShardReader(object):
+    """Reads the spectrum offset index and the extended scan index of a
+    shard, and the XML of its spectra.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = open(path, 'rb')
+        self.spectrum_bounds = OrderedDict()
+        self.bunches = []
+        self._read_offset_index()
+        self._read_scan_index()
+
+    def _read_offset_index(self):
+        self.handle.seek(0, os.SEEK_END)
+        size = self.handle.tell()
+        self.handle.seek(max(size - 1024, 0))
+        match = _index_list_offset_pattern.search(self.handle.read())
+        if match is None:
+            raise ValueError("%r is not a complete indexed mzML file" % (self.path,))
+        index_list_offset = int(match.group(1))
+        self.handle.seek(index_list_offset)
+        indices = {
+            name: [(unescape(ref.decode('utf8'), {"&quot;": '"'}), int(offset))
+                   for ref, offset in _offset_pattern.findall(body)]
+            for name, body in _index_pattern.findall(self.handle.read())
+        }
+        spectra = indices.get(b"spectrum", [])
+        if not spectra:
+            return
+        chromatograms = indices.get(b"chromatogram", [])
+        boundary = chromatograms[0][1] if chromatograms else index_list_offset
+        last_offset = spectra[-1][1]
+        self.handle.seek(last_offset)
+        end = self.handle.read(boundary - last_offset).find(b"</spectrumList>")
+        if end == -1:
+            raise ValueError("Could not find the end of the spectrum list of %r" % (self.path,))
+        ends = [offset for _, offset in spectra[1:]] + [last_offset + end]
+        for (scan_id, start), end in zip(spectra, ends):
+            self.spectrum_bounds[scan_id] = (start, end)
+
+    def _read_scan_index(self):
+        index_path = ExtendedScanIndexWriter.index_file_name(self.path)
+        if not os.path.exists(index_path):
+            if self.spectrum_bounds:
+                raise ValueError("The shard %r has no extended scan index" % (self.path,))
+            return
+        with open(index_path, 'r') as handle:
+            fields = handle.readline().rstrip('\n').split('\t')
+            if fields[0] != ExtendedScanIndexWriter.FORMAT_MARKER:
+                raise ValueError("%r is not an extended scan index file" % (index_path,))
+            # Records are copied verbatim under the current header, so they must
+            # already be in the current layout
+            version = fields[1] if len(fields) > 1 else None
+            if version != ExtendedScanIndexWriter.SCHEMA_VERSION:
+                raise ValueError("%r has extended scan index schema version %r, expected %r" % (
+                    index_path, version, ExtendedScanIndexWriter.SCHEMA_VERSION))
+            bunch = None
+            for line in handle:
+                if not line.endswith('\n'):
+                    break
+                kind, scan_id, scan_time, _ = line.split('\t', 3)
+                if kind == 'ms1' or bunch is None:
+                    bunch = _ShardBunch(float(scan_time))
+                    self.bunches.append(bunch)
+                bunch.scan_ids.append(scan_id)
+                bunch.index_lines.append(line)
+
+    def has_spectra(self):
+        return bool(self.spectrum_bounds)
+
+    def read_header(self):
+        """Read everything before the first spectrum of the shard
+        """
+        start = next(iter(self.spectrum_bounds.values()))[0]
+        self.handle.seek(0)
+        return self.handle.read(start)
+
+    def read_spectrum(self, scan_id):
+        try:
+            start, end = self.spectrum_bounds[scan_id]
+        except KeyError:
+            raise KeyError("Spectrum %r is not in the shard %r" % (scan_id, self.path))
+        self.handle.seek(start)
+        return self.handle.read(end - start).rstrip()
+
+    def close(self):
+        self.handle.close()
+
+
+#: The controlled vocabulary accessions of the codecs chromatograms may be written with
+_chromatogram_codec_accessions = {
+    NO_COMPRESSION: "MS:1000576",
+    ZLIB_COMPRESSION: "MS:1000574",
+}
+
+
+_chromatogram_types = [
+    ("TIC", "MS:1000235", "total ion current chromatogram"),
+    ("BPC", "MS:1000628", "basepeak chromatogram"),
+]
+
+
+# The first line is not indented, so that the offset of each chromatogram can be
+# recorded after writing its indentation
+_chromatogram_template = u"""\
+<chromatogram index="{index}" defaultArrayLength="{length}" id="{id}">
+          <cvParam cvRef="PSI-MS" accession="{accession}" name="{name}" value=""/>
+          <binaryDataArrayList count="2">
+            <binaryDataArray encodedLength="{time_length}">
+              <cvParam cvRef="PSI-MS" accession="MS:1000595" name="time array" value="" \
+unitCvRef="PSI-MS" unitAccession="UO:0000031" unitName="minute"/>
+              <cvParam cvRef="PSI-MS" accession="{codec_accession}" name="{codec}" value=""/>
+              <cvParam cvRef="PSI-MS" accession="MS:1000521" name="32-bit float" value=""/>
+              <binary>{time}</binary>
+            </binaryDataArray>
+            <binaryDataArray encodedLength="{intensity_length}">
+              <cvParam cvRef="PSI-MS" accession="MS:1000515" name="intensity array" value="" \
+unitCvRef="PSI-MS" unitAccession="MS:1000131" unitName="number of detector counts"/>
+              <cvParam cvRef="PSI-MS" accession="{codec_accession}" name="{codec}" value=""/>
+              <cvParam cvRef="PSI-MS" accession="MS:1000521" name="32-bit float" value=""/>
+              <binary>{intensity}</binary>
+            </binaryDataArray>
+          </binaryDataArrayList>
+        </chromatogram>
+"""
+
+
+class MzMLShardMerger(object):
+    """Merges the shards written by :class:`MzMLShardSerializer` into a single
+    indexed mzML file and extended scan index.
+
+    The document header, everything before the first spectrum, is taken from the
+    first shard which has any spectra.
+
+    Parameters
+    ----------
+    shard_paths : list of str
+        The paths of the shards
+    compression : str
+        The codec to encode the chromatograms with, either ``"zlib"`` or ``"none"``
+    """
+
+    def __init__(self, shard_paths, compression=ZLIB_COMPRESSION):
+        self.shard_paths = list(shard_paths)
+        self.compression = resolve_codec(compression)
+        if self.compression not in _chromatogram_codec_accessions:
+            raise ValueError("Chromatograms cannot be written with %r" % (compression,))
+        self.handle = None
+        self.position = 0
+        self._checksum = None
+        self.spectrum_offsets = OrderedDict()
+        self.chromatogram_offsets = OrderedDict()
+        self.total_ion_chromatogram_tracker = OrderedDict()
+        self.base_peak_chromatogram_tracker = OrderedDict()
+
+    def _write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf8')
+        self.handle.write(data)
+        self._checksum.update(data)
+        self.position += len(data)
+
+    def _ordered_bunches(self, shards):
+        keyed = []
+        for i, shard in enumerate(shards):
+            for j, bunch in enumerate(shard.bunches):
+                keyed.append(((bunch.scan_time, i, j), shard, bunch))
+        keyed.sort(key=lambda x: x[0])
+        return [(shard, bunch) for _, shard, bunch in keyed]
+
+    def _track_chromatograms(self, block):
+        # Only the summary parameters before the binary data arrays are needed
+        end = block.find(b"<binaryDataArrayList")
+        if end != -1:
+            block = block[:end]
+        scan_time, unit = _cv_param_value(_scan_start_time_pattern, block)
+        if scan_time is None:
+            return
+        if unit == b"second":
+            scan_time /= 60.0
+        total_ion_current, _ = _cv_param_value(_total_ion_current_pattern, block)
+        if total_ion_current is not None:
+            self.total_ion_chromatogram_tracker[scan_time] = total_ion_current
+        base_peak_intensity, _ = _cv_param_value(_base_peak_intensity_pattern, block)
+        if base_peak_intensity is not None:
+            self.base_peak_chromatogram_tracker[scan_time] = base_peak_intensity
+
+    def _write_spectra(self, ordered):
+        for shard, bunch in ordered:
+            for scan_id in bunch.scan_ids:
+                if scan_id in self.spectrum_offsets:
+                    raise ValueError("Spectrum %r appears in more than one shard" % (scan_id,))
+                block = shard.read_spectrum(scan_id)
+                block = _spectrum_index_pattern.sub(
+                    br"\g<1>%d\g<2>" % len(self.spectrum_offsets), block, count=1)
+                self._track_chromatograms(block)
+                self._write(b"        ")
+                self.spectrum_offsets[scan_id] = self.position
+                self._write(block)
+                self._write(b"\n")
+
+    def _write_chromatograms(self, data_processing_ref):
+        trackers = [self.total_ion_chromatogram_tracker, self.base_peak_chromatogram_tracker]
+        chromatograms = [(kind, tracker) for kind, tracker in zip(_chromatogram_types, trackers) if tracker]
+        self._write(u'      <chromatogramList count="%d" defaultDataProcessingRef="%s">\n' % (
+            len(chromatograms), data_processing_ref))
+        for i, ((chromatogram_id, accession, name), tracker) in enumerate(chromatograms):
+            time_array = encode_array(list(tracker.keys()), self.compression, np.float32)
+            intensity_array = encode_array(list(tracker.values()), self.compression, np.float32)
+            self._write(u"        ")
+            self.chromatogram_offsets[chromatogram_id] = self.position
+            self._write(_chromatogram_template.format(
+                index=i, length=len(tracker), id=chromatogram_id, accession=accession,
+                name=name, codec=self.compression,
+                codec_accession=_chromatogram_codec_accessions[self.compression],
+                time_length=len(time_array), time=time_array.decode('ascii'),
+                intensity_length=len(intensity_array),
+                intensity=intensity_array.decode('ascii')))
+        self._write(u"      </chromatogramList>\n")
+
+    def _write_index_list(self):
+        indices = [(name, offsets) for name, offsets in [
+            ("spectrum", self.spectrum_offsets), ("chromatogram", self.chromatogram_offsets)] if offsets]
+        self._write(u"  ")
+        index_list_offset = self.position
+        self._write(u'<indexList count="%d">\n' % len(indices))
+        for name, offsets in indices:
+            self._write(u'    <index name="%s">\n' % name)
+            for ref, offset in offsets.items():
+                self._write(u'      <offset idRef="%s">%d</offset>\n' % (
+                    escape(ref, {'"': "&quot;"}), offset))
+            self._write(u"    </index>\n")
+        self._write(u"  </indexList>\n")
+        self._write(u"  <indexListOffset>%d</indexListOffset>\n" % index_list_offset)
+        self._write(u"  <fileChecksum>")
+        self._write(self._checksum.hexdigest())
+        self._write(u"</fileChecksum>\n</indexedmzML>")
+
+    def _write_scan_index(self, path, ordered):
+        writer = ExtendedScanIndexWriter(open(ExtendedScanIndexWriter.index_file_name(path), 'w'))
+        for _, bunch in ordered:
+            for line in bunch.index_lines:
+                writer.handle.write(line)
+        writer.close()
+
+    def merge(self, path):
+        """Write the merged mzML file and its extended scan index
+
+        Parameters
+        ----------
+        path : str
+            The path to write the merged mzML file to
+
+        Returns
+        -------
+        int
+            The number of spectra written
+        """
+        shards = [_ShardReader(shard_path) for shard_path in self.shard_paths]
+        try:
+            source = [shard for shard in shards if shard.has_spectra()]
+            if not source:
+                raise ValueError("None of the shards have any spectra to merge")
+            ordered = self._ordered_bunches(shards)
+            n_spectra = sum(len(bunch.scan_ids) for _, bunch in ordered)
+            header = source[0].read_header()
+            data_processing_ref = _data_processing_ref_pattern.search(header)
+            data_processing_ref = data_processing_ref.group(1).decode('utf8') if data_processing_ref else ""
+            header = _spectrum_list_count_pattern.sub(br"\g<1>%d\g<2>" % n_spectra, header, count=1)
+            # The header ends with the indentation of the first spectrum
+            header = header.rstrip(b" ")
+
+            self.handle = open(path, 'wb')
+            self.position = 0
+            self._checksum = hashlib.sha1()
+            try:
+                self._write(header)
+                self._write_spectra(ordered)
+                self._write(u"      </spectrumList>\n")
+                self._write_chromatograms(data_processing_ref)
+                self._write(u"    </run>\n  </mzML>\n")
+                self._write_index_list()
+            finally:
+                self.handle.close()
+            self._write_scan_index(path, ordered)
+            return n_spectra
+        finally:
+            for shard in shards:
+                shard.close()
+
+
+def merge_mzml_shards(shard_paths, path, compression=ZLIB_COMPRESSION, remove_shards=False):
+    """Merge the shards written by :class:`MzMLShardSerializer` into a single
+    indexed mzML file at `path`, without decoding their spectra.
+
+    Parameters
+    ----------
+    shard_paths : list of str
+        The paths of the shards, as given by :func:`shard_file_name`
+    path : str
+        The path to write the merged mzML file to
+    compression : str
+        The codec to encode the chromatograms with
+    remove_shards : bool
+        Whether to delete the shards and their extended scan indices once
+        they have been merged
+
+    Returns
+    -------
+    int
+        The number of spectra written
+    """
+    n_spectra = MzMLShardMerger(shard_paths, compression).merge(path)
+    if remove_shards:
+        for shard_path in shard_paths:
+            os.remove(shard_path)
+            index_path = ExtendedScanIndexWriter.index_file_name(shard_path)
+            if os.path.exists(index_path):
+                os.remove(index_path)
+    return n_spectra
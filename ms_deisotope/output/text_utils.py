@@ -67,9 +67,135 @@ def decode_envelopes(array):
     return envelope_list
 
 
+#: The number of levels used when quantizing envelope intensities relative
+#: to the most abundant member of each envelope
+ENVELOPE_INTENSITY_QUANTA = 65535.
+
+
+def envelopes_to_compact_array(envelope_list, mz_array, dtype=np.float32):
+    """Encode a list of isotopic envelopes in a compact, count-prefixed layout.
+
+    The encoded array has the layout ``[N, counts(N), scales(N), deltas(T),
+    quanta(T)]`` where ``N`` is the number of envelopes and ``T`` is the total
+    number of envelope members. Each member's m/z is stored as an offset from
+    the monoisotopic m/z of its peak, taken from `mz_array`, and each member's
+    intensity is quantized to an integer fraction of the most abundant member
+    of its envelope, ``scale``.
+
+    Parameters
+    ----------
+    envelope_list : list of :class:`~.Envelope`
+        The envelopes to encode
+    mz_array : np.ndarray
+        The m/z of the peak each envelope belongs to, in the same order
+        as `envelope_list`
+    dtype : type, optional
+        The element type of the resulting array
+
+    Returns
+    -------
+    np.ndarray
+    """
+    n = len(envelope_list)
+    counts = np.zeros(n, dtype=dtype)
+    scales = np.zeros(n, dtype=dtype)
+    mzs = []
+    intensities = []
+    for i, envelope in enumerate(envelope_list):
+        k = len(envelope)
+        counts[i] = k
+        for pair in envelope:
+            mzs.append(pair.mz)
+            intensities.append(pair.intensity)
+    counts_int = counts.astype(np.intp)
+    mzs = np.array(mzs, dtype=np.float64)
+    intensities = np.array(intensities, dtype=np.float64)
+    if len(intensities):
+        owner = np.repeat(np.arange(n), counts_int)
+        starts = np.zeros(n, dtype=np.intp)
+        np.cumsum(counts_int[:-1], out=starts[1:])
+        nonempty = counts_int > 0
+        scales[nonempty] = np.maximum.reduceat(intensities, starts[nonempty])
+        deltas = mzs - np.repeat(np.asarray(mz_array, dtype=np.float64), counts_int)
+        scale_per_member = scales[owner].astype(np.float64)
+        scale_per_member[scale_per_member == 0] = 1.0
+        quanta = np.round(intensities / scale_per_member * ENVELOPE_INTENSITY_QUANTA)
+    else:
+        deltas = np.zeros(0)
+        quanta = np.zeros(0)
+    return np.concatenate(
+        ([n], counts, scales, deltas, quanta)).astype(dtype)
+
+
+def decode_compact_envelope_arrays(array, mz_array):
+    """Decode an array produced by :func:`envelopes_to_compact_array` into
+    flat arrays without constructing any :class:`~.Envelope` objects.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        The compact envelope array
+    mz_array : np.ndarray
+        The m/z of the peak each envelope belongs to
+
+    Returns
+    -------
+    offsets : np.ndarray
+        The starting position of each envelope in `mzs` and `intensities`, with
+        one extra trailing entry giving the total number of members
+    mzs : np.ndarray
+        The m/z of every envelope member
+    intensities : np.ndarray
+        The intensity of every envelope member
+    """
+    array = np.asarray(array)
+    if len(array) == 0:
+        return np.zeros(1, dtype=np.intp), np.zeros(0), np.zeros(0)
+    n = int(array[0])
+    counts = array[1:n + 1].astype(np.intp)
+    scales = array[n + 1:2 * n + 1].astype(np.float64)
+    total = counts.sum()
+    start = 2 * n + 1
+    deltas = array[start:start + total].astype(np.float64)
+    quanta = array[start + total:start + 2 * total].astype(np.float64)
+    offsets = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(counts, out=offsets[1:])
+    mzs = np.repeat(np.asarray(mz_array, dtype=np.float64)[:n], counts) + deltas
+    intensities = quanta * (np.repeat(scales, counts) / ENVELOPE_INTENSITY_QUANTA)
+    return offsets, mzs, intensities
+
+
+def decode_compact_envelopes(array, mz_array):
+    """Decode an array produced by :func:`envelopes_to_compact_array`
+    into a list of :class:`~.Envelope` objects.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        The compact envelope array
+    mz_array : np.ndarray
+        The m/z of the peak each envelope belongs to
+
+    Returns
+    -------
+    list of :class:`~.Envelope`
+    """
+    offsets, mzs, intensities = decode_compact_envelope_arrays(array, mz_array)
+    mzs = mzs.tolist()
+    intensities = intensities.tolist()
+    envelope_list = []
+    for i in range(len(offsets) - 1):
+        start = offsets[i]
+        end = offsets[i + 1]
+        envelope_list.append(Envelope([
+            EnvelopePair(mzs[j], intensities[j]) for j in range(start, end)]))
+    return envelope_list
+
+
 try:
     has_c = True
     _decode_envelopes = decode_envelopes
-    from ms_deisotope._c.utils import decode_envelopes
+    _decode_compact_envelopes = decode_compact_envelopes
+    from ms_deisotope._c.utils import decode_envelopes, decode_compact_envelopes
 except ImportError:
     has_c = False
@@ -23,6 +23,7 @@ class PeakNode(Base):
     peak : ms_peak_picker.FittedPeak
         The peak being depended upon
     """
+    __slots__ = ["peak", "links", "_hash"]
 
     def __init__(self, peak, links=None):
         if links is None:
@@ -31,6 +32,9 @@ class PeakNode(Base):
         self.links = links
         self._hash = hash(self.peak)
 
+    def __reduce__(self):
+        return self.__class__, (self.peak, self.links)
+
     def __hash__(self):
         return self._hash
 
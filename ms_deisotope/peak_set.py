@@ -1,6 +1,8 @@
 import operator
 from collections import namedtuple
 
+import numpy as np
+
 from .utils import Base, ppm_error
 from brainpy import mass_charge_ratio
 
@@ -64,6 +66,9 @@ class Envelope(object):
     def __iter__(self):
         return iter(self.pairs)
 
+    def __len__(self):
+        return len(self.pairs)
+
     def __repr__(self):
         return "[%s]" % (', '.join("(%0.4f, %0.2f)" % t for t in self),)
 
@@ -172,32 +177,26 @@ class DeconvolutedPeakSolution(DeconvolutedPeak):
     solution : object
         Representation of the "source" of the isotopic fit
     """
-    __slots__ = [
-        "solution", "fit",
-        "neutral_mass", "intensity", "signal_to_noise",
-        "index", "full_width_at_half_max", "charge",
-        "a_to_a2_ratio", "most_abundant_mass", "average_mass",
-        "score", "envelope", "mz", "chosen_for_msms", 'area'
-    ]
+    __slots__ = ["solution"]
 
     def __init__(self, solution, fit, *args, **kwargs):
+        super(DeconvolutedPeakSolution, self).__init__(*args, **kwargs)
         self.solution = solution
         self.fit = fit
-        super(DeconvolutedPeakSolution, self).__init__(*args, **kwargs)
 
     def clone(self):
         return DeconvolutedPeakSolution(
             self.solution, self.fit, self.neutral_mass, self.intensity, self.charge, self.signal_to_noise,
             self.index, self.full_width_at_half_max, self.a_to_a2_ratio,
             self.most_abundant_mass, self.average_mass, self.score,
-            self.envelope, self.mz, self.chosen_for_msms, self.area)
+            self.envelope, self.mz, self.fit, self.chosen_for_msms, self.area)
 
     def __reduce__(self):
         return DeconvolutedPeakSolution, (
             self.solution, self.fit, self.neutral_mass, self.intensity, self.charge, self.signal_to_noise,
             self.index, self.full_width_at_half_max, self.a_to_a2_ratio,
             self.most_abundant_mass, self.average_mass, self.score,
-            self.envelope, self.mz, self.chosen_for_msms, self.area)
+            self.envelope, self.mz, self.fit, self.chosen_for_msms, self.area)
 
     def __iter__(self):
         yield self.solution
@@ -405,6 +404,63 @@ def binary_search(peak_set, neutral_mass, tolerance, getter=operator.attrgetter(
             lo = mid
 
 
+def merge_isobaric_peaks(peak_list, error_tolerance=0):
+    """Merge peaks with the same charge whose neutral masses are within
+    `error_tolerance` of each other, summing their intensities.
+
+    The peaks are sorted once by (charge, neutral mass) and group boundaries
+    are found by comparing neighboring masses as arrays, so the whole pass is
+    O(n log n). Within each group, the most abundant peak is kept and its
+    :attr:`intensity` is set to the group's total intensity. Groups are chained,
+    so a run of peaks each within tolerance of its neighbor is merged together.
+
+    Parameters
+    ----------
+    peak_list : list of :class:`DeconvolutedPeak`
+        The peaks to merge
+    error_tolerance : float, optional
+        The parts-per-million error tolerance between neighboring masses. When
+        ``0``, only exactly equal masses are merged.
+
+    Returns
+    -------
+    list of :class:`DeconvolutedPeak`
+        The merged peaks, sorted by neutral mass
+    """
+    n = len(peak_list)
+    if n == 0:
+        return []
+    peak_list = list(peak_list)
+    masses = np.fromiter((p.neutral_mass for p in peak_list), dtype=np.float64, count=n)
+    charges = np.fromiter((p.charge for p in peak_list), dtype=np.int64, count=n)
+    order = np.lexsort((masses, charges))
+    masses = masses[order]
+    charges = charges[order]
+    boundary = np.empty(n, dtype=bool)
+    boundary[0] = True
+    boundary[1:] = (charges[1:] != charges[:-1]) | (
+        (masses[1:] - masses[:-1]) > masses[:-1] * error_tolerance)
+    starts = np.flatnonzero(boundary)
+    if len(starts) == n:
+        return [peak_list[i] for i in order[np.argsort(masses, kind='mergesort')]]
+    intensities = np.fromiter(
+        (peak_list[i].intensity for i in order), dtype=np.float64, count=n)
+    totals = np.add.reduceat(intensities, starts)
+    ends = np.append(starts[1:], n)
+    merged = []
+    for k in range(len(starts)):
+        start = starts[k]
+        end = ends[k]
+        if end - start == 1:
+            merged.append(peak_list[order[start]])
+            continue
+        peak = peak_list[order[start + np.argmax(intensities[start:end])]]
+        peak.intensity = float(totals[k])
+        merged.append(peak)
+    merged.sort(key=operator.attrgetter("neutral_mass"))
+    return merged
+
+
 try:
     has_c = True
     _Envelope = Envelope
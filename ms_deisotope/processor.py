@@ -4,8 +4,11 @@ from ms_peak_picker import pick_peaks
 
 from .deconvolution import deconvolute_peaks
 from .data_source.infer_type import MSFileLoader
-from .data_source.common import Scan, ScanBunch, ChargeNotProvided
-from .utils import Base, LRUDict
+from .data_source.common import Scan, ScanBunch, ChargeNotProvided, RandomAccessScanSource
+from .data_source.prefetch import ScanPrefetcher
+from .averaging import ScanAveragingWindow
+from .utils import Base
+from .profiling import DeconvolutionProfile, phase_timer
 from .peak_dependency_network import NoIsotopicClustersError
 
 logger = logging.getLogger("deconvolution_scan_processor")
@@ -41,6 +44,8 @@ class PriorityTarget(Base):
     charge : int
         The charge state hint from :attr:`info`
     """
+    __slots__ = ["peak", "info", "trust_charge_hint", "precursor_scan_id",
+                 "product_scan_id"]
 
     def __init__(self, peak, info, trust_charge_hint=True, precursor_scan_id=None,
                  product_scan_id=None):
@@ -50,6 +55,10 @@ class PriorityTarget(Base):
         self.precursor_scan_id = precursor_scan_id
         self.product_scan_id = product_scan_id
 
+    def __reduce__(self):
+        return self.__class__, (self.peak, self.info, self.trust_charge_hint,
+                                self.precursor_scan_id, self.product_scan_id)
+
     def __iter__(self):
         yield self.peak
         yield self.info
@@ -137,6 +146,14 @@ class ScanProcessor(Base):
         the charge state of precursor isotopic patterns. Defaults to `True`
     terminate_on_error: bool
         Whether or not  to stop processing on an error. Defaults to `True`
+    profile : :class:`~.DeconvolutionProfile` or None
+        If profiling was requested, the timings and counters of every deconvolution
+        and peak picking step performed by this processor, aggregated across the run.
+        Otherwise :const:`None`
+    prefetch : int
+        The number of scan bunches to read ahead of processing on a background
+        thread using :class:`~.ScanPrefetcher`. If 0, scans are read on demand.
+        Defaults to 0
     """
 
     def __init__(self, data_source, ms1_peak_picking_args=None,
@@ -147,7 +164,9 @@ class ScanProcessor(Base):
                  loader_type=None,
                  envelope_selector=None,
                  terminate_on_error=True,
-                 ms1_averaging=0):
+                 ms1_averaging=0,
+                 profile=False,
+                 prefetch=0):
         if loader_type is None:
             loader_type = MSFileLoader
 
@@ -165,11 +184,19 @@ class ScanProcessor(Base):
 
         self.loader_type = loader_type
 
+        self.prefetch = int(prefetch) if prefetch else 0
+
         self._signal_source = self.loader_type(data_source)
+        is_random_access = isinstance(self._signal_source, RandomAccessScanSource)
+        if self.prefetch > 0:
+            self._signal_source = ScanPrefetcher(self._signal_source, self.prefetch)
         self.envelope_selector = envelope_selector
         self.terminate_on_error = terminate_on_error
 
-        self._ms1_index_cache = LRUDict(maxsize=self.ms1_averaging * 2 + 2)
+        self._ms1_averaging_window = None
+        if self.ms1_averaging > 0 and is_random_access:
+            self._ms1_averaging_window = ScanAveragingWindow(self._signal_source, self.ms1_averaging)
+        self.profile = DeconvolutionProfile() if profile else None
 
     def _reject_candidate_precursor_peak(self, peak, product_scan):
         isolation = product_scan.isolation_window
@@ -239,6 +266,10 @@ class ScanProcessor(Base):
         before and after ``precursor_scan`` and pick peaks from the
         averaged arrays.
 
+        When :attr:`reader` supports random access, the neighboring scans'
+        profile arrays are kept in a :class:`~.ScanAveragingWindow` between
+        calls, so each new precursor scan only reads one new neighbor.
+
         Parameters
         ----------
         precursor_scan: Scan
@@ -248,7 +279,10 @@ class ScanProcessor(Base):
         -------
         PeakSet
         """
-        new_scan = precursor_scan.average(self.ms1_averaging)
+        if self._ms1_averaging_window is not None:
+            new_scan = self._ms1_averaging_window.average(precursor_scan)
+        else:
+            new_scan = precursor_scan.average(self.ms1_averaging)
         prec_peaks = pick_peaks(*new_scan.arrays,
                                 target_envelopes=self._get_envelopes(precursor_scan),
                                 **self.ms1_peak_picking_args)
@@ -270,10 +304,11 @@ class ScanProcessor(Base):
         PeakSet
         """
         logger.info("Picking Precursor Scan Peaks: %r", precursor_scan)
-        if self.ms1_averaging > 0:
-            prec_peaks = self._average_ms1(precursor_scan)
-        else:
-            prec_peaks = self._pick_precursor_scan_peaks(precursor_scan)
+        with phase_timer(self.profile, "ms1_peak_picking"):
+            if self.ms1_averaging > 0:
+                prec_peaks = self._average_ms1(precursor_scan)
+            else:
+                prec_peaks = self._pick_precursor_scan_peaks(precursor_scan)
         precursor_scan.peak_set = prec_peaks
         return prec_peaks
 
@@ -282,8 +317,9 @@ class ScanProcessor(Base):
             peak_mode = 'profile'
         else:
             peak_mode = 'centroid'
-        product_mz, product_intensity = product_scan.arrays
-        peaks = pick_peaks(product_mz, product_intensity, peak_mode=peak_mode, **self.msn_peak_picking_args)
+        with phase_timer(self.profile, "msn_peak_picking"):
+            product_mz, product_intensity = product_scan.arrays
+            peaks = pick_peaks(product_mz, product_intensity, peak_mode=peak_mode, **self.msn_peak_picking_args)
         product_scan.peak_set = peaks
         return peaks
 
@@ -355,6 +391,10 @@ class ScanProcessor(Base):
             if scan.ms_level > 1:
                 scan.precursor_information.default(orphan=True)
 
+    def _record_profile(self, decon_result):
+        if self.profile is not None and decon_result.profile is not None:
+            self.profile.merge(decon_result.profile)
+
     def deconvolute_precursor_scan(self, precursor_scan, priorities=None):
         if priorities is None:
             priorities = []
@@ -371,7 +411,7 @@ class ScanProcessor(Base):
         try:
             decon_result = deconvolute_peaks(
                 precursor_scan.peak_set, priority_list=priorities,
-                **ms1_deconvolution_args)
+                profile=self.profile is not None, **ms1_deconvolution_args)
         except NoIsotopicClustersError as e:
             e.scan_id = precursor_scan.id
             if self.terminate_on_error:
@@ -380,6 +420,7 @@ class ScanProcessor(Base):
                 logger.warn("No isotopic clusters found in %r" % precursor_scan.id)
 
         dec_peaks, priority_results = decon_result
+        self._record_profile(decon_result)
 
         if decon_result.errors:
             logger.error("Errors occurred during deconvolution of %s, %r" % (
@@ -450,12 +491,15 @@ class ScanProcessor(Base):
                 polarity * abs(c) for c in deconargs["charge_range"]]
 
         try:
-            dec_peaks, _ = deconvolute_peaks(product_scan.peak_set, **deconargs)
+            decon_result = deconvolute_peaks(
+                product_scan.peak_set, profile=self.profile is not None, **deconargs)
         except NoIsotopicClustersError as e:
             logger.info("No Isotopic Clusters found in %r" % product_scan.id)
             e.scan_id = product_scan.id
             if self.terminate_on_error:
                 raise e
+        dec_peaks, _ = decon_result
+        self._record_profile(decon_result)
 
         product_scan.deconvoluted_peak_set = dec_peaks
         return dec_peaks
@@ -0,0 +1,209 @@
+from collections import OrderedDict
+
+try:
+    from time import perf_counter as timer
+except ImportError:  # pragma: no cover
+    from time import time as timer
+
+
+class PhaseTimer(object):
+    """A context manager which adds the wall time spent inside its block to
+    a named phase of a :class:`DeconvolutionProfile`.
+    """
+    __slots__ = ("profile", "phase", "start")
+
+    def __init__(self, profile, phase):
+        self.profile = profile
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profile.add_time(self.phase, timer() - self.start)
+        return False
+
+
+class _NullPhaseTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_phase_timer = _NullPhaseTimer()
+
+
+def phase_timer(profile, phase):
+    """Get a context manager timing `phase` in `profile`, or a shared
+    no-op context manager if `profile` is :const:`None`.
+
+    Parameters
+    ----------
+    profile : DeconvolutionProfile or None
+        The profile to record into
+    phase : str
+        The name of the phase being timed
+
+    Returns
+    -------
+    PhaseTimer
+    """
+    if profile is None:
+        return _null_phase_timer
+    return PhaseTimer(profile, phase)
+
+
+class DeconvolutionProfile(object):
+    """Collects wall time per phase and work counters over one or more
+    deconvolution runs.
+
+    A profile is only created when instrumentation is requested, and the
+    deconvoluters only touch it behind an ``is not None`` check, so the
+    cost of the hooks when profiling is disabled is a single attribute
+    lookup per phase.
+
+    Attributes
+    ----------
+    timings : OrderedDict
+        Mapping from phase name to the total number of seconds spent in it
+    counters : OrderedDict
+        Mapping from counter name to its total
+    cluster_sizes : list of int
+        The number of fits in each dependence cluster solved
+    """
+
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+        self.cluster_sizes = []
+
+    def timer(self, phase):
+        """Create a context manager which adds the time spent inside it to `phase`
+
+        Parameters
+        ----------
+        phase : str
+
+        Returns
+        -------
+        PhaseTimer
+        """
+        return PhaseTimer(self, phase)
+
+    def add_time(self, phase, elapsed):
+        self.timings[phase] = self.timings.get(phase, 0.0) + elapsed
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_clusters(self, clusters):
+        """Record the number and size of the dependence clusters produced by
+        :meth:`~.PeakDependenceGraph.find_non_overlapping_intervals`
+
+        Parameters
+        ----------
+        clusters : list of DependenceCluster
+        """
+        self.cluster_sizes.extend(len(cluster) for cluster in clusters)
+
+    @property
+    def cluster_count(self):
+        return len(self.cluster_sizes)
+
+    @property
+    def mean_cluster_size(self):
+        if not self.cluster_sizes:
+            return 0.0
+        return sum(self.cluster_sizes) / float(len(self.cluster_sizes))
+
+    @property
+    def max_cluster_size(self):
+        if not self.cluster_sizes:
+            return 0
+        return max(self.cluster_sizes)
+
+    def averagine_cache_state(self, deconvoluter):
+        """Snapshot the usage counters of every :class:`~.AveragineCache` used
+        by `deconvoluter`, to be passed to :meth:`record_averagine_cache_usage`
+        once the work being profiled is done.
+
+        Parameters
+        ----------
+        deconvoluter : DeconvoluterBase
+
+        Returns
+        -------
+        list
+        """
+        caches = []
+        averagine = getattr(deconvoluter, "averagine", None)
+        if averagine is not None:
+            caches.append(averagine)
+        caches.extend(getattr(deconvoluter, "averagines", None) or ())
+        state = []
+        for cache in caches:
+            try:
+                state.append((cache, cache.hits, cache.misses, cache.generation_time))
+            except AttributeError:
+                continue
+        return state
+
+    def record_averagine_cache_usage(self, state):
+        """Add the averagine cache hits, misses and isotopic pattern generation time
+        accumulated since `state` was captured by :meth:`averagine_cache_state`
+
+        Parameters
+        ----------
+        state : list
+        """
+        hits = 0
+        misses = 0
+        elapsed = 0.0
+        for cache, last_hits, last_misses, last_time in state:
+            hits += cache.hits - last_hits
+            misses += cache.misses - last_misses
+            elapsed += cache.generation_time - last_time
+        self.count("averagine_cache_hits", hits)
+        self.count("averagine_cache_misses", misses)
+        self.add_time("averagine_generation", elapsed)
+
+    def merge(self, other):
+        """Add the timings, counters and cluster sizes of `other` to this profile
+        in-place, used to aggregate profiles across many spectra.
+
+        Parameters
+        ----------
+        other : DeconvolutionProfile
+
+        Returns
+        -------
+        DeconvolutionProfile
+            This profile
+        """
+        for phase, elapsed in other.timings.items():
+            self.add_time(phase, elapsed)
+        for name, n in other.counters.items():
+            self.count(name, n)
+        self.cluster_sizes.extend(other.cluster_sizes)
+        return self
+
+    def as_dict(self):
+        result = OrderedDict()
+        result['timings'] = OrderedDict(self.timings)
+        result['counters'] = OrderedDict(self.counters)
+        result['cluster_count'] = self.cluster_count
+        result['mean_cluster_size'] = self.mean_cluster_size
+        result['max_cluster_size'] = self.max_cluster_size
+        return result
+
+    def __repr__(self):
+        timings = ', '.join("%s=%0.4fs" % kv for kv in self.timings.items())
+        counters = ', '.join("%s=%d" % kv for kv in self.counters.items())
+        return "%s(%s; %s; cluster_count=%d)" % (
+            self.__class__.__name__, timings, counters, self.cluster_count)
@@ -0,0 +1,187 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+class GridSignal(namedtuple("GridSignal", ["start", "intensity"])):
+    """The intensity of one spectrum interpolated onto the points of an m/z
+    grid aligned to multiples of the grid spacing.
+
+    Attributes
+    ----------
+    start : int
+        The grid position of the first point, ``mz = start * dx``
+    intensity : np.ndarray
+        The interpolated intensity at each grid point from `start`
+    """
+
+    @property
+    def end(self):
+        return self.start + len(self.intensity)
+
+
+def gaussian_time_weights(scan_times, mean, sigma=0.025):
+    """Weight each scan by a Gaussian centered on `mean`
+
+    Parameters
+    ----------
+    scan_times : array-like
+        The time of each scan
+    mean : float
+        The time of the reference scan
+    sigma : float, optional
+        The standard deviation of the Gaussian, in minutes
+
+    Returns
+    -------
+    np.ndarray
+    """
+    sigma_sqrd_2 = (2 * sigma ** 2)
+    time_array = np.asarray(scan_times, dtype=float)
+    return np.exp((-(time_array - mean) ** 2) / sigma_sqrd_2)
+
+
+class GridAverager(object):
+    """Averages the signal of several spectra on a shared m/z grid.
+
+    Grid points are placed at integer multiples of :attr:`dx`, so a spectrum
+    interpolated onto the grid once by :meth:`interpolate` can be reused by
+    every averaging window it takes part in. :meth:`average_signals` lays the
+    interpolated spectra out in a preallocated 2D buffer, one row per spectrum,
+    and combines them with a single weighted matrix-vector product.
+
+    Like :func:`ms_peak_picker.average_signal`, each spectrum is linearly
+    interpolated, contributes no signal outside of its own m/z range, and the
+    averaged grid extends one m/z unit beyond the combined m/z range.
+
+    Attributes
+    ----------
+    dx : float
+        The spacing between grid points
+    padding : int
+        The number of grid points added on either side of the combined
+        m/z range
+    """
+
+    def __init__(self, dx=0.01):
+        self.dx = dx
+        self.padding = int(np.ceil(1.0 / dx))
+        self._buffer = np.zeros((0, 0))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.dx)
+
+    def grid(self, start, end):
+        """Build the m/z values of the grid points from `start` to `end`
+
+        Parameters
+        ----------
+        start : int
+        end : int
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return np.arange(start, end) * self.dx
+
+    def interpolate(self, mz_array, intensity_array):
+        """Interpolate a spectrum onto the grid points within its m/z range
+
+        Parameters
+        ----------
+        mz_array : np.ndarray
+        intensity_array : np.ndarray
+
+        Returns
+        -------
+        GridSignal
+        """
+        if len(mz_array) == 0:
+            return GridSignal(0, np.zeros(0))
+        mz_array = np.asarray(mz_array, dtype=float)
+        intensity_array = np.asarray(intensity_array, dtype=float)
+        start = int(np.ceil(mz_array[0] / self.dx))
+        end = int(np.floor(mz_array[-1] / self.dx)) + 1
+        if end <= start:
+            return GridSignal(start, np.zeros(0))
+        return GridSignal(start, np.interp(self.grid(start, end), mz_array, intensity_array))
+
+    def _get_buffer(self, n, size):
+        rows, columns = self._buffer.shape
+        if rows < n or columns < size:
+            self._buffer = np.zeros((max(rows, n), max(columns, size)))
+        buffer = self._buffer[:n, :size]
+        buffer.fill(0)
+        return buffer
+
+    def average_signals(self, signals, weights=None):
+        """Average spectra previously interpolated with :meth:`interpolate`
+
+        Parameters
+        ----------
+        signals : list of GridSignal
+        weights : array-like, optional
+            The weight of each spectrum. Defaults to 1.0 for each
+
+        Returns
+        -------
+        mz_array : np.ndarray
+        intensity_array : np.ndarray
+        """
+        if weights is None:
+            weights = np.ones(len(signals))
+        else:
+            weights = np.asarray(weights, dtype=float)
+            if len(weights) != len(signals):
+                raise ValueError("`signals` and `weights` must have the same length")
+        occupied = [signal for signal in signals if len(signal.intensity)]
+        if not occupied:
+            return np.array([]), np.array([])
+        start = max(min(signal.start for signal in occupied) - self.padding, 0)
+        end = max(signal.end for signal in occupied) + self.padding
+        buffer = self._get_buffer(len(signals), end - start)
+        for i, signal in enumerate(signals):
+            if len(signal.intensity):
+                buffer[i, signal.start - start:signal.end - start] = signal.intensity
+        return self.grid(start, end), weights.dot(buffer) / weights.sum()
+
+    def average(self, arrays, weights=None):
+        """Average multiple spectra's intensity arrays on a common m/z axis
+
+        Parameters
+        ----------
+        arrays : list of pairs of np.ndarray
+            The m/z and intensity arrays to combine
+        weights : array-like, optional
+            The weight of each entry in `arrays`. Defaults to 1.0 for each
+
+        Returns
+        -------
+        mz_array : np.ndarray
+        intensity_array : np.ndarray
+        """
+        return self.average_signals(
+            [self.interpolate(mz, intensity) for mz, intensity in arrays], weights)
+
+
+def average_signal(arrays, dx=0.01, weights=None):
+    """Average multiple spectra's intensity arrays on a common m/z grid,
+    a drop-in replacement for :func:`ms_peak_picker.average_signal` using
+    :class:`GridAverager`.
+
+    Parameters
+    ----------
+    arrays : list of pairs of np.ndarray
+        The m/z and intensity arrays to combine
+    dx : float, optional
+        The m/z resolution to build the averaged m/z axis with
+    weights : array-like, optional
+        Weight of each entry in `arrays`. Defaults to 1.0 for each if not provided.
+
+    Returns
+    -------
+    mz_array : np.ndarray
+    intensity_array : np.ndarray
+    """
+    return GridAverager(dx).average(arrays, weights)
@@ -1,5 +1,9 @@
 import os
 
+from ms_deisotope.averagine import neutral_mass
+from ms_deisotope.data_source.common import PrecursorInformation, ProcessedScan, ScanBunch
+from ms_deisotope.peak_set import DeconvolutedPeakSet
+
 
 data_path = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "test_data"))
@@ -7,3 +11,63 @@ data_path = os.path.abspath(
 
 def datafile(name):
     return os.path.join(data_path, name)
+
+
+def _empty_peaks(ms_level, i):
+    return DeconvolutedPeakSet([])
+
+
+def _precursor_mz(i, j):
+    return 600. + i + 100. * j
+
+
+def make_scan_bunches(n, products_per_bunch=1, peaks=_empty_peaks, precursor_mz=_precursor_mz,
+                      start_time=0., product_time_step=0.5, **kwargs):
+    """Build `n` synthetic :class:`~.ScanBunch` objects, each an MS1 scan followed
+    by `products_per_bunch` MSn scans of doubly charged precursors.
+
+    Scans are numbered ``scan=<index>`` in acquisition order. The MS1 scan of bunch
+    `i` is acquired at ``start_time + i`` and its `j` th product ``product_time_step * (j + 1)``
+    minutes later.
+
+    Parameters
+    ----------
+    n : int
+        The number of bunches to build
+    products_per_bunch : int, optional
+        The number of MSn scans in each bunch
+    peaks : callable, optional
+        Called with the MS level and the bunch number to build each scan's
+        deconvoluted peak set. Defaults to an empty peak set.
+    precursor_mz : callable, optional
+        Called with the bunch number and the product number to give each
+        product's precursor m/z
+    start_time : float, optional
+        The scan time of the first MS1 scan
+    product_time_step : float, optional
+        The time between successive scans within a bunch
+    **kwargs
+        Passed to every :class:`~.ProcessedScan`
+
+    Returns
+    -------
+    list of :class:`~.ScanBunch`
+    """
+    bunches = []
+    stride = products_per_bunch + 1
+    for i in range(n):
+        precursor = ProcessedScan(
+            "scan=%d" % (i * stride), None, None, 1, start_time + i, i * stride, None,
+            peaks(1, i), **kwargs)
+        products = []
+        for j in range(products_per_bunch):
+            index = i * stride + j + 1
+            mz = precursor_mz(i, j)
+            pinfo = PrecursorInformation(
+                mz, 10., 2, precursor.id, None, neutral_mass(mz, 2), 2, 10.,
+                product_scan_id="scan=%d" % index)
+            products.append(ProcessedScan(
+                "scan=%d" % index, None, pinfo, 2, start_time + i + product_time_step * (j + 1),
+                index, None, peaks(2, i), **kwargs))
+        bunches.append(ScanBunch(precursor, products))
+    return bunches
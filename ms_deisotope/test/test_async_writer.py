@@ -0,0 +1,84 @@
+import io
+import threading
+import time
+import unittest
+
+from ms_deisotope.output.common import ScanSerializerBase
+from ms_deisotope.output.text import HeaderedDelimitedWriter
+from ms_deisotope.output.async_writer import AsyncScanSerializer
+from ms_deisotope.test.common import make_scan_bunches
+
+
+class _RecordingSerializer(ScanSerializerBase):
+    def __init__(self, delay=0, fail_at=None):
+        self.delay = delay
+        self.fail_at = fail_at
+        self.saved = []
+        self.threads = set()
+        self.completed = False
+
+    def save_scan_bunch(self, bunch, **kwargs):
+        if len(self.saved) == self.fail_at:
+            raise ValueError("bad bunch %d" % len(self.saved))
+        time.sleep(self.delay)
+        self.threads.add(threading.current_thread().name)
+        self.saved.append(bunch)
+
+    def complete(self):
+        self.completed = True
+
+
+class TestAsyncScanSerializer(unittest.TestCase):
+    def test_order_and_completion(self):
+        inner = _RecordingSerializer()
+        with AsyncScanSerializer(inner, 2) as writer:
+            for i in range(20):
+                writer.save(i)
+        self.assertEqual(inner.saved, list(range(20)))
+        self.assertTrue(inner.completed)
+        self.assertEqual(inner.threads, {"AsyncScanSerializer"})
+        self.assertFalse(writer.is_running)
+        self.assertEqual(writer.metrics()["items_written"], 21)
+
+    def test_back_pressure(self):
+        inner = _RecordingSerializer(delay=0.02)
+        writer = AsyncScanSerializer(inner, 2, poll_interval=0.01)
+        for i in range(10):
+            writer.save_scan_bunch(i)
+        self.assertLessEqual(writer.max_queue_depth, 2)
+        self.assertGreater(writer.stall_time, 0)
+        writer.flush()
+        self.assertEqual(inner.saved, list(range(10)))
+        self.assertEqual(writer.queue_depth, 0)
+        writer.complete()
+
+    def test_error_propagation(self):
+        inner = _RecordingSerializer(fail_at=3)
+        writer = AsyncScanSerializer(inner, 2, poll_interval=0.01)
+
+        def write_all():
+            for i in range(10):
+                writer.save(i)
+            writer.complete()
+
+        self.assertRaises(ValueError, write_all)
+        self.assertEqual(inner.saved, [0, 1, 2])
+        self.assertFalse(inner.completed)
+        self.assertRaises(ValueError, writer.save, 10)
+
+    def test_matches_synchronous_output(self):
+        bunches = make_scan_bunches(5, 3)
+        expected = io.StringIO()
+        writer = HeaderedDelimitedWriter(expected)
+        for bunch in bunches:
+            writer.save(bunch)
+        observed = io.StringIO()
+        with AsyncScanSerializer(HeaderedDelimitedWriter(observed), 1) as writer:
+            for bunch in bunches:
+                writer.save(bunch)
+            self.assertIs(writer.stream, observed)
+        self.assertEqual(observed.getvalue(), expected.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from ms_deisotope.averaging import ScanAveragingWindow
+from ms_deisotope.signal_averaging import GridAverager, average_signal
+from ms_deisotope.data_source import MzMLLoader
+from ms_deisotope.test.common import datafile
+
+
+class TestGridAverager(unittest.TestCase):
+    arrays = [
+        (np.array([100.0, 100.05, 100.1, 100.15]), np.array([0., 10., 20., 0.])),
+        (np.array([100.02, 100.07, 100.12, 100.5]), np.array([5., 15., 5., 1.])),
+        (np.array([]), np.array([])),
+    ]
+
+    def test_average(self):
+        weights = np.array([0.25, 1.0, 0.5])
+        mz, intensity = average_signal(self.arrays, dx=0.01, weights=weights)
+        self.assertTrue(np.allclose(mz / 0.01, np.round(mz / 0.01)))
+        self.assertLessEqual(mz[0], 99.0)
+        self.assertGreaterEqual(mz[-1], 101.49)
+        expected = sum(
+            w * np.interp(mz, x, y, left=0, right=0) for w, (x, y) in zip(weights, self.arrays) if len(x))
+        self.assertTrue(np.allclose(intensity, expected / weights.sum()))
+
+    def test_reuse_signals(self):
+        averager = GridAverager(0.01)
+        signals = [averager.interpolate(*a) for a in self.arrays]
+        mz, intensity = averager.average_signals(signals[:2])
+        mz2, intensity2 = averager.average(self.arrays[:2])
+        self.assertTrue(np.allclose(mz, mz2))
+        self.assertTrue(np.allclose(intensity, intensity2))
+        with self.assertRaises(ValueError):
+            averager.average_signals(signals, weights=[1.0])
+
+    def test_empty(self):
+        mz, intensity = average_signal([self.arrays[2]])
+        self.assertEqual(len(mz), 0)
+
+
+class TestScanAveragingWindow(unittest.TestCase):
+    path = datafile("has_missing_charge_state_info.mzML")
+
+    def test_matches_scan_average(self):
+        reader = MzMLLoader(self.path)
+        window = ScanAveragingWindow(reader, 1)
+        ms1_indices = reader.ms_level_time_index.ms1_indices
+        for i in ms1_indices:
+            scan = reader.get_scan_by_index(i)
+            expected = scan.average(1)
+            averaged = window.average(scan)
+            self.assertEqual(averaged.scan_indices, expected.scan_indices)
+            self.assertTrue(np.allclose(averaged.arrays[0], expected.arrays[0]))
+            self.assertTrue(np.allclose(averaged.arrays[1], expected.arrays[1]))
+            self.assertLessEqual(len(window), 3)
+        self.assertEqual(window.loaded_scans, len(ms1_indices))
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
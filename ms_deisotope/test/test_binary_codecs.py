@@ -0,0 +1,115 @@
+import unittest
+
+import numpy as np
+
+from ms_deisotope.data_source import binary_codecs
+from ms_deisotope.data_source.binary_codecs import (
+    encode_array, decode_array, resolve_codec, pop_codec, codec_dtype, pynumpress)
+
+
+class FakeNumpress(object):
+    """Stands in for :mod:`pynumpress` with a lossless encoding, so that the
+    MS-Numpress code paths can be tested without it.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def _encode(self, scheme, array, *args):
+        self.calls.append("encode_" + scheme)
+        marker = np.array([ord(scheme[0])], dtype=np.uint8)
+        return np.concatenate([marker, np.asarray(array, dtype=np.float64).view(np.uint8)])
+
+    def _decode(self, scheme, data):
+        self.calls.append("decode_" + scheme)
+        data = np.asarray(data, dtype=np.uint8)
+        if data[0] != ord(scheme[0]):
+            raise ValueError("Not encoded with %s" % scheme)
+        return data[1:].copy().view(np.float64)
+
+    def optimal_linear_fixed_point(self, array):
+        return 1.0
+
+    def optimal_slof_fixed_point(self, array):
+        return 1.0
+
+    def encode_linear(self, array, fixed_point):
+        return self._encode("linear", array)
+
+    def encode_slof(self, array, fixed_point):
+        return self._encode("slof", array)
+
+    def encode_pic(self, array):
+        return self._encode("pic", array)
+
+    def decode_linear(self, data):
+        return self._decode("linear", data)
+
+    def decode_slof(self, data):
+        return self._decode("slof", data)
+
+    def decode_pic(self, data):
+        return self._decode("pic", data)
+
+
+class TestBinaryCodecs(unittest.TestCase):
+    values = np.array([100.0, 200.5, 300.25, 1000.125])
+
+    def test_resolve_codec(self):
+        self.assertEqual(resolve_codec("zlib"), binary_codecs.ZLIB_COMPRESSION)
+        self.assertEqual(resolve_codec(None), binary_codecs.NO_COMPRESSION)
+        self.assertEqual(resolve_codec("numpress-slof+zlib"), binary_codecs.NUMPRESS_SLOF_ZLIB)
+        self.assertEqual(resolve_codec(binary_codecs.NUMPRESS_PIC), binary_codecs.NUMPRESS_PIC)
+        self.assertRaises(ValueError, resolve_codec, "lz4")
+        self.assertEqual(codec_dtype("numpress-linear", np.float32), np.float64)
+        self.assertEqual(codec_dtype("zlib", np.float32), np.float32)
+
+    def test_round_trip(self):
+        for codec in ("none", "zlib"):
+            for dtype in (np.float32, np.float64, np.int32):
+                encoded = encode_array(self.values, codec, dtype)
+                decoded = decode_array(encoded.decode('ascii'), codec, dtype)
+                self.assertEqual(decoded.dtype, dtype)
+                np.testing.assert_array_equal(decoded, self.values.astype(dtype))
+
+    @unittest.skipIf(pynumpress is None, "pynumpress is not installed")
+    def test_numpress_round_trip(self):
+        for codec in ("numpress-linear", "numpress-slof+zlib"):
+            decoded = decode_array(encode_array(self.values, codec), codec)
+            np.testing.assert_allclose(decoded, self.values, rtol=1e-3)
+
+    def test_stubbed_numpress_round_trip(self):
+        original = binary_codecs.pynumpress
+        binary_codecs.pynumpress = fake = FakeNumpress()
+        try:
+            for codec in ("numpress-linear", "numpress-slof", "numpress-pic",
+                          "numpress-linear+zlib", "numpress-slof+zlib", "numpress-pic+zlib"):
+                encoded = encode_array(self.values, codec, np.float32)
+                decoded = decode_array(encoded, codec, np.float32)
+                self.assertEqual(decoded.dtype, np.float64)
+                np.testing.assert_array_equal(decoded, self.values)
+            self.assertEqual(fake.calls.count("encode_slof"), 2)
+            self.assertEqual(fake.calls.count("decode_pic"), 2)
+        finally:
+            binary_codecs.pynumpress = original
+
+    def test_missing_numpress(self):
+        original = binary_codecs.pynumpress
+        binary_codecs.pynumpress = None
+        try:
+            self.assertRaises(ImportError, encode_array, self.values, "numpress-linear")
+        finally:
+            binary_codecs.pynumpress = original
+
+    def test_pop_codec(self):
+        info = {"name": ["m/z array", binary_codecs.NUMPRESS_LINEAR_ZLIB]}
+        self.assertEqual(pop_codec(info), binary_codecs.NUMPRESS_LINEAR_ZLIB)
+        self.assertEqual(info, {"name": ["m/z array"]})
+        info = {"zlib compression": "", "64-bit float": ""}
+        self.assertEqual(pop_codec(info), binary_codecs.ZLIB_COMPRESSION)
+        self.assertEqual(info, {"64-bit float": ""})
+        self.assertEqual(pop_codec({"name": "intensity array"}), binary_codecs.NO_COMPRESSION)
+
+
+if __name__ == '__main__':
+    unittest.main()
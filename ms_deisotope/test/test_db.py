@@ -0,0 +1,159 @@
+import unittest
+
+from sqlalchemy import create_engine, event
+
+from ms_deisotope.peak_set import DeconvolutedPeak, DeconvolutedPeakSet, EnvelopePair
+from ms_deisotope.output import db
+from ms_deisotope.test.common import make_scan_bunches
+
+
+def make_peaks(n, offset):
+    peaks = DeconvolutedPeakSet([
+        DeconvolutedPeak(
+            1000. + i + offset, 100. + i, 2, 10., None, 0.1, score=5.,
+            envelope=[EnvelopePair(501. + i, 100.), EnvelopePair(501.5 + i, 50.)],
+            mz=501. + i, chosen_for_msms=(i == 0))
+        for i in range(n)])
+    peaks._reindex()
+    return peaks
+
+
+def make_bunches(n):
+    return make_scan_bunches(n, peaks=lambda ms_level, i: make_peaks(20 if ms_level == 1 else 5, i))
+
+
+class TestBulkDatabaseScanSerializer(unittest.TestCase):
+    def write(self, serializer_type, bunches, **kwargs):
+        engine = create_engine("sqlite://")
+        serializer = serializer_type(engine, sample_name="test", **kwargs)
+        for bunch in bunches:
+            serializer.save(bunch)
+        serializer.complete()
+        return engine
+
+    def check_round_trip(self, **kwargs):
+        bunches = make_bunches(7)
+        engine = self.write(db.BulkDatabaseScanSerializer, bunches, batch_size=3, **kwargs)
+        reader = db.DatabaseScanDeserializer(engine)
+        self.assertTrue(reader.sample_run.completed)
+        for bunch in bunches:
+            for scan in [bunch.precursor] + bunch.products:
+                stored = reader.get_scan_by_id(scan.id)
+                self.assertEqual(stored.index, scan.index)
+                self.assertAlmostEqual(stored.scan_time, scan.scan_time)
+                self.assertEqual(len(stored.deconvoluted_peak_set), len(scan.deconvoluted_peak_set))
+                for a, b in zip(stored.deconvoluted_peak_set, scan.deconvoluted_peak_set):
+                    self.assertAlmostEqual(a.neutral_mass, b.neutral_mass)
+                    self.assertEqual(a.charge, b.charge)
+                    self.assertEqual(list(a.envelope), list(b.envelope))
+                    self.assertEqual(a.chosen_for_msms, b.chosen_for_msms)
+            product = reader.get_scan_by_id(bunch.products[0].id)
+            self.assertEqual(product.precursor_information.precursor_scan_id, bunch.precursor.id)
+            self.assertAlmostEqual(
+                product.precursor_information.neutral_mass,
+                bunch.products[0].precursor_information.neutral_mass, 4)
+        return reader
+
+    def test_round_trip(self):
+        self.check_round_trip().close()
+
+    def test_packed_round_trip(self):
+        reader = self.check_round_trip(peak_storage="packed")
+        self.assertEqual(reader.query(db.DeconvolutedPeak).count(), 0)
+        self.assertEqual(reader.query(db.DeconvolutedPeakArrays).count(), 14)
+        # Only MS1 peaks are indexed by mass
+        self.assertEqual(reader.query(db.DeconvolutedPeakMassIndex).count(), 7 * 20)
+        reader.close()
+
+    def test_packed_ms1_peaks_above(self):
+        bunches = make_bunches(3)
+        rows = db.DatabaseScanDeserializer(self.write(db.BulkDatabaseScanSerializer, bunches))
+        packed = db.DatabaseScanDeserializer(self.write(
+            db.BulkDatabaseScanSerializer, bunches, peak_storage="packed"))
+        expected = [(scan_id, peak.neutral_mass) for scan_id, peak, _ in rows.ms1_peaks_above(1010)]
+        observed = [(scan_id, peak.neutral_mass) for scan_id, peak, _ in packed.ms1_peaks_above(1010)]
+        self.assertEqual(len(observed), 9 + 10 + 11)
+        self.assertEqual(sorted(observed), sorted(expected))
+        row_keys = [key for _, _, key in rows.ms1_peaks_above(1010)]
+        packed_keys = [key for _, _, key in packed.ms1_peaks_above(1010)]
+        self.assertTrue(all(isinstance(key, int) for key in row_keys))
+        self.assertEqual(len(set(packed_keys)), len(packed_keys))
+        self.assertFalse(set(row_keys) & set(packed_keys))
+        for scan_id, _, (key, _) in packed.ms1_peaks_above(1010):
+            self.assertEqual(packed.query(db.MSScan).filter(db.MSScan.id == key).one().scan_id, scan_id)
+        rows.close()
+        packed.close()
+
+    def test_matches_orm_writer(self):
+        bunches = make_bunches(4)
+        orm = db.DatabaseScanDeserializer(
+            self.write(db.BatchingDatabaseScanSerializer, bunches, batch_size=2))
+        bulk = db.DatabaseScanDeserializer(
+            self.write(db.BulkDatabaseScanSerializer, bunches, batch_size=2))
+        for reader in (orm, bulk):
+            self.assertEqual(reader.query(db.MSScan).count(), 8)
+            self.assertEqual(reader.query(db.DeconvolutedPeak).count(), 100)
+        self.assertEqual(
+            [p.precursor.scan_id for p in orm.precursor_information()],
+            [p.precursor.scan_id for p in bulk.precursor_information()])
+        orm.close()
+        bulk.close()
+
+
+class TestDatabaseScanDeserializer(unittest.TestCase):
+    def setUp(self):
+        self.bunches = make_bunches(12)
+        engine = create_engine("sqlite://")
+        serializer = db.BulkDatabaseScanSerializer(engine, sample_name="test")
+        for bunch in self.bunches:
+            serializer.save(bunch)
+        serializer.complete()
+        self.engine = engine
+        self.reader = db.DatabaseScanDeserializer(engine, iteration_batch_size=5)
+
+    def tearDown(self):
+        self.reader.close()
+
+    def test_batched_iteration(self):
+        queries = []
+
+        def count(connection, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(self.engine, "before_cursor_execute", count)
+        bunches = list(self.reader)
+        event.remove(self.engine, "before_cursor_execute", count)
+        self.assertEqual([b.precursor.id for b in bunches], [b.precursor.id for b in self.bunches])
+        for bunch, expected in zip(bunches, self.bunches):
+            self.assertEqual([p.id for p in bunch.products], [p.id for p in expected.products])
+            self.assertEqual(bunch.products[0].precursor_information.precursor_scan_id, bunch.precursor.id)
+            self.assertEqual(len(bunch.precursor.deconvoluted_peak_set), 20)
+            self.assertEqual(len(bunch.products[0].deconvoluted_peak_set), 5)
+        # Five queries for each of the three windows of bunches, not per scan, plus
+        # finding the sample run and the last, empty window
+        self.assertTrue(len(queries) <= 3 * 5 + 2, len(queries))
+
+    def test_get_scan_by_time(self):
+        self.assertEqual(self.reader.get_scan_by_time(3.5).id, "scan=7")
+        self.assertEqual(self.reader.get_scan_by_time(3.7).id, "scan=7")
+        self.assertEqual(self.reader.get_scan_by_time(3.7, require_ms1=True).id, "scan=6")
+        self.assertEqual(self.reader.get_scan_by_time(-1).id, "scan=0")
+        self.assertEqual(self.reader.get_scan_by_time(100).id, "scan=23")
+
+    def test_start_from_scan(self):
+        self.reader.start_from_scan(scan_id="scan=9")
+        self.assertEqual(next(self.reader).precursor.id, "scan=8")
+        self.assertEqual(next(self.reader).precursor.id, "scan=10")
+        self.reader.start_from_scan(rt=7.2)
+        self.assertEqual(next(self.reader).precursor.id, "scan=14")
+
+    def test_start_from_product_scan(self):
+        self.reader.start_from_scan(scan_id="scan=9", require_ms1=False)
+        self.assertEqual(next(self.reader).precursor.id, "scan=8")
+        self.assertEqual(next(self.reader).precursor.id, "scan=10")
+        self.reader.start_from_scan(index=0, require_ms1=False)
+        self.assertEqual(next(self.reader).precursor.id, "scan=0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -65,6 +65,57 @@ class TestDeconvolution(unittest.TestCase):
                 deconvoluter.peak_dependency_network.find_solution_for(fp).mz,
                 peak.mz, 3)
 
+    def test_graph_deconvolution_profile(self):
+        scan = self.make_scan()
+        scan.pick_peaks()
+        deconresult = deconvolute_peaks(
+            scan.peak_set, {
+                "averagine": peptide,
+                "scorer": PenalizedMSDeconVFitter(5., 1.)
+            }, deconvoluter_type=AveraginePeakDependenceGraphDeconvoluter,
+            profile=True)
+        profile = deconresult.profile
+        for phase in ("populate_graph", "find_non_overlapping_intervals",
+                      "select_best_disjoint_subgraphs", "subtraction", "averagine_generation"):
+            self.assertIn(phase, profile.timings)
+        counters = profile.counters
+        self.assertGreaterEqual(counters['fits_explored'], counters['fits_kept'])
+        self.assertGreater(counters['fits_kept'], 0)
+        self.assertGreater(counters['averagine_cache_misses'], 0)
+        self.assertGreater(counters['averagine_cache_hits'], 0)
+        self.assertEqual(counters['peaks_deconvoluted'], len(deconresult.peak_set))
+        self.assertGreater(profile.cluster_count, 0)
+
+        profile.merge(profile)
+        self.assertEqual(profile.counters['spectra'], 2)
+
+        deconresult = deconvolute_peaks(
+            scan.peak_set, {
+                "averagine": peptide,
+                "scorer": PenalizedMSDeconVFitter(5., 1.)
+            }, deconvoluter_type=AveraginePeakDependenceGraphDeconvoluter)
+        self.assertIsNone(deconresult.profile)
+        self.assertIsNone(deconresult.deconvoluter.profiler)
+
+    def test_neighbor_table_matches_search(self):
+        scan = self.make_scan()
+        scan.pick_peaks()
+        deconvoluter = AveraginePeakDependenceGraphDeconvoluter(
+            scan.peak_set, averagine=peptide, scorer=PenalizedMSDeconVFitter(5., 1.))
+        table = deconvoluter._get_neighbor_table()
+
+        def key(pairs):
+            return sorted((round(p.mz, 6), c, p.peak_count) for p, c in pairs)
+
+        for peak in deconvoluter.peaklist:
+            self.assertTrue(table.contains(peak))
+            from_table = deconvoluter._get_all_peak_charge_pairs(peak, charge_range=(1, 4))
+            # An unindexed copy of the peak forces the binary search path
+            by_search = deconvoluter._get_all_peak_charge_pairs(peak.clone(), charge_range=(1, 4))
+            self.assertEqual(
+                [k for k in key(from_table) if k[2] != peak.peak_count],
+                [k for k in key(by_search) if k[2] != peak.peak_count])
+
 
 if __name__ == '__main__':
     unittest.main()
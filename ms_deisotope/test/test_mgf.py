@@ -1,6 +1,12 @@
+import os
+import shutil
+import tempfile
 import unittest
 
-from ms_deisotope.data_source import MGFLoader, Scan
+import numpy as np
+
+from ms_deisotope.data_source import MGFLoader, Scan, ScanBunch
+from ms_deisotope.data_source.mgf import parse_mgf_spectra
 from ms_deisotope.test.common import datafile
 from ms_deisotope.data_source import infer_type
 
@@ -24,5 +30,98 @@ class TestMGFLoaderScanBehavior(unittest.TestCase):
         assert scan.precursor_information.precursor_scan_id is None
 
 
+class TestMGFLoaderRandomAccess(unittest.TestCase):
+    path = datafile("small.mgf")
+
+    @property
+    def reader(self):
+        return MGFLoader(self.path)
+
+    def test_iteration(self):
+        reader = self.reader
+        scans = list(reader)
+        self.assertEqual(len(scans), 6)
+        self.assertEqual([s.index for s in scans], list(range(6)))
+        self.assertEqual(scans[0].precursor_information.charge, 2)
+        self.assertEqual(scans[1].precursor_information.charge, 3)
+        reader.close()
+
+    def test_get_scan_by_index(self):
+        reader = self.reader
+        expected = list(self.reader)
+        for i in (4, 0, 5, 2):
+            scan = reader.get_scan_by_index(i)
+            self.assertEqual(scan.id, expected[i].id)
+            self.assertEqual(scan.index, i)
+            self.assertTrue(np.allclose(scan.arrays.mz, expected[i].arrays.mz))
+            self.assertEqual(scan.precursor_information.charge, expected[i].precursor_information.charge)
+        self.assertIs(reader.get_scan_by_id("test.104.104.2"), reader.get_scan_by_index(4))
+        self.assertRaises(IndexError, reader.get_scan_by_index, 6)
+        reader.close()
+
+    def test_get_scan_by_time(self):
+        reader = self.reader
+        scan = reader.get_scan_by_time(10.22)
+        self.assertEqual(scan.index, 3)
+        reader.close()
+
+    def test_start_from_scan(self):
+        reader = self.reader
+        reader.start_from_scan("test.103.103.3")
+        self.assertEqual([s.index for s in reader], [3, 4, 5])
+        reader.start_from_scan(index=4, grouped=True)
+        bunch = next(reader)
+        self.assertIsInstance(bunch, ScanBunch)
+        self.assertIsNone(bunch.precursor)
+        self.assertEqual(bunch.products[0].index, 4)
+        reader.close()
+
+    def test_index_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "small.mgf")
+            shutil.copy(self.path, path)
+            MGFLoader.prebuild_byte_offset_file(path)
+            reader = MGFLoader(path)
+            self.assertTrue(os.path.exists(reader._index_file_name))
+            self.assertEqual(reader.index, self.reader.index)
+            self.assertEqual(reader.get_scan_by_index(5).id, "test.105.105.3")
+            reader.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_iter_parallel(self):
+        reader = self.reader
+        expected = [(s.id, s.arrays.mz.tolist()) for s in self.reader]
+        observed = [(s.id, s.arrays.mz.tolist()) for s in reader.iter_parallel(2, batch_size=4)]
+        self.assertEqual(expected, observed)
+        reader.close()
+
+
+class TestMGFParser(unittest.TestCase):
+    text = (
+        "BEGIN IONS\r\nTITLE=a\r\nPEPMASS=500.25 1000\r\nCHARGE=2+ and 3+\r\n"
+        "100.5 20\r\n200.25 40.5\r\nEND IONS\r\n\r\n"
+        "BEGIN IONS\nTITLE=b\nPEPMASS=612.5\n100.5 20 1+\n# comment\n\n"
+        "RTINSECONDS=12\n300.75 10 2+\nEND IONS\n"
+        "BEGIN IONS\nTITLE=c\nCHARGE=3-\nEND IONS\n")
+
+    def test_parse(self):
+        a, b, c = parse_mgf_spectra(self.text, {"charge": [1], "com": "x"})
+        self.assertEqual(a['params']['title'], 'a')
+        self.assertEqual(a['params']['pepmass'], (500.25, 1000.0))
+        self.assertEqual(a['params']['charge'], [2, 3])
+        self.assertEqual(a['params']['com'], 'x')
+        self.assertEqual(a['m/z array'].tolist(), [100.5, 200.25])
+        self.assertEqual(a['intensity array'].tolist(), [20., 40.5])
+        self.assertEqual(b['params']['pepmass'], (612.5, None))
+        self.assertEqual(b['params']['charge'], [1])
+        self.assertEqual(b['params']['rtinseconds'], '12')
+        self.assertEqual(b['m/z array'].tolist(), [100.5, 300.75])
+        self.assertEqual(b['intensity array'].tolist(), [20., 10.])
+        self.assertEqual(c['params']['charge'], [-3])
+        self.assertEqual(len(c['m/z array']), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,9 @@
 import unittest
 
+import numpy as np
+
 from ms_deisotope.data_source import MzMLLoader
+from ms_deisotope.data_source.mzml import LazyBinaryArray
 from ms_deisotope.test.common import datafile
 from ms_deisotope.data_source import infer_type
 
@@ -121,6 +124,35 @@ class TestMzMLLoaderScanBehavior(unittest.TestCase):
         self.assertEqual(product.index, 1)
         reader.close()
 
+    def test_ms_level_time_index(self):
+        reader = self.reader
+        index = reader.ms_level_time_index
+        self.assertEqual(index.ms_levels.tolist(), [1, 2, 2, 0])
+        self.assertAlmostEqual(index.scan_times[1], 22.132753, 5)
+        self.assertEqual(reader.find_previous_ms1(2).id, scan_ids[0])
+        self.assertIsNone(reader.find_next_ms1(0))
+        self.assertEqual(reader._locate_ms1_scan(reader.get_scan_by_index(2)).id, scan_ids[0])
+        self.assertEqual(reader.get_scan_by_time(22.134031).id, scan_ids[2])
+        self.assertEqual(reader.get_scan_by_time(100.0).id, scan_ids[2])
+        reader.close()
+
+    def test_lazy_binary_arrays(self):
+        reader = MzMLLoader(self.path)
+        eager = MzMLLoader(self.path, decode_binary=True)
+        scan = reader.get_scan_by_id(scan_ids[0])
+        self.assertIsInstance(scan._data['m/z array'], LazyBinaryArray)
+        lazy = scan._data['m/z array']
+        self.assertEqual(lazy.nbytes, len(lazy.encoded))
+        # The element count is only known once the payload is decoded
+        self.assertRaises(TypeError, len, lazy)
+        reference = eager.get_scan_by_id(scan_ids[0])
+        self.assertIsInstance(reference._data['m/z array'], np.ndarray)
+        self.assertTrue(np.allclose(scan.arrays.mz, reference.arrays.mz))
+        self.assertTrue(np.allclose(scan.arrays.intensity, reference.arrays.intensity))
+        self.assertIsInstance(scan._data['m/z array'], np.ndarray)
+        reader.close()
+        eager.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from ms_deisotope.averagine import neutral_mass
+from ms_deisotope.feature_map import ExtendedScanIndexWriter
+from ms_deisotope.output.mzml import MzMLScanSerializer, ProcessedMzMLDeserializer
+from ms_deisotope.output.mzml_shards import MzMLShardSerializer, merge_mzml_shards, shard_file_name
+from ms_deisotope.test.common import make_scan_bunches
+from ms_deisotope.test.test_mzml_writer import make_peaks
+
+
+def make_bunches(n):
+    return make_scan_bunches(n, peaks=lambda ms_level, i: make_peaks(), polarity=1)
+
+
+class TestMzMLShards(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "merged.mzML")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write_shards(self, bunches, n_shards):
+        writers = [MzMLShardSerializer(self.path, i, sample_name="test") for i in range(n_shards)]
+        # Hand out the scan bunches the way a pool of workers would, out of order
+        for i, bunch in enumerate(bunches):
+            writers[(i * 7) % n_shards].save_scan_bunch(bunch)
+        for writer in writers:
+            writer.complete()
+        return [writer.path for writer in writers]
+
+    def write_single(self, bunches):
+        path = os.path.join(self.tempdir, "single.mzML")
+        with open(path, 'wb') as handle:
+            writer = MzMLScanSerializer(handle, n_spectra=2 * len(bunches), sample_name="test")
+            for bunch in bunches:
+                writer.save_scan_bunch(bunch)
+            writer.complete()
+        return path
+
+    def strip_volatile(self, content):
+        return re.sub(
+            br'name="SampleRun-UUID" value="[^"]*"|<fileChecksum>\w+</fileChecksum>|'
+            br'<indexListOffset>\d+</indexListOffset>', b'', content)
+
+    def test_matches_single_file(self):
+        bunches = make_bunches(10)
+        shard_paths = self.write_shards(bunches, 3)
+        self.assertEqual(shard_paths[1], os.path.join(self.tempdir, "merged.shard-001.mzML"))
+        self.assertEqual(merge_mzml_shards(shard_paths, self.path), 20)
+        with open(self.write_single(bunches), 'rb') as handle:
+            expected = handle.read()
+        with open(self.path, 'rb') as handle:
+            merged = handle.read()
+        self.assertEqual(self.strip_volatile(merged), self.strip_volatile(expected))
+        for offset in re.findall(br'<offset idRef="[^"]+">(\d+)</offset>', merged):
+            self.assertTrue(merged[int(offset):].startswith((b'<spectrum ', b'<chromatogram ')))
+        index_list_offset = int(re.search(br'<indexListOffset>(\d+)<', merged).group(1))
+        self.assertTrue(merged[index_list_offset:].startswith(b'<indexList '))
+        checksum_end = merged.index(b'<fileChecksum>') + len(b'<fileChecksum>')
+        self.assertEqual(
+            re.search(br'<fileChecksum>(\w+)<', merged).group(1).decode('ascii'),
+            hashlib.sha1(merged[:checksum_end]).hexdigest())
+        with open(self.path + "-idx.tsv") as handle:
+            merged_index = handle.read()
+        with open(os.path.join(self.tempdir, "single.mzML-idx.tsv")) as handle:
+            self.assertEqual(merged_index, handle.read())
+
+    def test_read_merged(self):
+        bunches = make_bunches(6)
+        merge_mzml_shards(self.write_shards(bunches, 4), self.path, remove_shards=True)
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ["merged.mzML", "merged.mzML-idx.tsv"])
+        reader = ProcessedMzMLDeserializer(self.path)
+        observed = [(b.precursor.id, [p.id for p in b.products]) for b in reader]
+        self.assertEqual(observed, [(b.precursor.id, [p.id for p in b.products]) for b in bunches])
+        scan = reader.get_scan_by_id("scan=7")
+        self.assertEqual(scan.index, 7)
+        self.assertEqual(len(scan.deconvoluted_peak_set), len(bunches[3].products[0].deconvoluted_peak_set))
+        self.assertEqual(
+            [p.product_scan_id for p in reader.msms_for(neutral_mass(603., 2), 1e-5)], ["scan=7"])
+        reader.close()
+
+    def test_empty_shards(self):
+        shard_paths = self.write_shards(make_bunches(2), 4)
+        self.assertEqual(merge_mzml_shards(shard_paths, self.path), 4)
+        self.assertRaises(ValueError, merge_mzml_shards, shard_paths[1:3], self.path)
+
+    def test_schema_version_mismatch(self):
+        shard_paths = self.write_shards(make_bunches(2), 2)
+        index_path = shard_paths[0] + "-idx.tsv"
+        with open(index_path) as handle:
+            lines = handle.read().splitlines(True)
+        lines[0] = lines[0].replace(ExtendedScanIndexWriter.SCHEMA_VERSION, "2.0")
+        with open(index_path, 'w') as handle:
+            handle.writelines(lines)
+        self.assertRaises(ValueError, merge_mzml_shards, shard_paths, self.path)
+
+    def test_duplicate_spectra(self):
+        bunches = make_bunches(2)
+        first = MzMLShardSerializer(self.path, 0, sample_name="test")
+        second = MzMLShardSerializer(self.path, 1, sample_name="test")
+        for writer in (first, second):
+            writer.save_scan_bunch(bunches[0])
+            writer.complete()
+        self.assertRaises(
+            ValueError, merge_mzml_shards,
+            [shard_file_name(self.path, 0), shard_file_name(self.path, 1)], self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ms_deisotope.peak_set import DeconvolutedPeak, DeconvolutedPeakSet, Envelope, EnvelopePair
+from ms_deisotope.averagine import neutral_mass
+from ms_deisotope.data_source.common import (
+    ActivationInformation, PrecursorInformation, ProcessedScan, ScanBunch)
+from ms_deisotope.data_source import binary_codecs
+from ms_deisotope.data_source.binary_codecs import pynumpress
+from ms_deisotope.feature_map import LazyExtendedScanIndex
+from ms_deisotope.test.test_binary_codecs import FakeNumpress
+from ms_deisotope.output.mzml import (
+    MzMLScanSerializer, ProcessedMzMLDeserializer, PeakArrays, describe_spectrum,
+    describe_spectrum_arrays, NUMPRESS_COMPRESSION)
+
+
+def make_peaks():
+    peaks = DeconvolutedPeakSet([
+        DeconvolutedPeak(
+            1998.99, 500., 2, 10., None, 0.1, score=20.,
+            envelope=[EnvelopePair(1000.5, 500.), EnvelopePair(1001.0, 400.)]),
+        DeconvolutedPeak(
+            1197.25, 1500., 1, 10., None, 0.1, score=40.,
+            envelope=[EnvelopePair(1198.25, 1500.), EnvelopePair(1199.25, 600.)]),
+        DeconvolutedPeak(
+            4497.3, 80., 3, 10., None, 0.1, score=5.,
+            envelope=[EnvelopePair(1500.1, 80.)]),
+    ])
+    peaks._reindex()
+    return peaks
+
+
+class TestPeakArrays(unittest.TestCase):
+    def test_from_deconvoluted_peak_set(self):
+        peaks = make_peaks()
+        arrays = PeakArrays.from_peak_set(peaks)
+        self.assertEqual(len(arrays), 3)
+        self.assertEqual(arrays.mz_array.tolist(), [p.mz for p in peaks])
+        self.assertEqual(arrays.charge_array.tolist(), [1, 2, 3])
+        self.assertEqual(arrays.score_array.tolist(), [40., 20., 5.])
+        self.assertTrue(arrays.mz_array.flags['C_CONTIGUOUS'])
+        self.assertIsInstance(arrays.envelopes[0], Envelope)
+
+    def test_describe(self):
+        peaks = make_peaks()
+        expected = describe_spectrum(peaks)
+        observed = PeakArrays.from_peak_set(peaks).describe()
+        self.assertEqual([d['name'] for d in expected], [d['name'] for d in observed])
+        for a, b in zip(expected, observed):
+            self.assertAlmostEqual(a['value'], b['value'])
+
+    def test_describe_empty(self):
+        descriptors = describe_spectrum_arrays(np.array([]), np.array([]))
+        self.assertEqual([d['value'] for d in descriptors], [0, 0, 0])
+        self.assertEqual(len(PeakArrays.from_peak_set([], deconvoluted=False)), 0)
+
+    def test_incomplete_deconvoluted_arrays(self):
+        self.assertRaises(ValueError, PeakArrays, [1000.], [10.], [2], [5.])
+        self.assertRaises(ValueError, PeakArrays, [1000.], [10.], [2, 3], [5.], [[]])
+        self.assertFalse(PeakArrays([1000.], [10.]).is_deconvoluted)
+
+
+class TestPeakArraysInput(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "arrays.mzML")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_write_peak_arrays(self):
+        bunches = make_bunches(2)
+        arrays = PeakArrays(
+            [1000.5, 1198.25], [500., 1500.], [2, 1], [20., 40.],
+            [[EnvelopePair(1000.5, 500.), EnvelopePair(1001.0, 400.)],
+             [EnvelopePair(1198.25, 1500.)]])
+        with open(self.path, 'wb') as handle:
+            writer = MzMLScanSerializer(handle, n_spectra=2, sample_name="test", build_extra_index=False)
+            writer.save_scan_bunch(bunches[0], peak_arrays={"scan=0": arrays})
+            writer.save_scan_bunch(bunches[1])
+            writer.complete()
+        reader = ProcessedMzMLDeserializer(self.path)
+        peaks = reader.get_scan_by_id("scan=0").deconvoluted_peak_set
+        self.assertEqual([p.mz for p in peaks], [1198.25, 1000.5])
+        self.assertEqual([p.charge for p in peaks], [1, 2])
+        self.assertEqual([p.score for p in peaks], [40., 20.])
+        self.assertEqual(list(peaks[1].envelope), [(1000.5, 500.), (1001.0, 400.)])
+        self.assertEqual(len(reader.get_scan_by_id("scan=1").deconvoluted_peak_set), 3)
+        reader.close()
+
+    def test_write_activation(self):
+        precursor = make_bunches(1)[0].precursor
+        pinfo = PrecursorInformation(
+            1000.5, 500., 2, precursor.id, None, neutral_mass(1000.5, 2), 2, 500.,
+            product_scan_id="scan=1")
+        product = ProcessedScan(
+            "scan=1", None, pinfo, 2, 10.5, 1, None, make_peaks(), polarity=1,
+            activation=ActivationInformation("beam-type collision-induced dissociation", 35.))
+        with open(self.path, 'wb') as handle:
+            writer = MzMLScanSerializer(handle, n_spectra=2, sample_name="test", build_extra_index=False)
+            writer.save_scan_bunch(ScanBunch(precursor, [product]))
+            writer.complete()
+        reader = ProcessedMzMLDeserializer(self.path)
+        activation = reader.get_scan_by_id("scan=1").activation
+        self.assertEqual(str(activation.method), "beam-type collision-induced dissociation")
+        self.assertEqual(activation.energy, 35.)
+        reader.close()
+
+    def test_reject_centroid_arrays(self):
+        with open(self.path, 'wb') as handle:
+            writer = MzMLScanSerializer(handle, n_spectra=1, sample_name="test", build_extra_index=False)
+            self.assertRaises(
+                ValueError, writer.save_scan_bunch, make_bunches(1)[0],
+                peak_arrays={"scan=0": PeakArrays([1000.5], [500.])})
+
+
+def make_bunches(n):
+    return [
+        ScanBunch(ProcessedScan(
+            "scan=%d" % i, None, None, 1, 10. + i, i, None, make_peaks(), polarity=1), [])
+        for i in range(n)
+    ]
+
+
+class TestParallelEncoding(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, **kwargs):
+        path = os.path.join(self.tempdir, name)
+        with open(path, 'wb') as handle:
+            writer = MzMLScanSerializer(
+                handle, n_spectra=6, sample_name="test", build_extra_index=False, **kwargs)
+            for bunch in make_bunches(6):
+                writer.save_scan_bunch(bunch)
+            writer.complete()
+        with open(path, 'rb') as handle:
+            return writer, handle.read()
+
+    def strip_volatile(self, content):
+        return re.sub(
+            br'(startTimeStamp|timeStamp)="[^"]*"|name="SampleRun-UUID" value="[^"]*"|'
+            br'<fileChecksum>\w+</fileChecksum>', b'', content)
+
+    def test_matches_inline_encoding(self):
+        _, inline = self.write("inline.mzML")
+        writer, parallel = self.write("parallel.mzML", encoding_pool=3, max_in_flight=2)
+        self.assertIsNone(writer.encoding_pool)
+        self.assertEqual(self.strip_volatile(inline), self.strip_volatile(parallel))
+        ids = re.findall(br'<spectrum [^>]*id="([^"]+)"', parallel)
+        self.assertEqual(ids, [("scan=%d" % i).encode('utf8') for i in range(6)])
+        for offset in re.findall(br'<offset idRef="scan=\d+">(\d+)</offset>', parallel):
+            self.assertTrue(parallel[int(offset):].startswith(b'<spectrum'))
+
+
+class TestArrayCodecs(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def round_trip(self, compression):
+        path = os.path.join(self.tempdir, "codecs.mzML")
+        bunches = make_bunches(3)
+        with open(path, 'wb') as handle:
+            writer = MzMLScanSerializer(
+                handle, n_spectra=3, sample_name="test", build_extra_index=False,
+                compression=compression)
+            for bunch in bunches:
+                writer.save_scan_bunch(bunch)
+            writer.complete()
+        reader = ProcessedMzMLDeserializer(path)
+        scan = reader.get_scan_by_id("scan=1")
+        expected = PeakArrays.from_peak_set(bunches[1].precursor.deconvoluted_peak_set)
+        observed = PeakArrays.from_peak_set(scan.deconvoluted_peak_set)
+        reader.close()
+        with open(path, 'rb') as handle:
+            content = handle.read()
+        return expected, observed, content
+
+    def test_per_array_codecs(self):
+        expected, observed, content = self.round_trip({
+            "m/z array": "none", "intensity array": "zlib"})
+        self.assertIn(b'name="no compression"', content)
+        np.testing.assert_allclose(observed.mz_array, expected.mz_array)
+        np.testing.assert_allclose(observed.intensity_array, expected.intensity_array)
+        self.assertEqual(observed.charge_array.tolist(), expected.charge_array.tolist())
+
+    def test_stubbed_numpress(self):
+        original = binary_codecs.pynumpress
+        binary_codecs.pynumpress = fake = FakeNumpress()
+        try:
+            expected, observed, content = self.round_trip(NUMPRESS_COMPRESSION)
+        finally:
+            binary_codecs.pynumpress = original
+        self.assertIn(b'MS-Numpress linear prediction compression followed by zlib compression', content)
+        self.assertIn(b'MS-Numpress short logged float compression followed by zlib compression', content)
+        self.assertIn("decode_linear", fake.calls)
+        np.testing.assert_array_equal(observed.mz_array, expected.mz_array)
+        np.testing.assert_allclose(observed.intensity_array, expected.intensity_array)
+        self.assertEqual(observed.charge_array.tolist(), expected.charge_array.tolist())
+        self.assertEqual(observed.score_array.tolist(), expected.score_array.tolist())
+
+    @unittest.skipIf(pynumpress is None, "pynumpress is not installed")
+    def test_numpress(self):
+        expected, observed, content = self.round_trip(NUMPRESS_COMPRESSION)
+        self.assertIn(b'followed by zlib compression', content)
+        np.testing.assert_allclose(observed.mz_array, expected.mz_array, rtol=1e-6)
+        np.testing.assert_allclose(observed.intensity_array, expected.intensity_array, rtol=1e-3)
+        self.assertEqual(observed.charge_array.tolist(), expected.charge_array.tolist())
+
+
+class TestExtendedIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_index_written_while_saving(self):
+        path = os.path.join(self.tempdir, "indexed.mzML")
+        with open(path, 'wb') as handle:
+            writer = MzMLScanSerializer(handle, n_spectra=3, sample_name="test")
+            writer.save_scan_bunch(make_bunches(1)[0])
+            writer.indexer.flush()
+            self.assertTrue(os.path.getsize(path + "-idx.tsv") > 0)
+            for bunch in make_bunches(3)[1:]:
+                writer.save_scan_bunch(bunch)
+            writer.complete()
+        reader = ProcessedMzMLDeserializer(path)
+        self.assertIsInstance(reader.extended_index, LazyExtendedScanIndex)
+        self.assertEqual(list(reader.extended_index.ms1_ids), ["scan=0", "scan=1", "scan=2"])
+        self.assertEqual(reader.ms1_scan_times().tolist(), [10., 11., 12.])
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import pickle
 
 import numpy as np
 
@@ -31,9 +32,32 @@ def make_peak_set_test_suite(peak_set_cls, peak_cls):
                 for p in ps.all_peaks_for(xi):
                     assert abs((xi - p.neutral_mass) / p.neutral_mass) < 1e-5
 
+        def test_pickle(self):
+            peak = peak_cls(1000., 100., 2, 10., None, 0.01, envelope=[(501.007, 60.), (501.509, 40.)])
+            dup = pickle.loads(pickle.dumps(peak, -1))
+            self.assertEqual(peak, dup)
+            self.assertEqual(peak.charge, dup.charge)
+            self.assertEqual(list(peak.envelope), list(dup.envelope))
+
     return TestDeconvolutedPeakSet
 
 
+class TestPythonPeakLayout(unittest.TestCase):
+    def test_no_instance_dict(self):
+        from ms_deisotope.peak_set import _DeconvolutedPeak
+        from ms_deisotope.data_source.common import PrecursorInformation
+        from ms_deisotope.processor import PriorityTarget
+
+        peak = _DeconvolutedPeak(1000., 100., 2, 10., None, 0.01)
+        self.assertFalse(hasattr(peak, "__dict__"))
+        pinfo = PrecursorInformation(501.007, 100., 2)
+        self.assertFalse(hasattr(pinfo, "__dict__"))
+        target = PriorityTarget(None, pinfo)
+        self.assertFalse(hasattr(target, "__dict__"))
+        dup = pickle.loads(pickle.dumps(target, -1))
+        self.assertEqual(dup.info.mz, pinfo.mz)
+
+
 try:
     from ms_deisotope._c.peak_set import (
         DeconvolutedPeakSet as CDeconvolutedPeakSet,
@@ -55,5 +79,40 @@ except ImportError:
     TestPythonDeconvolutedPeakSet = make_peak_set_test_suite(_DeconvolutedPeakSet, _DeconvolutedPeak)
 
 
+class TestMergeIsobaricPeaks(unittest.TestCase):
+    def make_peaks(self):
+        from ms_deisotope.peak_set import _DeconvolutedPeak
+        return [
+            _DeconvolutedPeak(1000.0, 10., 2, 1., None, 0),
+            _DeconvolutedPeak(1200.0, 5., 2, 1., None, 0),
+            _DeconvolutedPeak(1000.0, 30., 2, 1., None, 0),
+            _DeconvolutedPeak(1000.0, 7., 3, 1., None, 0),
+            _DeconvolutedPeak(1000.005, 20., 2, 1., None, 0),
+        ]
+
+    def test_exact(self):
+        from ms_deisotope.peak_set import merge_isobaric_peaks
+        merged = merge_isobaric_peaks(self.make_peaks())
+        self.assertEqual(len(merged), 4)
+        masses = [p.neutral_mass for p in merged]
+        self.assertEqual(masses, sorted(masses))
+        self.assertAlmostEqual(sum(p.intensity for p in merged), 72.)
+        self.assertEqual(
+            [p.intensity for p in merged if p.neutral_mass == 1000.0 and p.charge == 2], [40.])
+
+    def test_tolerance(self):
+        from ms_deisotope.peak_set import merge_isobaric_peaks
+        merged = merge_isobaric_peaks(self.make_peaks(), 1e-5)
+        self.assertEqual(len(merged), 3)
+        by_charge = {(round(p.neutral_mass), p.charge): p for p in merged}
+        self.assertAlmostEqual(by_charge[1000, 2].intensity, 60.)
+        self.assertEqual(by_charge[1000, 2].neutral_mass, 1000.0)
+        self.assertAlmostEqual(by_charge[1000, 3].intensity, 7.)
+
+    def test_empty(self):
+        from ms_deisotope.peak_set import merge_isobaric_peaks
+        self.assertEqual(merge_isobaric_peaks([]), [])
+
+
 if __name__ == '__main__':
     unittest.main()
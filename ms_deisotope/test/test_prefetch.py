@@ -0,0 +1,93 @@
+import time
+import unittest
+
+import numpy as np
+
+from ms_deisotope.data_source import MzMLLoader, ScanPrefetcher
+from ms_deisotope.test.common import datafile
+
+
+class _SlowSource(object):
+    def __init__(self, n, fail_at=None):
+        self.n = n
+        self.i = 0
+        self.fail_at = fail_at
+        self.closed = False
+
+    def __next__(self):
+        if self.i == self.fail_at:
+            raise ValueError("bad scan %d" % self.i)
+        if self.i >= self.n:
+            raise StopIteration()
+        self.i += 1
+        return self.i
+
+    next = __next__
+
+    def close(self):
+        self.closed = True
+
+
+class TestScanPrefetcher(unittest.TestCase):
+    path = datafile("has_missing_charge_state_info.mzML")
+
+    def test_iteration_matches_reader(self):
+        expected = [(b.precursor.id, [p.id for p in b.products]) for b in MzMLLoader(self.path)]
+        with ScanPrefetcher(MzMLLoader(self.path), 2) as reader:
+            observed = [(b.precursor.id, [p.id for p in b.products]) for b in reader]
+            self.assertEqual(expected, observed)
+            self.assertFalse(reader.is_running)
+
+    def test_random_access(self):
+        reader = ScanPrefetcher(MzMLLoader(self.path), 1)
+        bunch = next(reader)
+        scan = reader.get_scan_by_index(2)
+        self.assertEqual(scan.index, 2)
+        self.assertEqual(reader.find_previous_ms1(2).index, 0)
+        reader.start_from_scan(index=2)
+        self.assertEqual(next(reader).precursor.id, scan.id)
+        self.assertNotEqual(bunch.precursor.id, scan.id)
+        reader.close()
+
+    def test_back_pressure(self):
+        source = _SlowSource(10)
+        reader = ScanPrefetcher(source, 3)
+        self.assertEqual(next(reader), 1)
+        time.sleep(0.2)
+        # One item consumed, at most `buffer_size` queued and one more held
+        # by the reading thread while it waits for space.
+        self.assertLessEqual(source.i, 5)
+        reader.close()
+        self.assertFalse(reader.is_running)
+        self.assertTrue(source.closed)
+
+    def test_error_propagation(self):
+        reader = ScanPrefetcher(_SlowSource(10, fail_at=3), 2)
+        self.assertEqual([next(reader), next(reader), next(reader)], [1, 2, 3])
+        with self.assertRaises(ValueError):
+            next(reader)
+        with self.assertRaises(StopIteration):
+            next(reader)
+
+    def test_scans_bound_to_prefetcher(self):
+        reader = ScanPrefetcher(MzMLLoader(self.path), 2)
+        bunch = next(reader)
+        self.assertIs(bunch.precursor.source, reader)
+        for product in bunch.products:
+            self.assertIs(product.source, reader)
+            self.assertIs(product.precursor_information.source, reader)
+            self.assertEqual(product.precursor_information.precursor.id, bunch.precursor.id)
+        self.assertIs(reader.get_scan_by_index(1).source, reader)
+        reader.close()
+
+    def test_arrays_decoded_ahead(self):
+        reader = ScanPrefetcher(MzMLLoader(self.path), 2)
+        bunch = next(reader)
+        for scan in [bunch.precursor] + list(bunch.products):
+            self.assertIsInstance(scan._data['m/z array'], np.ndarray)
+            self.assertIsInstance(scan._data['intensity array'], np.ndarray)
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
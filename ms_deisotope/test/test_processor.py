@@ -31,6 +31,18 @@ class TestScanProcessor(unittest.TestCase):
             self.assertIsNotNone(scan_bunch.precursor)
             self.assertIsNotNone(scan_bunch.products)
 
+    def test_profiled_processor(self):
+        proc = processor.ScanProcessor(self.mzml_path, ms1_deconvolution_args={
+            "averagine": glycopeptide,
+            "scorer": PenalizedMSDeconVFitter(5., 2.)
+        }, profile=True)
+        n_products = 0
+        for scan_bunch in iter(proc):
+            n_products += len(scan_bunch.products)
+        self.assertEqual(proc.profile.counters['spectra'], n_products + 1)
+        self.assertIn("ms1_peak_picking", proc.profile.timings)
+        self.assertIn("populate_graph", proc.profile.timings)
+
     def test_missing_charge_processing(self):
         proc = processor.ScanProcessor(self.missing_charge_mzml, ms1_deconvolution_args={
             "averagine": glycopeptide,
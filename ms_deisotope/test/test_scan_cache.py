@@ -0,0 +1,63 @@
+import gc
+import unittest
+
+from ms_deisotope.data_source import MzMLLoader, LRUScanCache, WeakScanCache
+from ms_deisotope.data_source.scan_cache import estimate_scan_size
+from ms_deisotope.test.common import datafile
+
+
+scan_ids = [
+    "controllerType=0 controllerNumber=1 scan=10014",
+    "controllerType=0 controllerNumber=1 scan=10015",
+    "controllerType=0 controllerNumber=1 scan=10016"
+]
+
+
+class TestScanCache(unittest.TestCase):
+    path = datafile("three_test_scans.mzML")
+
+    def test_weak_cache(self):
+        reader = MzMLLoader(self.path, scan_cache=WeakScanCache())
+        scan = reader.get_scan_by_id(scan_ids[1])
+        self.assertIs(reader.get_scan_by_id(scan_ids[1]), scan)
+        self.assertEqual(reader.scan_cache.hits, 1)
+        self.assertEqual(reader.scan_cache.misses, 1)
+        del scan
+        gc.collect()
+        self.assertNotIn(scan_ids[1], reader.scan_cache)
+        reader.close()
+
+    def test_lru_scan_count(self):
+        reader = MzMLLoader(self.path, scan_cache=2)
+        cache = reader.scan_cache
+        self.assertIsInstance(cache, LRUScanCache)
+        reader.get_scan_by_id(scan_ids[0])
+        reader.get_scan_by_id(scan_ids[1])
+        gc.collect()
+        self.assertEqual(cache.strong_count, 2)
+        reader.get_scan_by_id(scan_ids[0])
+        self.assertEqual(cache.hits, 1)
+        reader.get_scan_by_id(scan_ids[2])
+        gc.collect()
+        self.assertEqual(cache.evictions, 1)
+        self.assertIn(scan_ids[0], cache)
+        self.assertNotIn(scan_ids[1], cache)
+        reader.close()
+
+    def test_lru_byte_budget(self):
+        reader = MzMLLoader(self.path, decode_binary=True)
+        sizes = [estimate_scan_size(reader.get_scan_by_id(i)) for i in scan_ids]
+        reader.close()
+        cache = LRUScanCache(max_bytes=sizes[0] + sizes[1])
+        reader = MzMLLoader(self.path, decode_binary=True, scan_cache=cache)
+        for scan_id in scan_ids:
+            reader.get_scan_by_id(scan_id)
+        self.assertLessEqual(cache.current_bytes, cache.max_bytes)
+        self.assertGreater(cache.evictions, 0)
+        cache.clear()
+        self.assertEqual(cache.current_bytes, 0)
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ms_deisotope.averagine import neutral_mass
+from ms_deisotope.feature_map import ExtendedScanIndex, ExtendedScanIndexWriter, LazyExtendedScanIndex
+from ms_deisotope.test.common import make_scan_bunches
+
+
+def make_bunches(n, products_per_bunch=3):
+    return make_scan_bunches(
+        n, products_per_bunch, precursor_mz=lambda i, j: 1500. - 100. * j + i, product_time_step=0.1)
+
+
+class TestStreamingScanIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, ExtendedScanIndexWriter.index_file_name("test.mzML"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, bunches):
+        reference = ExtendedScanIndex()
+        writer = ExtendedScanIndexWriter(open(self.path, 'w'))
+        for bunch in bunches:
+            reference.add_scan_bunch(bunch)
+            writer.add_scan_bunch(bunch)
+        writer.close()
+        return reference
+
+    def test_round_trip(self):
+        reference = self.write(make_bunches(4))
+        index = LazyExtendedScanIndex(self.path)
+        self.assertEqual(index.schema_version, ExtendedScanIndexWriter.SCHEMA_VERSION)
+        self.assertEqual(list(index.ms1_ids), list(reference.ms1_ids))
+        self.assertEqual(list(index.msn_ids), list(reference.msn_ids))
+        for key in reference.ms1_ids:
+            self.assertEqual(index[key], reference[key])
+        for key in reference.msn_ids:
+            self.assertEqual(index[key], reference[key])
+        self.assertEqual(index.scan_times(), reference.scan_times())
+        mass_index = index.precursor_mass_index()
+        self.assertEqual(len(mass_index), 12)
+        self.assertTrue(all(mass_index.neutral_mass[:-1] <= mass_index.neutral_mass[1:]))
+        expected = reference.precursor_mass_index()
+        self.assertEqual(mass_index.scan_ids, expected.scan_ids)
+        self.assertEqual(mass_index.scan_time.tolist(), expected.scan_time.tolist())
+        self.assertEqual(mass_index.charge.tolist(), [2] * 12)
+        index.close()
+
+    def test_find_msms_by_precursor_mass(self):
+        reference = self.write(make_bunches(4))
+        index = LazyExtendedScanIndex(self.path)
+        for mass in (neutral_mass(1302., 2), neutral_mass(1500., 2), 1000.):
+            expected = reference.find_msms_by_precursor_mass(mass, 2e-5)
+            observed = index.find_msms_by_precursor_mass(mass, 2e-5)
+            self.assertEqual(
+                sorted(p.product_scan_id for p in observed),
+                sorted(p.product_scan_id for p in expected))
+        self.assertEqual(len(index.find_msms_by_precursor_mass(neutral_mass(1302., 2), 1e-3)), 3)
+        index.close()
+
+    def test_time_filter(self):
+        reference = self.write(make_bunches(4))
+        index = LazyExtendedScanIndex(self.path)
+        mass = neutral_mass(1401.5, 2)
+        for source in (reference, index):
+            matches = source.find_msms_by_precursor_mass(mass, 2e-3)
+            self.assertEqual([p.product_scan_id for p in matches],
+                             ["scan=2", "scan=6", "scan=10", "scan=14"])
+            matches = source.find_msms_by_precursor_mass(mass, 2e-3, start_time=1.0, end_time=2.5)
+            self.assertEqual([p.product_scan_id for p in matches], ["scan=6", "scan=10"])
+        index.close()
+
+    def test_cached_mass_index(self):
+        reference = ExtendedScanIndex()
+        bunches = make_bunches(2)
+        reference.add_scan_bunch(bunches[0])
+        mass_index = reference.precursor_mass_index()
+        self.assertIs(reference.precursor_mass_index(), mass_index)
+        reference.add_scan_bunch(bunches[1])
+        self.assertEqual(len(reference.precursor_mass_index()), 6)
+
+    def test_truncated_file(self):
+        self.write(make_bunches(2))
+        with open(self.path, 'ab') as handle:
+            handle.write(b"msn\tscan=100\t4.0\t1200.0\t2\t{\"neutral")
+        index = LazyExtendedScanIndex(self.path)
+        self.assertEqual(len(index.msn_ids), 6)
+        self.assertNotIn("scan=100", index.msn_ids)
+        index.close()
+
+    def test_schema_2_0(self):
+        reference = self.write(make_bunches(2))
+        # Version 2.0 files lack the charge column
+        with open(self.path) as handle:
+            lines = handle.read().splitlines(True)
+        with open(self.path, 'w') as handle:
+            handle.write("%s\t2.0\n" % ExtendedScanIndexWriter.FORMAT_MARKER)
+            for line in lines[1:]:
+                fields = line.split('\t')
+                handle.write('\t'.join(fields[:4] + fields[5:]))
+        index = LazyExtendedScanIndex(self.path)
+        self.assertEqual(index.schema_version, "2.0")
+        self.assertEqual(index.precursor_mass_index().charge.tolist(), [2] * 6)
+        for key in reference.msn_ids:
+            self.assertEqual(index[key], reference[key])
+        index.close()
+
+    def test_unknown_schema_version(self):
+        with open(self.path, 'w') as handle:
+            handle.write("%s\t9.0\n" % ExtendedScanIndexWriter.FORMAT_MARKER)
+        self.assertRaises(ValueError, LazyExtendedScanIndex, self.path)
+
+    def test_not_an_index(self):
+        with open(self.path, 'w') as handle:
+            handle.write('{"ms1_ids": []}')
+        self.assertRaises(ValueError, LazyExtendedScanIndex, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
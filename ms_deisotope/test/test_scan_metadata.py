@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ms_deisotope.data_source import MzMLLoader, MzXMLLoader, MGFLoader, convert_to_spectrum_store
+from ms_deisotope.data_source.common import RandomAccessScanSource
+from ms_deisotope.data_source.spectrum_store import SpectrumStoreLoader
+from ms_deisotope.data_source.scan_metadata import scan_metadata_table_path, load_scan_metadata_table
+from ms_deisotope.test.common import datafile
+
+
+class TestScanMetadataTable(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def copy(self, name):
+        path = os.path.join(self.tempdir, name)
+        shutil.copy(datafile(name), path)
+        return path
+
+    def assert_tables_match(self, fast, generic, columns):
+        self.assertEqual(list(fast['id']), list(generic['id']))
+        for name in columns:
+            np.testing.assert_allclose(fast[name], generic[name], err_msg=name)
+
+    def test_mzml_header_table(self):
+        reader = MzMLLoader(datafile("three_test_scans.mzML"))
+        table = reader.scan_metadata_table(cache=False)
+        generic = RandomAccessScanSource._build_scan_metadata_table(reader)
+        self.assert_tables_match(table, generic, [
+            'index', 'scan_time', 'ms_level', 'polarity', 'precursor_mz', 'precursor_charge',
+            'isolation_window_lower', 'isolation_window_target', 'isolation_window_upper',
+            'activation_energy'])
+        # The total ion current and base peak are read from the file, not the arrays
+        self.assertAlmostEqual(table['tic'][0], 4.661058e09)
+        self.assertAlmostEqual(table['base_peak_mz'][1], 646.3146899)
+        reader.close()
+
+    def test_unreadable_scans_keep_rows(self):
+        reader = MzMLLoader(datafile("three_test_scans.mzML"))
+        parse_scan_metadata = reader._parse_scan_metadata
+        headers = []
+
+        def skip_first(header):
+            headers.append(header)
+            return None if len(headers) == 1 else parse_scan_metadata(header)
+
+        reader._parse_scan_metadata = skip_first
+        table = reader.scan_metadata_table(cache=False)
+        self.assertEqual(table['index'].tolist(), [0, 1, 2, 3])
+        self.assertEqual(table['ms_level'].tolist(), [0, 2, 2, 0])
+        self.assertTrue(np.isnan(table['scan_time'][0]))
+        index = reader.ms_level_time_index
+        self.assertEqual(index.ms_levels.tolist(), [0, 2, 2, 0])
+        self.assertAlmostEqual(index.scan_times[1], 22.132753, 5)
+        self.assertEqual(reader.get_scan_by_time(22.134031).index, 2)
+        reader.close()
+
+    def test_generic_table_unreadable_scan(self):
+        reader = MGFLoader(datafile("small.mgf"))
+        get_scan_by_index = reader.get_scan_by_index
+
+        def fail_second(i):
+            if i == 1:
+                raise KeyError(i)
+            return get_scan_by_index(i)
+
+        reader.get_scan_by_index = fail_second
+        table = reader.scan_metadata_table(cache=False)
+        self.assertEqual(table['index'].tolist(), list(range(6)))
+        self.assertEqual(table['id'][1], 'test.101.101.3')
+        self.assertEqual(table['ms_level'][1], 0)
+        self.assertEqual(table['precursor_charge'][2], 2)
+        reader.close()
+
+    def test_mzxml_header_table(self):
+        reader = MzXMLLoader(datafile("microscans.mzXML"))
+        table = reader.scan_metadata_table(cache=False)
+        self.assertEqual(list(table['id']), ['210', '211', '212', '213'])
+        self.assertTrue(np.all(table['ms_level'] == 1))
+        self.assertAlmostEqual(table['tic'][1], 1.3243555e07)
+        self.assertAlmostEqual(table['scan_time'][0], reader.get_scan_by_id('210').scan_time)
+        reader.close()
+
+    def test_generic_table(self):
+        reader = MGFLoader(datafile("small.mgf"))
+        table = reader.scan_metadata_table(cache=False)
+        self.assertEqual(len(table), 6)
+        self.assertEqual(table['precursor_charge'][1], 3)
+        scan = reader.get_scan_by_index(2)
+        self.assertAlmostEqual(table['tic'][2], scan.arrays.intensity.sum())
+        reader.close()
+
+    def test_spectrum_store_table(self):
+        reader = MzMLLoader(datafile("three_test_scans.mzML"))
+        path = os.path.join(self.tempdir, "three_test_scans.msds")
+        convert_to_spectrum_store(reader, path)
+        reader.close()
+        store = SpectrumStoreLoader(path)
+        table = store.scan_metadata_table(cache=False)
+        generic = RandomAccessScanSource._build_scan_metadata_table(store)
+        self.assert_tables_match(table, generic, [
+            'index', 'scan_time', 'ms_level', 'tic', 'base_peak_mz', 'precursor_mz',
+            'precursor_charge', 'isolation_window_target'])
+        store.close()
+
+    def test_cached_table(self):
+        path = self.copy("three_test_scans.mzML")
+        reader = MzMLLoader(path)
+        table = reader.scan_metadata_table()
+        reader.close()
+        self.assertTrue(os.path.exists(scan_metadata_table_path(path)))
+        reader = MzMLLoader(path)
+        reader._build_scan_metadata_table = None
+        cached = reader.scan_metadata_table()
+        self.assert_tables_match(cached, table, ['scan_time', 'ms_level', 'tic'])
+        self.assertEqual(reader.ms_level_time_index.find_previous_ms1(2), 0)
+        reader.close()
+        # A changed source file invalidates the cached table
+        with open(path, 'ab') as fh:
+            fh.write(b"\n")
+        self.assertIsNone(load_scan_metadata_table(path))
+        reader = MzMLLoader(path)
+        self.assertIsNotNone(reader.scan_metadata_table())
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
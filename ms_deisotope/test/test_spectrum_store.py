@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ms_deisotope.data_source import MzMLLoader, infer_type
+from ms_deisotope.data_source.spectrum_store import (
+    SpectrumStoreLoader, convert_to_spectrum_store)
+from ms_deisotope.test.common import datafile
+
+
+class TestSpectrumStore(unittest.TestCase):
+    path = datafile("three_test_scans.mzML")
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.tmpdir, "three_test_scans.msds")
+        self.store = convert_to_spectrum_store(MzMLLoader(self.path), self.store_path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        reader = MzMLLoader(self.path)
+        reader.make_iterator(grouped=False)
+        self.store.make_iterator(grouped=False)
+        for expected, observed in zip(reader, self.store):
+            self.assertEqual(expected.id, observed.id)
+            self.assertEqual(expected.index, observed.index)
+            self.assertEqual(expected.ms_level, observed.ms_level)
+            self.assertAlmostEqual(expected.scan_time, observed.scan_time)
+            self.assertEqual(expected.is_profile, observed.is_profile)
+            self.assertEqual(expected.polarity, observed.polarity)
+            self.assertTrue(np.all(expected.arrays.mz == observed.arrays.mz))
+            self.assertTrue(np.all(expected.arrays.intensity == observed.arrays.intensity))
+            if expected.precursor_information is None:
+                self.assertIsNone(observed.precursor_information)
+                continue
+            self.assertAlmostEqual(expected.precursor_information.mz, observed.precursor_information.mz)
+            self.assertEqual(expected.precursor_information.charge, observed.precursor_information.charge)
+            self.assertEqual(
+                expected.precursor_information.precursor_scan_id,
+                observed.precursor_information.precursor_scan_id)
+            self.assertEqual(expected.isolation_window, observed.isolation_window)
+            self.assertEqual(expected.activation.method, observed.activation.method)
+            self.assertEqual(expected.activation.energy, observed.activation.energy)
+        reader.close()
+
+    def test_random_access(self):
+        store = SpectrumStoreLoader(self.store_path)
+        bunch = next(store)
+        self.assertEqual(bunch.precursor.index, 0)
+        self.assertEqual(len(bunch.products), 2)
+        scan = store.get_scan_by_index(2)
+        self.assertIs(store.get_scan_by_id(scan.id), scan)
+        self.assertEqual(store.find_previous_ms1(2).index, 0)
+        self.assertEqual(store.get_scan_by_time(scan.scan_time).index, 2)
+        store.start_from_scan(scan.id)
+        self.assertEqual(next(store).precursor.index, 0)
+        store.close()
+
+    def test_infer_type(self):
+        reader = infer_type.MSFileLoader(self.store_path)
+        self.assertIsInstance(reader, SpectrumStoreLoader)
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from ms_deisotope.peak_set import Envelope, EnvelopePair
+from ms_deisotope.output import text_utils
+
+
+envelopes = [
+    Envelope([EnvelopePair(1000.5, 500.), EnvelopePair(1001.00335, 400.), EnvelopePair(1001.5067, 120.)]),
+    Envelope([EnvelopePair(1200.25, 80.), EnvelopePair(1200.5, 100.)]),
+    Envelope([EnvelopePair(1500.1, 1e6), EnvelopePair(1501.10335, 6e5), EnvelopePair(1502.1067, 2e5),
+              EnvelopePair(1503.11, 5e4)]),
+]
+mz_array = np.array([1000.5, 1200.25, 1500.1])
+
+
+class TestEnvelopeEncoding(unittest.TestCase):
+    def test_zero_separated_round_trip(self):
+        array = text_utils.envelopes_to_array(envelopes)
+        decoded = text_utils.decode_envelopes(array)
+        self.assertEqual(len(decoded), len(envelopes))
+        for a, b in zip(envelopes, decoded):
+            self.assertEqual(len(a), len(b))
+
+    def test_compact_round_trip(self):
+        array = text_utils.envelopes_to_compact_array(envelopes, mz_array)
+        self.assertEqual(len(array), 1 + 2 * len(envelopes) + 2 * 9)
+        decoded = text_utils.decode_compact_envelopes(array, mz_array)
+        self.assertEqual(len(decoded), len(envelopes))
+        for a, b in zip(envelopes, decoded):
+            self.assertEqual(len(a), len(b))
+            for pa, pb in zip(a, b):
+                self.assertAlmostEqual(pa.mz, pb.mz, 4)
+                self.assertAlmostEqual(pa.intensity / pb.intensity, 1.0, 3)
+
+    def test_compact_arrays(self):
+        array = text_utils.envelopes_to_compact_array(envelopes, mz_array)
+        offsets, mzs, intensities = text_utils.decode_compact_envelope_arrays(array, mz_array)
+        self.assertEqual(offsets.tolist(), [0, 3, 5, 9])
+        self.assertAlmostEqual(mzs[3], 1200.25, 4)
+        self.assertAlmostEqual(intensities[5], 1e6, 0)
+
+    def test_compact_empty(self):
+        array = text_utils.envelopes_to_compact_array([], [])
+        self.assertEqual(text_utils.decode_compact_envelopes(array, []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
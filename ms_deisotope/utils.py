@@ -112,21 +112,22 @@ def simple_repr(self):  # pragma: no cover
         else:
             return str(v)
 
-    if not hasattr(self, "__slots__"):
-        d = [
-            "%s=%s" % (k, formatvalue(v)) if v is not self else "(...)" for k, v in sorted(
-                self.__dict__.items(), key=lambda x: x[0])
-            if (not k.startswith("_") and not callable(v)) and not (v is None)]
-    else:
-        d = [
-            "%s=%s" % (k, formatvalue(v)) if v is not self else "(...)" for k, v in sorted(
-                [(name, getattr(self, name)) for name in self.__slots__], key=lambda x: x[0])
-            if (not k.startswith("_") and not callable(v)) and not (v is None)]
+    fields = {}
+    for cls in reversed(self.__class__.__mro__):
+        for name in cls.__dict__.get("__slots__", ()):
+            if name not in fields:
+                fields[name] = getattr(self, name, None)
+    fields.update(getattr(self, "__dict__", {}))
+    d = [
+        "%s=%s" % (k, formatvalue(v)) if v is not self else "(...)" for k, v in sorted(
+            fields.items(), key=lambda x: x[0])
+        if (not k.startswith("_") and not callable(v)) and not (v is None)]
 
     return template.format(self=self, d=', '.join(d))
 
 
 class Base(object):
+    __slots__ = ()
     __repr__ = simple_repr
 
 
@@ -160,11 +161,12 @@ class Constant(object):
 
 
 class DeconvolutionProcessResult(object):
-    def __init__(self, deconvoluter, peak_set, priorities, errors=None):
+    def __init__(self, deconvoluter, peak_set, priorities, errors=None, profile=None):
         self.deconvoluter = deconvoluter
         self.peak_set = peak_set
         self.priorities = priorities
         self.errors = errors
+        self.profile = profile
 
     def __getitem__(self, i):
         if i == 0: